@@ -1,10 +1,17 @@
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sshtunnel import SSHTunnelForwarder
 from dotenv import load_dotenv
 
+from app.services.tunel_ssh import GestorTuneles
+
 load_dotenv()
 
 
@@ -16,26 +23,91 @@ DB_USER = os.getenv("DB_USER")
 DB_PASS = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 
+# Réplica de solo lectura para reportes/dashboard/datos (opcional; DATABASE_REPLICA_URL se acepta como alias)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or os.getenv("DATABASE_REPLICA_URL")
+# Si la réplica falla, cuánto tiempo se lee del primario antes de volver a intentarla
+REPLICA_REINTENTO_SEGUNDOS = float(os.getenv("DATABASE_READ_RETRY", 30))
+
+# Pool: FastAPI atiende hasta 40 peticiones síncronas a la vez (threadpool de AnyIO)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 30))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+# Driver para el motor async de los endpoints de lectura (dashboard/reportes/datos)
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql")
+# Pool propio del motor async: se suma al síncrono en el mismo servidor (max_connections), y las
+# corrutinas no están limitadas por el threadpool, así que el tope va aparte y más chico
+ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", 5))
+ASYNC_POOL_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_POOL_MAX_OVERFLOW", 10))
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que lleva la cuenta de cuánto esperan las peticiones por una conexión."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.esperas = {"checkouts": 0, "espera_total_ms": 0.0, "espera_max_ms": 0.0, "timeouts": 0}
+        self._lock_esperas = threading.Lock()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._lock_esperas:
+                self.esperas["timeouts"] += 1
+            raise
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            with self._lock_esperas:
+                self.esperas["checkouts"] += 1
+                self.esperas["espera_total_ms"] += ms
+                self.esperas["espera_max_ms"] = max(self.esperas["espera_max_ms"], ms)
+
+    def recreate(self):
+        nuevo = super().recreate()
+        nuevo.esperas = self.esperas
+        return nuevo
+
+
+def _crear_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=PoolMedido,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+def _crear_engine_async(url: str):
+    """Mismo servidor que el motor síncrono, con driver asyncio (mysql+aiomysql) y su propio pool."""
+    url_async = make_url(url).set(drivername=f"mysql+{DB_ASYNC_DRIVER}")
+    return create_async_engine(
+        url_async,
+        pool_size=ASYNC_POOL_SIZE,
+        max_overflow=ASYNC_POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
 print("🔌 Inicializando sistema de base de datos...")
 
-# Variable global para mantener el túnel vivo
+# Gestor de túneles (se revisa y se reconecta solo)
 tunnel_server = None
 engine = None
+async_engine = None
 
 try:
     if SSH_HOST and SSH_USER and SSH_PASS:
         print(f"Iniciando Túnel SSH hacia {SSH_HOST}...")
-        tunnel_server = SSHTunnelForwarder(
-            (SSH_HOST, 22),
-            ssh_username=SSH_USER,
-            ssh_password=SSH_PASS,
-            remote_bind_address=('127.0.0.1', 3306)
-        )
-        tunnel_server.start()
-        print(f"✅ Túnel establecido en puerto local: {tunnel_server.local_bind_port}")
+        tunnel_server = GestorTuneles(SSH_HOST, SSH_USER, SSH_PASS)
+        tunnel_server.iniciar()
         
-        # Conectamos a localhost (puerto del túnel)
-        db_port = tunnel_server.local_bind_port
+        # Conectamos a localhost; el puerto real lo elige el gestor en cada conexión nueva
+        db_port = tunnel_server.puerto()
         db_host = "127.0.0.1"
     else:
         # Fallback por si no usas túnel (ej. local directo)
@@ -45,12 +117,21 @@ try:
 
     SQLALCHEMY_DATABASE_URL = f"mysql+mysqlconnector://{DB_USER}:{DB_PASS}@{db_host}:{db_port}/{DB_NAME}"
 
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        pool_recycle=3600,
-        pool_pre_ping=True
-    )
-    print("Motor SQL iniciado correctamente.")
+    engine = _crear_engine(SQLALCHEMY_DATABASE_URL)
+    async_engine = _crear_engine_async(SQLALCHEMY_DATABASE_URL)
+
+    if tunnel_server:
+        @event.listens_for(engine, "do_connect")
+        def _puerto_tunel(dialect, conn_rec, cargs, cparams):
+            # Túnel vivo (o recién restablecido) para cada conexión física nueva
+            cparams["port"] = tunnel_server.puerto()
+
+        @event.listens_for(async_engine.sync_engine, "do_connect")
+        def _puerto_tunel_async(dialect, conn_rec, cargs, cparams):
+            # Corre dentro del event loop: sin reconectar aquí, eso lo hace el monitor del gestor
+            cparams["port"] = tunnel_server.puerto_actual()
+
+    print(f"Motor SQL iniciado correctamente (pool {POOL_SIZE}+{POOL_MAX_OVERFLOW}, async {ASYNC_POOL_SIZE}+{ASYNC_POOL_MAX_OVERFLOW}, timeout {POOL_TIMEOUT:.0f}s).")
 
 except Exception as e:
     print(f"Error CRÍTICO en base de datos: {e}")
@@ -59,9 +140,120 @@ except Exception as e:
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# --- RÉPLICA DE LECTURA ---
+read_engine = None
+async_read_engine = None
+if DATABASE_READ_URL:
+    try:
+        read_engine = _crear_engine(DATABASE_READ_URL)
+        async_read_engine = _crear_engine_async(DATABASE_READ_URL)
+        print("📖 Motor de lectura (réplica) configurado.")
+    except Exception as e:
+        print(f"⚠️ No se pudo configurar la réplica, todo se lee del primario: {e}")
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else SessionLocal
+AsyncReadSessionLocal = (
+    async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if async_read_engine else AsyncSessionLocal
+)
+_replica = {"caida_hasta": 0.0}
+
+def _replica_disponible() -> bool:
+    return read_engine is not None and time.monotonic() >= _replica["caida_hasta"]
+
+def _marcar_replica_caida(e: Exception):
+    _replica["caida_hasta"] = time.monotonic() + REPLICA_REINTENTO_SEGUNDOS
+    print(f"⚠️ Réplica de lectura no disponible, se usa el primario por {REPLICA_REINTENTO_SEGUNDOS:.0f}s: {e}")
+
+def lee_de_replica(db) -> bool:
+    """
+    True si la sesión quedó sobre la réplica. Lo que se lea ahí puede ir atrasado respecto a
+    generacion_datos() (que sale del primario), así que no se guarda en los caches.
+    """
+    return read_engine is not None and db.bind in (read_engine, async_read_engine)
+
+def conectar_lectura():
+    """Conexión para lecturas largas (streaming/exportaciones): réplica si responde, si no el primario."""
+    if _replica_disponible():
+        try:
+            return read_engine.connect()
+        except Exception as e:
+            _marcar_replica_caida(e)
+    return engine.connect()
+
+def _estado_pool(motor, max_overflow: int = POOL_MAX_OVERFLOW) -> dict:
+    pool = motor.pool
+    estado = {
+        "tamanio": pool.size(),
+        "en_uso": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": max_overflow,
+        "timeout_s": POOL_TIMEOUT,
+    }
+    esperas = dict(getattr(pool, "esperas", {}))
+    if esperas.get("checkouts"):
+        esperas["espera_promedio_ms"] = round(esperas["espera_total_ms"] / esperas["checkouts"], 2)
+    estado.update({k: round(v, 2) if isinstance(v, float) else v for k, v in esperas.items()})
+    return estado
+
+def estado_conexiones() -> dict:
+    """Pool (primario y réplica) y túneles SSH, para /v1/debug/db."""
+    return {
+        "primario": _estado_pool(engine),
+        "replica": _estado_pool(read_engine) if read_engine is not None else None,
+        "primario_async": _estado_pool(async_engine.sync_engine, ASYNC_POOL_MAX_OVERFLOW),
+        "replica_async": _estado_pool(async_read_engine.sync_engine, ASYNC_POOL_MAX_OVERFLOW) if async_read_engine is not None else None,
+        "replica_en_pausa": read_engine is not None and not _replica_disponible(),
+        "tunel_ssh": tunnel_server.estado() if tunnel_server else None,
+    }
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """
+    Sesión para routers de solo lectura. Usa la réplica (DATABASE_READ_URL) si está configurada;
+    si no responde al abrir la conexión, cae al primario y no la vuelve a intentar por un rato.
+    """
+    db = None
+    if _replica_disponible():
+        db = ReadSessionLocal()
+        try:
+            db.connection()  # checkout con pre_ping: aquí se nota si la réplica está caída
+        except Exception as e:
+            db.close()
+            _marcar_replica_caida(e)
+            db = None
+    if db is None:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """
+    Igual que get_read_db pero con AsyncSession: el endpoint espera a MySQL sin ocupar
+    un hilo del threadpool. Réplica si responde, si no el primario.
+    """
+    db = None
+    if async_read_engine is not None and _replica_disponible():
+        db = AsyncReadSessionLocal()
+        try:
+            await db.connection()
+        except Exception as e:
+            await db.close()
+            _marcar_replica_caida(e)
+            db = None
+    if db is None:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -8,10 +8,17 @@ from dotenv import load_dotenv
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from .routers.notificacionesMS import NotificationUseCase, FirebaseRepository, NotificationGateway
-from .database import SessionLocal 
+from .database import SessionLocal, engine
 import logging
+from datetime import datetime
 from zoneinfo import ZoneInfo
 from .services.sync_service import AutoSyncManager
+from .services.tablas_calculadas import construir_cartera_resumen
+from .services.respuestas import RespuestaORJSON
+from .services.perfil_sql import PerfiladorSQL
+from .services.metricas import MedidorHTTP
+from .services.leader_election import LeaderElector, LEASE_RENOVACION_SEGUNDOS
+from .services.scheduler_control import JOB_ID_BARRIDO, registrar_scheduler, reprogramar_barrido, escuchar_config_recordatorios
 
 
 logging.basicConfig(level=logging.INFO)
@@ -19,8 +26,10 @@ logger = logging.getLogger(__name__)
 
 
 load_dotenv()
-JOB_ID_BARRIDO = "barrido_automatico_diario"
 APP_MODE = os.getenv("APP_MODE", "FULL")
+scheduler_global = None
+elector = None
+config_watch = None
 
 from .routers import (
     login, 
@@ -36,7 +45,9 @@ from .routers import (
     remitentes,
     admin,
     Cobranza,
-    debug_config
+    debug_config,
+    exportar,
+    metricas
 )
 
 
@@ -58,38 +69,37 @@ if not firebase_admin._apps:
 
 def sincronizar_horario_cron(scheduler_instancia):
     """
-    Revisa Firebase cada 60 segundos. 
-    Compara la hora actual del Job con la de Firebase usando strings.
+    Mantiene el cron del barrido alineado con Firebase.
+    Primero intenta un listener de Firestore (push, cero tráfico en reposo).
+    Si no hay credenciales para el listener, cae a una lectura ligera
+    (solo hora y minuto) cada RECORDATORIOS_POLL_MINUTOS.
+    Corre en todas las instancias: si hay failover, el nuevo líder ya trae el horario correcto.
     """
+    global config_watch
+
     def verificar_y_actualizar():
         try:
-            repo = FirebaseRepository()
-            config = repo.obtener_config_recordatorios("komunah")
-            
-            nueva_h = int(config.get("hora", 10))
-            nueva_m = int(config.get("minuto", 0))
-
-            job = scheduler_instancia.get_job(JOB_ID_BARRIDO)
-            if job:
-                # Comparamos como texto para evitar el error de 'BaseField'
-                # fields[5] es la hora, fields[6] es el minuto
-                hora_actual_str = str(job.trigger.fields[5])
-                min_actual_str = str(job.trigger.fields[6])
-
-                if hora_actual_str != str(nueva_h) or min_actual_str != str(nueva_m):
-                    logger.info(f"🔄 SYNC: Cambio detectado en Firebase ({nueva_h}:{nueva_m}). Ajustando Cron...")
-                    scheduler_instancia.reschedule_job(
-                        JOB_ID_BARRIDO, 
-                        trigger='cron', 
-                        hour=nueva_h, 
-                        minute=nueva_m
-                    )
-                    logger.info("✅ Cron reprogramado exitosamente.")
+            horario = FirebaseRepository().obtener_horario_recordatorios("komunah")
+            if horario:
+                reprogramar_barrido(*horario)
         except Exception as e:
             logger.error(f"❌ Error en sincronización: {e}")
 
-    # Mantenemos el intervalo de 1 minuto
-    scheduler_instancia.add_job(verificar_y_actualizar, 'interval', minutes=1, id="sync_config_job")
+    def revision_periodica(inmediata: bool = False):
+        minutos = int(os.getenv("RECORDATORIOS_POLL_MINUTOS", 10))
+        scheduler_instancia.add_job(verificar_y_actualizar, 'interval', minutes=minutos,
+                                    id="sync_config_job", replace_existing=True)
+        logger.info(f"⏱️ Listener no disponible: revisión ligera del horario cada {minutos} min")
+        if inmediata:
+            # Lo que haya cambiado mientras el listener estuvo mudo se aplica ya, no en N minutos
+            verificar_y_actualizar()
+
+    # Si el listener cae después (sin snapshots, documento de otro proyecto, watch cerrado) también se pasa al polling
+    config_watch = escuchar_config_recordatorios("komunah", al_caer=lambda: revision_periodica(inmediata=True))
+    if config_watch:
+        logger.info("👂 Listener de Firestore activo para configuracion/recordatorios")
+        return
+    revision_periodica()
 
         
 # --- CONFIGURACIÓN DE FASTAPI ---
@@ -97,13 +107,15 @@ if APP_MODE == "NOTIFICACIONES":
     app = FastAPI(
         title="Comuna - Microservicio de Notificaciones",
         description="Puerto 8081: Solo envíos MailerSend con Copropietarios",
-        version="2.0.0"
+        version="2.0.0",
+        default_response_class=RespuestaORJSON
     )
 else: 
     app = FastAPI(
         title="Comuna API - Clean Architecture",
         description="API conectada a Plesk (SQL) y Firebase (NoSQL)",
-        version="2.0.0"
+        version="2.0.0",
+        default_response_class=RespuestaORJSON
     )
 
 origins = [
@@ -120,8 +132,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-ms"],
 ) 
 
+# Conteo y tiempo de SQL por petición (muestreado con SQL_PERFIL_MUESTREO)
+app.add_middleware(PerfiladorSQL)
+# Latencia por ruta y llamadas a APIs externas para /metrics
+app.add_middleware(MedidorHTTP)
+
 def tarea_diaria_notificaciones():  
     """Lógica del Cron Job."""
     db = SessionLocal()
@@ -133,10 +151,10 @@ def tarea_diaria_notificaciones():
         
         config = repo.obtener_config_recordatorios("komunah")
         
-        use_case.ejecutar_barrido_automatico("komunah", config["dias_1"], "Recordatorio de Pago", db, "normal")
-        use_case.ejecutar_barrido_automatico("komunah", config["dias_1"], "Recordatorio de Pago Vencido", db, "deudores")
-        use_case.ejecutar_barrido_automatico("komunah", config["dias_2"], "Recordatorio de Pago", db, "normal")
-        use_case.ejecutar_barrido_automatico("komunah", config["dias_2"], "Recordatorio de Pago Vencido", db, "deudores")
+        use_case.ejecutar_barrido_reanudable("komunah", config["dias_1"], "Recordatorio de Pago", db, "normal")
+        use_case.ejecutar_barrido_reanudable("komunah", config["dias_1"], "Recordatorio de Pago Vencido", db, "deudores")
+        use_case.ejecutar_barrido_reanudable("komunah", config["dias_2"], "Recordatorio de Pago", db, "normal")
+        use_case.ejecutar_barrido_reanudable("komunah", config["dias_2"], "Recordatorio de Pago Vencido", db, "deudores")
             
         logger.info("✅ Cron Job: Proceso finalizado con éxito.")
     except Exception as e:
@@ -144,6 +162,14 @@ def tarea_diaria_notificaciones():
     finally:
         db.close()
 
+def refrescar_cartera_resumen():
+    """La fila 'más cercana a hoy' cambia con el día aunque no haya sync."""
+    try:
+        # El job corre a medianoche de Ciudad de México: esa es la fecha del recorte
+        construir_cartera_resumen(engine, datetime.now(ZoneInfo("America/Mexico_City")).date())
+    except Exception as e:
+        logger.error(f"❌ Error refrescando cartera_resumen: {e}")
+
 @app.on_event("startup")
 def iniciar_mantenimiento():
     """Cron Job fijo: Se ejecuta todos los días a las 03:30 AM sin cambios."""
@@ -153,29 +179,56 @@ def iniciar_mantenimiento():
         
 @app.on_event("startup")
 def iniciar_scheduler():
+    global scheduler_global, elector
     if APP_MODE in ["NOTIFICACIONES", "FULL"]:
         mx_tz = ZoneInfo("America/Mexico_City")
         scheduler = BackgroundScheduler(timezone=mx_tz) 
         
+        # 0. Lease en MySQL: varias instancias, un solo barrido
+        elector = LeaderElector()
+        elector.renovar()
+        scheduler.add_job(elector.renovar, 'interval', seconds=LEASE_RENOVACION_SEGUNDOS, id="lease_heartbeat")
+        
         # 1. Carga inicial
         repo = FirebaseRepository()
         config = repo.obtener_config_recordatorios("komunah")
         
-        # 2. Programar el Job principal
+        # 2. Programar el Job principal (solo corre en el líder)
         scheduler.add_job(
-            tarea_diaria_notificaciones, 
+            elector.solo_lider(tarea_diaria_notificaciones), 
             'cron', 
             hour=config["hora"], 
             minute=config["minuto"],
             id=JOB_ID_BARRIDO
         ) 
         
-        # 3. Activar el verificador automático cada minuto (Polling)
+        registrar_scheduler(scheduler, config["hora"], config["minuto"])
+
+        # Resumen de cartera recalculado a medianoche (también solo en el líder)
+        scheduler.add_job(
+            elector.solo_lider(refrescar_cartera_resumen),
+            'cron',
+            hour=0,
+            minute=0,
+            id="cartera_resumen_diaria"
+        )
+        
+        # 3. Cambios de horario: listener de Firestore (o lectura ligera si no hay listener)
         sincronizar_horario_cron(scheduler)
         
         scheduler.start()
+        scheduler_global = scheduler
         logger.info(f"🚀 Scheduler iniciado: Barrido a las {config['hora']:02d}:{config['minuto']:02d}")
 
+@app.on_event("shutdown")
+def detener_scheduler():
+    if config_watch:
+        config_watch.unsubscribe()
+    if scheduler_global:
+        scheduler_global.shutdown(wait=False)
+    if elector:
+        elector.liberar()
+
 @app.get("/")
 def home():
     return {
@@ -184,6 +237,7 @@ def home():
         "modo": "Túnel SSH & Firebase",
         "cors": "Abierto a todo el mundo 🌍",
         "scheduler": "Activo ⏰" if APP_MODE in ["NOTIFICACIONES", "FULL"] else "Inactivo",
+        "lider_scheduler": bool(elector and elector.es_lider),
         "docs": "/docs"
     }
 
@@ -197,6 +251,7 @@ if APP_MODE == "NOTIFICACIONES":
     app.include_router(notificacionesMS.router_globales)
     app.include_router(remitentes.router)
     app.include_router(notificacionesMS.router_juridico)
+    app.include_router(metricas.router)
 else:
     app.include_router(login.router)
     app.include_router(usuarios.router)
@@ -210,6 +265,8 @@ else:
     app.include_router(DashboardKomunah.router)
     app.include_router(admin.router)
     app.include_router(debug_config.router)
+    app.include_router(exportar.router)
+    app.include_router(metricas.router)
 
 # --- ARRANQUE ---
 if __name__ == "__main__":
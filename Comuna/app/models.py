@@ -1,11 +1,15 @@
-from sqlalchemy import Column, String, Float, BigInteger, Text, Numeric, Boolean, Integer
+from sqlalchemy import Column, String, Float, BigInteger, Text, Numeric, Boolean, Integer, Date
 from .database import Base
 
+# Misma llave para todos los folios (y sus tablas derivadas): los JOIN comparan VARCHAR con VARCHAR
+# y usan índice; un BIGINT de un lado obliga a MySQL a convertir el otro a número ('0123' = 123).
+TIPO_FOLIO = String(150)
+
 
 class Pago(Base):
     __tablename__ = "pagos"
     
-    folio_venta = Column("Folio de la venta", BigInteger, primary_key=True)
+    folio_venta = Column("Folio de la venta", TIPO_FOLIO, primary_key=True)
     numero_pago = Column("Número de pago", String(255), primary_key=True)
     folio_pago = Column("Folio de pago", String(255), primary_key=True)
     cliente = Column("Cliente", String(255), primary_key=True)
@@ -15,7 +19,7 @@ class Pago(Base):
     monto_flujo = Column("Monto flujo", Numeric(20, 4))
     
     
-    fecha_estatus = Column("Fecha del estatus finalizado", Text)
+    fecha_estatus = Column("Fecha del estatus finalizado", Date)
     proyecto = Column("Proyecto", Text)
     etapa = Column("Etapa", Text)
     privada = Column("Privada", Text)
@@ -24,27 +28,31 @@ class Pago(Base):
     plazo_enganche = Column("Plazo enganche", BigInteger)
     apartado = Column("Apartado", Numeric(20, 4))
     promocion = Column("Promoción", Text)
-    fecha_amortizacion = Column("Fecha de amortización", Text)
+    fecha_amortizacion = Column("Fecha de amortización", Date)
     concepto_pago = Column("Concepto de pago", Text)
     monto_a_pagar = Column("Monto a pagar", Numeric(20, 4))
-    fecha_comprobante = Column("Fecha del comprobante de pago", Text)
+    fecha_comprobante = Column("Fecha del comprobante de pago", Date)
     metodo_pago = Column("Método de pago", Text)
     tipo_pago = Column("Tipo de pago", Text)
     banco_caja = Column("Banco Caja", Text)
     monto_pagado = Column("Monto pagado", Numeric(20, 4))
-    fecha_aplicacion = Column("Fecha de aplicación de pago registro en sistema", Text)
-    estatus = Column("Estatus", Text)
+    fecha_aplicacion = Column("Fecha de aplicación de pago registro en sistema", Date)
+    estatus = Column("Estatus", String(50))
     estatus_expediente = Column("Estatus expediente", Text)
-    fecha_cancelacion = Column("Fecha de cancelación", Text)
+    fecha_cancelacion = Column("Fecha de cancelación", Date)
     cancelado_por = Column("Cancelado por", Text)
     asesor = Column("Asesor", Text)
     tipo_moneda = Column("Tipo de moneda", Text)
     observaciones = Column("Observaciones", Text)
 
+    # Derivadas de fecha_comprobante en la sync, para agrupar por mes/año con índice
+    anio = Column("anio", Integer)
+    mes = Column("mes", Integer)
+
 # --- VENTAS ---
 class Venta(Base):
     __tablename__ = "ventas"
-    folio = Column("FOLIO", String(255), primary_key=True)
+    folio = Column("FOLIO", TIPO_FOLIO, primary_key=True)
     desarrollo = Column("DESARROLLO", Text)
     etapa = Column("ETAPA", Text)
     numero = Column("NÚMERO", Text)
@@ -74,32 +82,32 @@ class Venta(Base):
     monto_con_interes = Column("MONTO FINANCIADO CON INTERESES", Numeric(20, 4))
     precio_final = Column("PRECIO FINAL", Numeric(20, 4))
     apartado = Column("APARTADO", Numeric(20, 4))
-    fecha_inicio_operacion = Column("FECHA DE INICIO DE OPERACIÓN", Text)
-    fecha_pago_apartado = Column("FECHA DE PAGO DE APARTADO", Text)
-    fecha_finalizacion_enganche = Column("FECHA DE FINALIZACIÓN DE ENGANCHE", Text)
-    fecha_venta = Column("FECHA DE VENTA", Text)
-    fecha_finalizacion_financiamiento = Column("FECHA DE FINALIZACIÓN DE FINANCIAMIENTO", Text)
+    fecha_inicio_operacion = Column("FECHA DE INICIO DE OPERACIÓN", Date)
+    fecha_pago_apartado = Column("FECHA DE PAGO DE APARTADO", Date)
+    fecha_finalizacion_enganche = Column("FECHA DE FINALIZACIÓN DE ENGANCHE", Date)
+    fecha_venta = Column("FECHA DE VENTA", Date)
+    fecha_finalizacion_financiamiento = Column("FECHA DE FINALIZACIÓN DE FINANCIAMIENTO", Date)
     responsables = Column("RESPONSABLES", Text)
-    fecha_firma = Column("FECHA DE FIRMA DE PROMESA DE COMPRAVENTA", Float)
-    fecha_fin_pago_enganche = Column("FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE", Text)
+    fecha_firma = Column("FECHA DE FIRMA DE PROMESA DE COMPRAVENTA", Date)
+    fecha_fin_pago_enganche = Column("FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE", Date)
     plazo_financiamiento = Column("PLAZO DE FINANCIAMIENTO", Text)
     tipo_moneda = Column("TIPO DE MONEDA", Text)
     estado_expediente = Column("ESTADO DEL EXPEDIENTE", Text)
     correo_electronico = Column("CORREO ELECTRÓNICO", Text)
     genero = Column("GÉNERO", Text)
-    fecha_nacimiento = Column("FECHA DE NACIMIENTO", Text)
+    fecha_nacimiento = Column("FECHA DE NACIMIENTO", Date)
     lugar_nacimiento = Column("LUGAR DE NACIMIENTO", Text)
     ocupacion = Column("OCUPACIÓN", Text)
     estado_civil = Column("ESTADO CIVIL", Text)
     estado = Column("ESTADO", Text)
     pais = Column("PAÍS", Text)
-    coordinador = Column("COORDINADOR COMERCIAL", Float)
+    coordinador = Column("COORDINADOR COMERCIAL", Text)
     gerente = Column("GERENTE COMERCIAL", Text)
 
 # --- CARTERA VENCIDA ---
 class Cartera(Base):
     __tablename__ = "cartera_vencida"
-    folio = Column("FOLIO", BigInteger, primary_key=True)
+    folio = Column("FOLIO", TIPO_FOLIO, primary_key=True)
     reporte = Column("REPORTE", Text)
     proyecto = Column("PROYECTO", Text)
     fase = Column("FASE", Text)
@@ -107,7 +115,7 @@ class Cartera(Base):
     unidad = Column("UNIDAD", Text)
     cliente = Column("CLIENTE", Text)
     telefono = Column("TELÉFONO", Text)
-    fecha_pago = Column("FECHA DE PAGO", Text)
+    fecha_pago = Column("FECHA DE PAGO", Date)
     dias_vencidos = Column("DÍAS DE VENCIDOS", Numeric(20, 4))
     concepto = Column("CONCEPTO", Text)
     monto_a_pagar = Column("MONTO A PAGAR", Numeric(20, 4))
@@ -124,7 +132,7 @@ class Cartera(Base):
     
 class AntigSaldos(Base):
     __tablename__ = "antig_saldos"
-    folio = Column("FOLIO", String(255), primary_key=True)
+    folio = Column("FOLIO", TIPO_FOLIO, primary_key=True)
     cliente = Column("CLIENTE", Text)
     proyecto = Column("PROYECTO", Text)
     fase = Column("FASE", Text)
@@ -132,7 +140,7 @@ class AntigSaldos(Base):
     unidad = Column("UNIDAD", Text)
     correo = Column("CORREO ELECTRÓNICO", Text)
     telefono = Column("TELÉFONO", Text)
-    fecha_pago = Column("FECHA DE PAGO", Text)
+    fecha_pago = Column("FECHA DE PAGO", Date)
     saldo_vigente = Column("SALDO VIGENTE", Numeric(20, 4))
     dias_1_30 = Column("01 A 30 DÍAS", Numeric(20, 4))
     dias_31_60 = Column("31 A 60 DÍAS", Numeric(20, 4))
@@ -149,10 +157,10 @@ class AntigSaldos(Base):
 class Amortizacion(Base):
     __tablename__ = "amortizaciones"
     
-    folder_id = Column("folder_id", String(255), primary_key=True)
+    folder_id = Column("folder_id", TIPO_FOLIO, primary_key=True)
     number = Column("number", String(255), primary_key=True)
     concept = Column("concept", Text)
-    date = Column("date", Text) 
+    date = Column("date", Date)
     capital = Column(Numeric(precision=20, scale=4))
     interest = Column(Numeric(precision=20, scale=4))
     down_payment = Column(Numeric(precision=20, scale=4))
@@ -160,10 +168,54 @@ class Amortizacion(Base):
     penalized_amount = Column(Numeric(precision=20, scale=4))
     
 
+# --- TABLA DERIVADA: la arma el sync (services/tablas_calculadas.py) ---
+class AmortizacionSaldo(Base):
+    __tablename__ = "amortizacion_saldos"
+
+    folder_id = Column("folder_id", TIPO_FOLIO, primary_key=True)
+    number = Column("number", String(150), primary_key=True)
+    date = Column("date", Date)
+    total = Column(Numeric(precision=20, scale=4))
+    pagado_sum = Column(Numeric(precision=20, scale=4))
+    saldo = Column(Numeric(precision=20, scale=4))
+    is_overdue = Column(Boolean)
+    primera_fecha_impaga = Column("primera_fecha_impaga", Date)
+
+
+# --- TABLA DERIVADA: fila de cartera_vencida más cercana a hoy por folio (services/tablas_calculadas.py) ---
+class CarteraResumen(Base):
+    __tablename__ = "cartera_resumen"
+
+    folio = Column(TIPO_FOLIO, primary_key=True)
+    fecha_pago = Column(Date)
+    parcialidades_vencidas = Column(Numeric(precision=20, scale=4))
+    calculado_para = Column(Date)
+
+
+# --- TABLA DERIVADA: cubo mensual de pagos activos (services/tablas_calculadas.py) ---
+class PagoMensual(Base):
+    __tablename__ = "pagos_mensuales"
+
+    id = Column(BigInteger, primary_key=True)
+    folio = Column(TIPO_FOLIO, index=True)
+    cliente = Column(String(255))
+    proyecto = Column(String(255))
+    etapa = Column(String(255))
+    anio = Column(Integer)
+    mes = Column(Integer)
+    metodo_pago = Column(String(255))
+    concepto = Column(String(255))
+    banco = Column(String(255))
+    estatus_flujo = Column(String(50))
+    monto_activo = Column(Numeric(precision=20, scale=4))
+    monto_nc = Column(Numeric(precision=20, scale=4))
+    conteo = Column(Integer)
+
+
 class Cliente(Base):
     __tablename__ = "clientes"
     client_id = Column("client_id", String(255), primary_key=True)
-    created_at = Column("created_at", Text)
+    created_at = Column("created_at", Date)
     client_name = Column("client_name", Text)
     email = Column("email", Text)
     client_person = Column("client_person", Text)
@@ -187,7 +239,7 @@ class Cliente(Base):
     fiscal_regime = Column("fiscal_regime", Float)
     additional_emails_billing = Column("additional_emails_billing", Text) 
     pc_curp = Column("pc_curp", Text)
-    pc_birthdate = Column("pc_birthdate", Text)
+    pc_birthdate = Column("pc_birthdate", Date)
     pc_place_birth = Column("pc_place_birth", Text)
     pc_nationality = Column("pc_nationality", Text)
     pc_civil_status = Column("pc_civil_status", Text)
@@ -196,7 +248,7 @@ class Cliente(Base):
     pc_identification_type_id = Column("pc_identification_type_id", Float)
     mc_legal_name = Column("mc_legal_name", Text)
     mc_legal_rfc = Column("mc_legal_rfc", Text)
-    mc_constitution_date = Column("mc_constitution_date", Text)
+    mc_constitution_date = Column("mc_constitution_date", Date)
     mc_activity = Column("mc_activity", Text)
     mc_notary_name = Column("mc_notary_name", Text)
     mc_notary_public_name = Column("mc_notary_public_name", Text)
@@ -204,12 +256,12 @@ class Cliente(Base):
     mc_notary_public_catalog_republic = Column("mc_notary_public_catalog_republic", Float)
     mc_commercial_electronic_folio_number = Column("mc_commercial_electronic_folio_number", Text)
     mc_public_registry_state = Column("mc_public_registry_state", Text)
-    mc_public_registry_date = Column("mc_public_registry_date", Text)
+    mc_public_registry_date = Column("mc_public_registry_date", Date)
     mc_company_identification_type = Column("mc_company_identification_type", Float)
     mc_company_identification_number = Column("mc_company_identification_number", Text)
     mc_company_validity_identification = Column("mc_company_validity_identification", Text)
     mc_legal_representative_act_number = Column("mc_legal_representative_act_number", Float)
-    mc_legal_representative_act_date = Column("mc_legal_representative_act_date", Text)
+    mc_legal_representative_act_date = Column("mc_legal_representative_act_date", Date)
     mc_legal_representative_act_type = Column("mc_legal_representative_act_type", Text)
     mc_legal_representative_public_notary = Column("mc_legal_representative_public_notary", Text)
     mc_legal_representative_notary_number = Column("mc_legal_representative_notary_number", Float)
@@ -222,7 +274,7 @@ class GestionClientes(Base):
     __tablename__ = "notificaciones_gestion_clientes"
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    folio = Column(String(255), index=True)
+    folio = Column(TIPO_FOLIO, index=True)
     client_id = Column(String(255), index=True)
 
     client_name = Column(Text)
@@ -245,13 +297,13 @@ class ConfigEtapa(Base):
     proyecto = Column(String(255))
     etapa = Column(String(255), unique=True, nullable=False)
     total_folios = Column(Integer, default=0)
-    etapa_activo = Column(String(255))   
-    proyecto_activo = Column(String(255))
+    etapa_activo = Column(Boolean, default=True)
+    proyecto_activo = Column(Boolean, default=True)
 
 
 class FlujoCaja(Base):
     __tablename__ = "flujo_caja"
-    folio_venta = Column("Folio de venta", String(150))
+    folio_venta = Column("Folio de venta", TIPO_FOLIO)
     id_flujo = Column("ID Flujo", String(150))
     estado_expediente = Column("Estado del expediente", Text)
     cliente = Column("Cliente", Text)
@@ -260,7 +312,7 @@ class FlujoCaja(Base):
     privada = Column("Privada", Text)
     unidad = Column("Unidad", String(150))
     tipo_abono = Column("Tipo de abono", Text)
-    fecha = Column("Fecha", Text)
+    fecha = Column("Fecha", Date)
     forma_pago = Column("Forma de Pago", Text)
     banco = Column("Banco", Text)
     razon_social = Column("Razón Social", Text)
@@ -1,13 +1,20 @@
 import logging
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, case, distinct, cast, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, or_, case, distinct, cast, Date, select
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-from ..database import get_db
+from ..database import get_read_db, get_async_db, lee_de_replica
 from ..models import Venta, Pago, ConfigEtapa
 from ..services.security import get_current_user, es_admin, es_super_admin, es_usuario
+from ..services.cache_datos import CacheRespuestas, generacion_datos
+from ..services.analitica import almacen, agrupar, dia_numero, pivot, dimensiones_disponibles
 import calendar
+import os
+import time
+import numpy as np
 
 # Configuración de logger
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +34,8 @@ LIQUIDADO_STATUS_WHITELIST = [
     'liquidado', 'proceso escritura', 'agenda escritura', 'escriturado', 'entrega', 'finalizado'
 ]
 
+cache_kpis = CacheRespuestas("kpis", ttl=float(os.getenv("KPIS_CACHE_TTL", 900)))
+
 def parse_date_param(date_str: str):
     """Convierte string YYYY-MM-DD a objeto date."""
     try:
@@ -52,114 +61,105 @@ def get_full_month_range_previous_year(date_obj):
 
 # --- ENDPOINT 1: KPIs GLOBALES (Tarjetas Superiores) ---
 @router.get("/KPIs")
-def get_dashboard_kpis(
+async def get_dashboard_kpis(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(es_admin)
     ):
     """
     Calcula las tarjetas de métricas principales incluyendo Notas de Crédito.
+    Se cachea por (rango, proyecto, generación de datos): cambia solo cuando termina una sync.
+    Lo leído de la réplica no se cachea: puede ir atrás de la generación del primario.
     """
+    filtro_proyecto = proyecto if proyecto and proyecto.lower() != "todos" else None
+    clave = (start_date, end_date, proyecto, await run_in_threadpool(generacion_datos))
     try:
-        # 1. KPIs Generales de Ventas (Métrica de Ventas del SQL)
-        query_ventas = db.query(
-            func.count(Venta.folio).label("total_ventas"),
-            func.sum(case((func.lower(Venta.estado_expediente) == 'ventas', 1), else_=0)).label("pipeline"),
-            func.sum(case((func.lower(Venta.estado_expediente).in_([s.lower() for s in CONTRACT_STATUS_WHITELIST]), 1), else_=0)).label("contratos_firmados"),
-            func.sum(case((func.lower(Venta.estado_expediente).in_([s.lower() for s in CONTRACT_STATUS_WHITELIST]), Venta.precio_final), else_=0)).label("valor_contratos"),
-            func.sum(case((func.lower(Venta.estado_expediente).in_(['proceso de escritura', 'proceso escritura']), 1), else_=0)).label("proceso_escritura"),
-            func.sum(case((func.lower(Venta.estado_expediente) == 'agenda escritura', 1), else_=0)).label("agenda_escritura")
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date
-        )
-
-        if proyecto and proyecto.lower() != "todos":
-            query_ventas = query_ventas.filter(Venta.desarrollo == proyecto)
-        
-        base_query = query_ventas.first()
-
-        # 2. Métricas de Pagos (Notas de Crédito del SQL)
-        query_pagos = db.query(
-            func.count(Pago.folio_venta).label("notas_de_credito"), 
-            func.sum(Pago.monto_pagado).label("total_notas_de_credito")
-        ).join(Venta, Pago.folio_venta == Venta.folio).filter(
-            Pago.fecha_comprobante >= start_date,
-            Pago.fecha_comprobante <= end_date,
-            func.lower(Pago.metodo_pago) == 'nota de crédito',
-            Pago.estatus_flujo == 'active',
-            Pago.estatus == 'active'
-        )
-
-        if proyecto and proyecto.lower() != "todos":
-            query_pagos = query_pagos.filter(Venta.desarrollo == proyecto)
-            
-        pagos_metrics = query_pagos.first()
-
-        # 3. Cancelados y Expirados (Anual y Mes)
-        year_start = start_date[:4] + "-01-01"
-        year_end = start_date[:4] + "-12-31"
-        
-        def get_status_count(status, start, end):
-            q = db.query(func.count(Venta.folio)).filter(
-                func.lower(Venta.estado_expediente) == status,
-                Venta.fecha_inicio_operacion >= start,
-                Venta.fecha_inicio_operacion <= end
-            )
-            if proyecto and proyecto.lower() != "todos": q = q.filter(Venta.desarrollo == proyecto)
-            return q.scalar() or 0
-
-        cancelados_anio = get_status_count('cancelado', year_start, year_end)
-        cancelados_mes = get_status_count('cancelado', start_date, end_date)
-        expirados_anio = get_status_count('expirado', year_start, year_end)
-        expirados_mes = get_status_count('expirado', start_date, end_date)
-
-        # 4. Cálculo de Crecimiento YoY
-        s_date_obj = parse_date_param(start_date)
-        prev_start_str, prev_end_str = get_full_month_range_previous_year(s_date_obj)
-        
-        prev_month_sales_query = db.query(func.count(Venta.folio)).filter(
-            Venta.fecha_inicio_operacion >= prev_start_str,
-            Venta.fecha_inicio_operacion <= prev_end_str
-        )
-        if proyecto and proyecto.lower() != "todos": prev_month_sales_query = prev_month_sales_query.filter(Venta.desarrollo == proyecto)
-        prev_month_sales = prev_month_sales_query.scalar() or 0
-
-        current_month_sales = base_query.total_ventas or 0
-        growth = ((current_month_sales - prev_month_sales) / prev_month_sales * 100) if prev_month_sales > 0 else (100 if current_month_sales > 0 else 0)
-
-        # 5. Liquidados
-        liquidados_query = db.query(func.count(Venta.folio)).filter(
-            func.lower(Venta.estado_expediente).in_(LIQUIDADO_STATUS_WHITELIST),
-            Venta.fecha_fin_pago_enganche >= start_date,
-            Venta.fecha_fin_pago_enganche <= end_date
+        return await cache_kpis.obtener_async(
+            clave, lambda: _calcular_kpis(start_date, end_date, proyecto, filtro_proyecto, db),
+            guardar=not lee_de_replica(db)
         )
-        if proyecto and proyecto.lower() != "todos": liquidados_query = liquidados_query.filter(Venta.desarrollo == proyecto)
-        liquidados_count = liquidados_query.scalar() or 0
-
-        return {
-            "proyecto": proyecto or "Todos",
-            "ventas_totales": base_query.total_ventas or 0,
-            "pipeline": base_query.pipeline or 0,
-            "contratos_firmados": base_query.contratos_firmados or 0,
-            "valor_contratos": base_query.valor_contratos or 0,
-            "rendimiento_mes": round(growth, 1),
-            "liquidados": liquidados_count,
-            "proceso_escritura": base_query.proceso_escritura or 0,
-            "agenda_escritura": base_query.agenda_escritura or 0,
-            "notas_de_credito": pagos_metrics.notas_de_credito or 0,
-            "total_notas_de_credito": round(pagos_metrics.total_notas_de_credito or 0, 2),
-            "cancelados": {"anio": cancelados_anio, "mes": cancelados_mes},
-            "expirados": {"anio": expirados_anio, "mes": expirados_mes},
-            "_debug_comparativa": f"Mes Actual ({current_month_sales}) vs {prev_start_str} al {prev_end_str} ({prev_month_sales})"
-        }
-
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en KPIs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _calcular_kpis(start_date: str, end_date: str, proyecto: Optional[str], filtro_proyecto: Optional[str], db: AsyncSession):
+    s_date_obj, e_date_obj = parse_date_param(start_date), parse_date_param(end_date)
+    year_start = s_date_obj.replace(month=1, day=1)
+    year_end = s_date_obj.replace(month=12, day=31)
+    prev_start_str, prev_end_str = get_full_month_range_previous_year(s_date_obj)
+    prev_start, prev_end = parse_date_param(prev_start_str), parse_date_param(prev_end_str)
+
+    # La collation de MySQL ya compara sin mayúsculas: sin func.lower() el filtro no envuelve la columna
+    estado = Venta.estado_expediente
+    en_mes = Venta.fecha_inicio_operacion.between(s_date_obj, e_date_obj)
+    en_anio = Venta.fecha_inicio_operacion.between(year_start, year_end)
+    en_mes_anterior = Venta.fecha_inicio_operacion.between(prev_start, prev_end)
+    liquidado_en_mes = Venta.fecha_fin_pago_enganche.between(s_date_obj, e_date_obj)
+
+    def contar(*condiciones, valor=1):
+        return func.sum(case((and_(*condiciones), valor), else_=0))
+
+    # 1. Un solo barrido de ventas: todas las tarjetas son sumas condicionales sobre las mismas filas
+    query_ventas = select(
+        contar(en_mes, Venta.folio != None).label("total_ventas"),
+        contar(en_mes, estado == 'ventas').label("pipeline"),
+        contar(en_mes, estado.in_(CONTRACT_STATUS_WHITELIST)).label("contratos_firmados"),
+        contar(en_mes, estado.in_(CONTRACT_STATUS_WHITELIST), valor=Venta.precio_final).label("valor_contratos"),
+        contar(en_mes, estado.in_(['proceso de escritura', 'proceso escritura'])).label("proceso_escritura"),
+        contar(en_mes, estado == 'agenda escritura').label("agenda_escritura"),
+        contar(en_anio, estado == 'cancelado').label("cancelados_anio"),
+        contar(en_mes, estado == 'cancelado').label("cancelados_mes"),
+        contar(en_anio, estado == 'expirado').label("expirados_anio"),
+        contar(en_mes, estado == 'expirado').label("expirados_mes"),
+        contar(en_mes_anterior, Venta.folio != None).label("ventas_mes_anterior"),
+        contar(liquidado_en_mes, estado.in_(LIQUIDADO_STATUS_WHITELIST)).label("liquidados")
+    ).where(
+        or_(en_anio, en_mes, en_mes_anterior, liquidado_en_mes)
+    )
+    if filtro_proyecto:
+        query_ventas = query_ventas.where(Venta.desarrollo == filtro_proyecto)
+    base_query = (await db.execute(query_ventas)).first()
+
+    # 2. Métricas de Pagos (Notas de Crédito del SQL)
+    query_pagos = select(
+        func.count(Pago.folio_venta).label("notas_de_credito"), 
+        func.sum(Pago.monto_pagado).label("total_notas_de_credito")
+    ).join(Venta, Pago.folio_venta == Venta.folio).where(
+        Pago.fecha_comprobante.between(s_date_obj, e_date_obj),
+        Pago.metodo_pago == 'nota de crédito',
+        Pago.estatus_flujo == 'active',
+        Pago.estatus == 'active'
+    )
+    if filtro_proyecto:
+        query_pagos = query_pagos.where(Venta.desarrollo == filtro_proyecto)
+    pagos_metrics = (await db.execute(query_pagos)).first()
+
+    # 3. Crecimiento YoY
+    current_month_sales = base_query.total_ventas or 0
+    prev_month_sales = base_query.ventas_mes_anterior or 0
+    growth = ((current_month_sales - prev_month_sales) / prev_month_sales * 100) if prev_month_sales > 0 else (100 if current_month_sales > 0 else 0)
+
+    return {
+        "proyecto": proyecto or "Todos",
+        "ventas_totales": current_month_sales,
+        "pipeline": base_query.pipeline or 0,
+        "contratos_firmados": base_query.contratos_firmados or 0,
+        "valor_contratos": base_query.valor_contratos or 0,
+        "rendimiento_mes": round(growth, 1),
+        "liquidados": base_query.liquidados or 0,
+        "proceso_escritura": base_query.proceso_escritura or 0,
+        "agenda_escritura": base_query.agenda_escritura or 0,
+        "notas_de_credito": pagos_metrics.notas_de_credito or 0,
+        "total_notas_de_credito": round(pagos_metrics.total_notas_de_credito or 0, 2),
+        "cancelados": {"anio": base_query.cancelados_anio or 0, "mes": base_query.cancelados_mes or 0},
+        "expirados": {"anio": base_query.expirados_anio or 0, "mes": base_query.expirados_mes or 0},
+        "_debug_comparativa": f"Mes Actual ({current_month_sales}) vs {prev_start_str} al {prev_end_str} ({prev_month_sales})"
+    }
+
 # --- ENDPOINT 2: GRÁFICOS FINANCIEROS (Pagos e Ingresos) ---
 @router.get("/Graficos/Financieros")
 def get_financial_charts(
@@ -167,88 +167,58 @@ def get_financial_charts(
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
     banco: Optional[str] = Query(None, description="Filtrar por nombre del banco"), 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_admin)
     ):
+    """
+    Series diarias, YoY y donas calculadas sobre la copia columnar en memoria
+    (services/analitica.py): máscaras + bincount, sin GROUP BY en MySQL.
+    """
     try:
         db_banco = "No aplica" if banco == "Banco Mercantil del Norte, S.A." else banco
+        pagos = almacen.tabla("pagos")
 
-        # 1. CÁLCULO DE DATOS ACTUALES
-        query_stats = db.query(
-            Pago.fecha_comprobante,
-            # Lógica de resta: Si es NC, el monto se suma como negativo
-            func.sum(case(
-                (and_(func.lower(Pago.estatus_flujo) == 'active', func.lower(Pago.estatus) == 'active'),
-                    case((func.lower(Pago.metodo_pago) == 'nota de crédito', -Pago.monto_pagado), else_=Pago.monto_pagado)
-                ), 
-                else_=0)
-            ).label("abonado"),
-            func.sum(case((and_(func.lower(Pago.estatus_flujo).in_(['canceled', 'cancelado']), func.lower(Pago.estatus).in_(['canceled', 'cancelado'])), Pago.monto_flujo), else_=0)).label("cancelado"),
-            # Conteo: Solo cuenta si NO es nota de crédito
-            func.sum(case(
-                (and_(func.lower(Pago.estatus_flujo) == 'active', func.lower(Pago.estatus) == 'active', func.lower(Pago.metodo_pago) != 'nota de crédito'), 1), 
-                else_=0)
-            ).label("conteo")
-        ).filter(
-            Pago.fecha_comprobante >= start_date, Pago.fecha_comprobante <= end_date,
-            Pago.fecha_comprobante != None, func.lower(Pago.estatus_flujo).in_(['active', 'canceled', 'cancelado'])
-        )
-        if proyecto and proyecto.lower() != "todos": query_stats = query_stats.filter(Pago.proyecto == proyecto)
-        if banco and banco.lower() != "todos": query_stats = query_stats.filter(Pago.banco_caja == db_banco)
-        
-        daily_stats = query_stats.group_by(Pago.fecha_comprobante).order_by(Pago.fecha_comprobante).all()
-
-        # Procesamiento de series
-        data_map = {r.fecha_comprobante: r for r in daily_stats}
-        series_abonado, series_cancelado, series_conteo, categories = [], [], [], []
-        total_actual_abonado = 0
-        total_actual_conteo = 0
         s_date_obj, e_date_obj = parse_date_param(start_date), parse_date_param(end_date)
-        delta = e_date_obj - s_date_obj
-        for i in range(delta.days + 1):
-            day = s_date_obj + timedelta(days=i)
-            val = data_map.get(day.strftime("%Y-%m-%d"))
-            abo = float(val.abonado) if val and val.abonado else 0
-            can = float(val.cancelado) if val and val.cancelado else 0
-            con = int(val.conteo) if val and val.conteo else 0
-            series_abonado.append(abo); series_cancelado.append(can); series_conteo.append(con)
-            categories.append(day.strftime("%d/%m"))
-            total_actual_abonado += abo; 
-            total_actual_conteo += con
+        n_dias = max((e_date_obj - s_date_obj).days + 1, 0)
+
+        filtro = np.ones(pagos.n, dtype=bool)
+        if proyecto and proyecto.lower() != "todos": filtro &= pagos.textos["proyecto"].mascara(proyecto)
+        if banco and banco.lower() != "todos": filtro &= pagos.textos["banco"].mascara(db_banco)
+
+        flujo, estatus = pagos.textos["estatus_flujo"], pagos.textos["estatus"]
+        activo = flujo.mascara("active") & estatus.mascara("active")
+        cancelado = flujo.mascara("canceled", "cancelado") & estatus.mascara("canceled", "cancelado")
+        es_nc = pagos.textos["metodo_pago"].mascara("nota de crédito")
+        # metodo_pago != 'nota de crédito' en SQL tampoco cuenta los NULL (código 0)
+        con_metodo = pagos.textos["metodo_pago"].codigos > 0
+        # Lógica de resta: Si es NC, el monto se suma como negativo
+        abono_neto = np.where(es_nc, -pagos.numeros["monto_pagado"], pagos.numeros["monto_pagado"])
+
+        # 1. SERIES DIARIAS (posición del día dentro del rango)
+        en_rango = filtro & pagos.rango(s_date_obj, e_date_obj)
+        dia = pagos.fechas["fecha"] - dia_numero(s_date_obj)
+        series_abonado = agrupar(dia, en_rango & activo, abono_neto, n_dias)
+        series_cancelado = agrupar(dia, en_rango & cancelado, pagos.numeros["monto_flujo"], n_dias)
+        series_conteo = agrupar(dia, en_rango & activo & con_metodo & ~es_nc, tamanio=n_dias)
+        categories = [(s_date_obj + timedelta(days=i)).strftime("%d/%m") for i in range(n_dias)]
+
+        total_actual_abonado = float(series_abonado.sum())
+        total_actual_conteo = int(series_conteo.sum())
 
         # 3. LÓGICA YoY (Ajustada para restar NC también en el año pasado)
         prev_start, prev_end = get_full_month_range_previous_year(s_date_obj)
-        query_prev = db.query(
-            func.sum(case(
-                (func.lower(Pago.metodo_pago) == 'nota de crédito', -Pago.monto_pagado), 
-                else_=Pago.monto_pagado)
-            )
-        ).filter(
-            Pago.fecha_comprobante >= prev_start, Pago.fecha_comprobante <= prev_end,
-            func.lower(Pago.estatus_flujo) == 'active', func.lower(Pago.estatus) == 'active'
-        )
-        if proyecto and proyecto.lower() != "todos": query_prev = query_prev.filter(Pago.proyecto == proyecto)
-        if banco and banco.lower() != "todos": query_prev = query_prev.filter(Pago.banco_caja == db_banco)
-        
-        total_prev_abonado = float(query_prev.scalar() or 0)
+        en_prev = filtro & activo & pagos.rango(parse_date_param(prev_start), parse_date_param(prev_end))
+        total_prev_abonado = float(abono_neto[en_prev].sum())
         growth = ((total_actual_abonado - total_prev_abonado) / total_prev_abonado * 100) if total_prev_abonado > 0 else (100 if total_actual_abonado > 0 else 0)
 
         # 5. COMPOSICIÓN (DONAS - Ajustada para que el total coincida)
-        def get_composition(field):
-            q = db.query(
-                field, 
-                func.sum(case((func.lower(Pago.metodo_pago) == 'nota de crédito', -Pago.monto_pagado), else_=Pago.monto_pagado))
-            ).filter(
-                Pago.fecha_comprobante >= start_date, Pago.fecha_comprobante <= end_date,
-                func.lower(Pago.estatus_flujo) == 'active', func.lower(Pago.estatus) == 'active'
-            )
-            if proyecto and proyecto.lower() != "todos":q = q.filter(Pago.proyecto == proyecto)
-            if banco and banco.lower() != "todos": q = q.filter(Pago.banco_caja == db_banco)
-            return q.group_by(field).all()
-
-        methods_query = get_composition(Pago.metodo_pago)
-        concepts_query = get_composition(Pago.concepto_pago)
-        
+        def get_composition(nombre):
+            codigos, etiquetas = pagos.textos[nombre].grupos()
+            sumas = agrupar(codigos, en_rango & activo, abono_neto, len(etiquetas))
+            presentes = agrupar(codigos, en_rango & activo, tamanio=len(etiquetas))
+            return [{"label": etiquetas[c] if c > 0 else "Sin definir", "value": float(sumas[c])}
+                    for c in np.flatnonzero(presentes)]
+
         return {
             "proyecto": proyecto or "Todos",
             "Total_abonado": round(total_actual_abonado, 2), 
@@ -257,15 +227,17 @@ def get_financial_charts(
             "Comparativa_rendimiento": f"Total abonado mes actual: ({round(total_actual_abonado, 2)}) vs total abonado mes del año pasado: ({round(total_prev_abonado, 2)})",
             "Historico_de_abonos": {
                 "Categorias": categories, 
-                "Abonado": series_abonado, 
-                "Cancelado": series_cancelado, 
-                "Pagos_realizados": series_conteo
+                "Abonado": series_abonado.tolist(), 
+                "Cancelado": series_cancelado.tolist(), 
+                "Pagos_realizados": series_conteo.astype(int).tolist()
                 },
             "Composicion_de_ingresos": {
-                "Metodos_de_pagos": [{"label": m[0] or "Sin definir", "value": float(m[1] or 0)} for m in methods_query],
-                "Distribucion_por_conceptos": [{"label": c[0] or "Sin definir", "value": float(c[1] or 0)} for c in concepts_query]
+                "Metodos_de_pagos": get_composition("metodo_pago"),
+                "Distribucion_por_conceptos": get_composition("concepto")
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en Financials: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -276,7 +248,7 @@ def get_clusters_chart(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_admin)
     ):
     """
@@ -284,66 +256,27 @@ def get_clusters_chart(
     Optimizado para Stacked Bar Chart.
     """
     try:
-        # 1. Construir la base de la consulta (SIN .all() todavía)
-        query_obj = db.query(
-            Venta.fecha_inicio_operacion,
-            Venta.etapa,
-            func.count(Venta.folio).label("cantidad")
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date
-        )
-        
-        # 2. Aplicar filtro de proyecto si existe
-        # Nota: Asegúrate de usar Venta.proyecto o Venta.desarrollo según tu modelo
-        if proyecto and proyecto.lower() != "todos": 
-            query_obj = query_obj.filter(Venta.desarrollo == proyecto)
-        
-        # 3. Agrupar y EJECUTAR con .all()
-        results = query_obj.group_by(
-            Venta.fecha_inicio_operacion, 
-            Venta.etapa
-        ).all()
-        
-        # --- El resto de tu lógica de procesamiento se mantiene igual ---
-        etapas_set = set()
-        data_map = {} 
-        
-        for row in results: # 'results' ahora es la lista
-            fecha = row.fecha_inicio_operacion
-            etapa = row.etapa or "Sin Etapa"
-            cant = row.cantidad
-            
-            etapas_set.add(etapa)
-            if fecha not in data_map: data_map[fecha] = {}
-            data_map[fecha][etapa] = cant
-
+        ventas = almacen.tabla("ventas")
         s_date = parse_date_param(start_date)
         e_date = parse_date_param(end_date)
-        delta = e_date - s_date
-        
-        categories = []
-        series_dict = {etapa: [] for etapa in etapas_set}
-        total_clusters = 0
-
-        for i in range(delta.days + 1):
-            day = s_date + timedelta(days=i)
-            day_str = day.strftime("%Y-%m-%d")
-            categories.append(day.strftime("%d/%m"))
-            
-            day_data = data_map.get(day_str, {})
-            
-            for etapa in etapas_set:
-                val = day_data.get(etapa, 0)
-                series_dict[etapa].append(val)
-                total_clusters += val
-
-        final_series = [{"name": etapa, "data": data} for etapa, data in series_dict.items()]
-
-        totals_by_stage = []
-        for etapa in etapas_set:
-            total_etapa = sum(series_dict[etapa])
-            totals_by_stage.append({"label": etapa, "value": total_etapa})
+        n_dias = max((e_date - s_date).days + 1, 0)
+
+        mascara = ventas.rango(s_date, e_date)
+        if proyecto and proyecto.lower() != "todos":
+            mascara &= ventas.textos["desarrollo"].mascara(proyecto)
+
+        # Matriz etapa x día con un solo bincount
+        etapa = ventas.textos["etapa"]
+        n_etapas = len(etapa.categorias)
+        dia = ventas.fechas["fecha"] - dia_numero(s_date)
+        matriz = agrupar(etapa.codigos * n_dias + dia, mascara, tamanio=n_etapas * n_dias)
+        matriz = matriz.astype(int).reshape(n_etapas, n_dias) if n_dias else np.zeros((n_etapas, 0), dtype=int)
+        totales = matriz.sum(axis=1)
+
+        categories = [(s_date + timedelta(days=i)).strftime("%d/%m") for i in range(n_dias)]
+        presentes = sorted(np.flatnonzero(totales), key=lambda c: etapa.etiqueta(c, "Sin Etapa"))
+        final_series = [{"name": etapa.etiqueta(c, "Sin Etapa"), "data": matriz[c].tolist()} for c in presentes]
+        totals_by_stage = [{"label": etapa.etiqueta(c, "Sin Etapa"), "value": int(totales[c])} for c in presentes]
 
         return {
             "proyecto": proyecto or "Todos",
@@ -352,21 +285,23 @@ def get_clusters_chart(
                 "series": final_series
             },
             "distribution": totals_by_stage,
-            "total_general": total_clusters
+            "total_general": int(totales.sum())
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en Clusters: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- ENDPOINT 4: PROYECTOS Y ETAPAS (Configuración) ---
 @router.get("/proyectos")
-def get_proyectos(
-    db: Session = Depends(get_db),
+async def get_proyectos(
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(es_admin)
     ):
     try:
-        resultados = db.query(ConfigEtapa).all()
+        resultados = (await db.execute(select(ConfigEtapa))).scalars().all()
 
         def to_bool(val):
             if val is None:
@@ -395,4 +330,43 @@ def get_proyectos(
 
     except Exception as e:
         logger.error(f"Error en Proyectos: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+# --- ENDPOINT 5: PIVOT LIBRE (copia columnar en memoria) ---
+@router.get("/pivot")
+def get_pivot(
+    tabla: str = Query("pagos", description="pagos o ventas"),
+    filas: str = Query(..., description="Dimensión de las filas (ej. proyecto, metodo_pago, anio, mes)"),
+    columnas: Optional[str] = Query(None, description="Dimensión de las columnas (opcional)"),
+    medida: Optional[str] = Query(None, description="Columna numérica; vacío = conteo"),
+    agregado: str = Query("sum", description="sum, count o avg"),
+    start_date: Optional[str] = Query(None, description="Fecha inicio YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Fecha fin YYYY-MM-DD"),
+    proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
+    estatus: Optional[str] = Query(None, description="Filtrar por estatus (pagos) o estado del expediente (ventas)"),
+    user: dict = Depends(es_admin)
+    ):
+    """
+    Cualquier combinación dimensión x dimensión x medida sin tocar la base.
+    GET /dashboard/pivot/opciones lista lo disponible por tabla.
+    """
+    inicio = time.perf_counter()
+    filtros = {}
+    if proyecto and proyecto.lower() != "todos":
+        filtros["proyecto" if tabla == "pagos" else "desarrollo"] = proyecto
+    if estatus:
+        filtros["estatus" if tabla == "pagos" else "estado_expediente"] = estatus
+    try:
+        resultado = pivot(
+            tabla, filas, columnas, medida, agregado,
+            parse_date_param(start_date) if start_date else None,
+            parse_date_param(end_date) if end_date else None,
+            filtros
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resultado["ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    return resultado
+
+@router.get("/pivot/opciones")
+def get_pivot_opciones(user: dict = Depends(es_admin)):
+    return {t: dimensiones_disponibles(t) for t in ("pagos", "ventas")}
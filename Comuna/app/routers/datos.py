@@ -1,140 +1,297 @@
-from http.client import HTTPException
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import text
 from typing import Optional, List
 from ..services.security import get_current_user, es_admin, es_usuario, es_super_admin
 
-from ..database import get_db
+from ..database import get_async_db, lee_de_replica
+from ..services.respuestas import RespuestaORJSON, filas_en_bloques, stream_ndjson, stream_arreglo_json
+from ..services.cache_datos import generacion_datos
 
 router = APIRouter(prefix="/datos", tags=["Consultas BD"])
 
+FORMATOS_STREAM = {"json": "application/json", "ndjson": "application/x-ndjson"}
+TAMANIO_BLOQUE = int(os.getenv("DATOS_STREAM_BLOQUE", 2000))
+
+def _filtro_anio(columna: str, anio: Optional[int]):
+    """Rango sobre la columna DATE (usa índice, a diferencia de LIKE 'aaaa-%')."""
+    if not anio:
+        return "", {}
+    return f"{columna} BETWEEN :inicio AND :fin", {"inicio": f"{anio}-01-01", "fin": f"{anio}-12-31"}
+
+def _con_where(where: str) -> str:
+    return f" WHERE {where}" if where else ""
+
+def _validar_formato(formato: str):
+    if formato not in FORMATOS_STREAM:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}. Use json o ndjson")
+
+# Llave de paginación por tabla: fila_id lo agrega la sync a cada tabla replicada (PK autoincremental)
+LLAVES_TABLAS = {
+    "clientes": "fila_id",
+    "ventas": "fila_id",
+    "pagos": "fila_id",
+    "cartera_vencida": "fila_id",
+    "amortizaciones": "fila_id",
+    "antig_saldos": "fila_id",
+    "notificaciones_gestion_clientes": "id",
+}
+LIMITE_PAGINA_DEFAULT = 500
+LIMITE_PAGINA_MAX = int(os.getenv("DATOS_LIMITE_PAGINA_MAX", 5000))
+_columnas_tabla = {}
+
+async def _columnas(db: AsyncSession, tabla: str) -> list:
+    """Columnas reales de la tabla (se vuelve a leer cuando cambia la generación de datos)."""
+    clave = (tabla, await run_in_threadpool(generacion_datos))
+    if clave in _columnas_tabla:
+        return _columnas_tabla[clave]
+    columnas = list((await db.execute(text(f"SELECT * FROM {tabla} LIMIT 0"))).keys())
+    if not lee_de_replica(db):
+        if len(_columnas_tabla) > 50:
+            _columnas_tabla.clear()
+        _columnas_tabla[clave] = columnas
+    return columnas
+
+async def _json_en_hilo(armar):
+    """
+    Arma y serializa la respuesta en el threadpool: convertir miles de filas a dict y a JSON
+    no bloquea el event loop. Mismo JSON que la respuesta por defecto (jsonable_encoder + orjson).
+    """
+    return await run_in_threadpool(lambda: RespuestaORJSON(armar()))
+
+def _leer_cursor(after: str, generacion: int) -> int:
+    """
+    El cursor es "generación:llave". fila_id se regenera en cada sync, así que un cursor de
+    otra generación ya no apunta a la misma fila: 409 en vez de saltar o repetir filas.
+    """
+    gen, _, valor = after.partition(":")
+    try:
+        gen, valor = int(gen), int(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Cursor inválido: {after}")
+    if gen != generacion:
+        raise HTTPException(status_code=409, detail="El cursor es de una sincronización anterior; vuelva a pedir la primera página")
+    return valor
+
+def _quiere_pagina(after, limit, fields) -> bool:
+    return after is not None or limit is not None or bool(fields)
+
+async def _pagina(db: AsyncSession, tabla: str, after: Optional[str], limit: Optional[int], fields: Optional[str],
+                  where: str = "", params: dict = None, procesar=None) -> RespuestaORJSON:
+    """
+    Paginación keyset: WHERE llave > :after ORDER BY llave LIMIT n. Cada página cuesta lo mismo
+    sin importar qué tan adentro de la tabla esté (no hay OFFSET). `fields` proyecta columnas.
+    next_cursor lleva la generación de datos para detectar una sync entre páginas.
+    """
+    llave = LLAVES_TABLAS[tabla]
+    limite = min(max(limit or LIMITE_PAGINA_DEFAULT, 1), LIMITE_PAGINA_MAX)
+    generacion = await run_in_threadpool(generacion_datos)
+
+    disponibles = await _columnas(db, tabla)
+    if fields:
+        pedidas = [f.strip() for f in fields.split(",") if f.strip()]
+        desconocidas = [f for f in pedidas if f not in disponibles]
+        if desconocidas:
+            raise HTTPException(status_code=400, detail=f"Columnas desconocidas en {tabla}: {', '.join(desconocidas)}")
+        # La llave siempre viaja: es el cursor de la siguiente página
+        columnas = [llave] + [f for f in pedidas if f != llave]
+        select = ", ".join(f"`{c}`" for c in columnas)
+    else:
+        select = "*"
+
+    condiciones = [where] if where else []
+    params = dict(params or {})
+    if after is not None:
+        condiciones.append(f"`{llave}` > :_after")
+        params["_after"] = _leer_cursor(after, generacion)
+    params["_limite"] = limite + 1
+    sql = f"SELECT {select} FROM {tabla}"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    sql += f" ORDER BY `{llave}` LIMIT :_limite"
+
+    try:
+        resultado = await db.execute(text(sql), params)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error SQL: {str(e)}")
+
+    def armar():
+        filas = [dict(r) for r in resultado.mappings()]
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        if procesar:
+            filas = [procesar(f) for f in filas]
+        return {
+            "items": filas,
+            "limit": limite,
+            "next_cursor": f"{generacion}:{filas[-1][llave]}" if hay_mas and filas else None,
+        }
+    return await _json_en_hilo(armar)
+
 @router.get("/clientes")
-def listar_clientes(
+async def listar_clientes(
     anio: Optional[int] = None,
-    db: Session = Depends(get_db),
+    formato: str = Query("json", description="json (mismo objeto de siempre, en chunks) o ndjson (una fila por línea)"),
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
     user: dict = Depends(es_usuario)
 ):
+    where, params = _filtro_anio("created_at", anio)
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "clientes", after, limit, fields, where, params)
+
+    _validar_formato(formato)
     try:
-        total = db.execute(
+        total = (await db.execute(
             text("SELECT COUNT(*) FROM clientes")
-        ).scalar()
-
-        if anio:
-            filtro = f"{anio}-%"
-
-            result = db.execute(
-                text("""
-                    SELECT *
-                    FROM clientes
-                    WHERE created_at LIKE :f
-                """),
-                {"f": filtro}
-            )
-        else:
-            result = db.execute(
-                text("SELECT * FROM clientes")
-            )
-
-        data = [dict(row) for row in result.mappings()]
-
-        return {
-            "total": total,   # siempre el total absoluto
-            "anio": anio,
-            "items": data
-        }
-
+        )).scalar()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error SQL: {str(e)}")
 
-
+    try:
+        bloques = await run_in_threadpool(filas_en_bloques, f"SELECT * FROM clientes{_con_where(where)}", params, TAMANIO_BLOQUE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error SQL: {str(e)}")
-
+    if formato == "ndjson":
+        cuerpo = stream_ndjson(bloques)
+    else:
+        # total siempre es el total absoluto
+        cuerpo = stream_arreglo_json(bloques, encabezado={"total": total, "anio": anio}, llave="items")
+    return StreamingResponse(cuerpo, media_type=FORMATOS_STREAM[formato])
 
 
 @router.get("/pagos")
-def listar_pagos(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    result = db.execute(text("SELECT * FROM pagos LIMIT 10000"))
-    return [dict(row) for row in result.mappings()]
+async def listar_pagos(
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "pagos", after, limit, fields)
+    result = await db.execute(text("SELECT * FROM pagos LIMIT 10000"))
+    return await _json_en_hilo(lambda: [dict(row) for row in result.mappings()])
 
-@router.get("/ventas")
-def listar_ventas(anio: Optional[int] = None, db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    try:
-        if anio:
-    
-            filtro = f"{anio}-%" 
-            query = text("SELECT * FROM ventas WHERE `FECHA DE INICIO DE OPERACIÓN` LIKE :f")
-            result = db.execute(query, {"f": filtro})
-        else:
+NUMERICOS_VENTAS = [
+    'FOLIO', 'METROS CUADRADOS', 'M2', 'PRECIO', 
+    'ENGANCHE', 'FINANCIADO', 'APARTADO', 'MONTO', 'FLUJO'
+]
+TEXTOS_OBLIGATORIOS_VENTAS = [
+    'NACIMIENTO', 'LUGAR', 'OCUPACIÓN', 'ESTADO CIVIL', 
+    'ESTADO', 'PAÍS', 'CLIENTE', 'TELÉFONO', 'CANAL', 
+    'COORDINADOR', 'GERENTE', 'SUCURSALES', 'RESPONSABLES'
+]
 
-            result = db.execute(text("SELECT * FROM ventas"))
+def _normalizar_venta(d: dict) -> dict:
+    for k, v in d.items():
+        k_up = k.upper()
+        
+        if 'FECHA' in k_up:
+            if v is None or str(v).strip().upper() in ['NULL', '']:
+                d[k] = "" 
+            else:
+                d[k] = str(v)
+            continue 
         
-        raw_rows = result.mappings().all()
-        final_data = []
-
-        for row in raw_rows:
-            d = dict(row)
-            for k, v in d.items():
-                k_up = k.upper()
-                
-                if 'FECHA' in k_up:
-                    if v is None or str(v).strip().upper() in ['NULL', '']:
-                        d[k] = "" 
-                    else:
-                        d[k] = str(v)
-                    continue 
-                
-                numericos = [
-                    'FOLIO', 'METROS CUADRADOS', 'M2', 'PRECIO', 
-                    'ENGANCHE', 'FINANCIADO', 'APARTADO', 'MONTO', 'FLUJO'
-                ]
-                
-                if any(x in k_up for x in numericos):
-                    try:
-                        d[k] = float(v) if v not in [None, '', 'NULL'] else 0.0
-                    except:
-                        d[k] = 0.0
-                    continue
-
-                textos_obligatorios = [
-                    'NACIMIENTO', 'LUGAR', 'OCUPACIÓN', 'ESTADO CIVIL', 
-                    'ESTADO', 'PAÍS', 'CLIENTE', 'TELÉFONO', 'CANAL', 
-                    'COORDINADOR', 'GERENTE', 'SUCURSALES', 'RESPONSABLES'
-                ]
-                
-                if any(x in k_up for x in textos_obligatorios):
-                    if v is None or str(v).strip().upper() in ['NULL', '']:
-                        d[k] = ""
-                    else:
-                        d[k] = str(v)
-            
-            final_data.append(d)
-            
-        return final_data
+        if any(x in k_up for x in NUMERICOS_VENTAS):
+            try:
+                d[k] = float(v) if v not in [None, '', 'NULL'] else 0.0
+            except:
+                d[k] = 0.0
+            continue
+        
+        if any(x in k_up for x in TEXTOS_OBLIGATORIOS_VENTAS):
+            if v is None or str(v).strip().upper() in ['NULL', '']:
+                d[k] = ""
+            else:
+                d[k] = str(v)
+    return d
+
+@router.get("/ventas")
+async def listar_ventas(
+    anio: Optional[int] = None,
+    formato: str = Query("json", description="json (arreglo en chunks) o ndjson (una fila por línea)"),
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    """Cursor del lado del servidor: la normalización se aplica por bloque y la memoria no crece con la tabla."""
+    where, params = _filtro_anio("`FECHA DE INICIO DE OPERACIÓN`", anio)
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "ventas", after, limit, fields, where, params, _normalizar_venta)
+
+    _validar_formato(formato)
+    try:
+        bloques = await run_in_threadpool(filas_en_bloques, f"SELECT * FROM ventas{_con_where(where)}", params, TAMANIO_BLOQUE)
     except Exception as e:
-     
         raise HTTPException(status_code=500, detail=f"Error SQL: {str(e)}")
+    if formato == "ndjson":
+        cuerpo = stream_ndjson(bloques, _normalizar_venta)
+    else:
+        cuerpo = stream_arreglo_json(bloques, _normalizar_venta)
+    return StreamingResponse(cuerpo, media_type=FORMATOS_STREAM[formato])
     
 
 @router.get("/cartera")
-def listar_cartera(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    result = db.execute(text("SELECT * FROM cartera_vencida LIMIT 1500"))
-    return [dict(row) for row in result.mappings()]
+async def listar_cartera(
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "cartera_vencida", after, limit, fields)
+    result = await db.execute(text("SELECT * FROM cartera_vencida LIMIT 1500"))
+    return await _json_en_hilo(lambda: [dict(row) for row in result.mappings()])
 
 @router.get("/amortizaciones") 
-def listar_amortizaciones(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    result = db.execute(text("SELECT * FROM amortizaciones LIMIT 1500"))
-    return [dict(row) for row in result.mappings()]
+async def listar_amortizaciones(
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "amortizaciones", after, limit, fields)
+    result = await db.execute(text("SELECT * FROM amortizaciones LIMIT 1500"))
+    return await _json_en_hilo(lambda: [dict(row) for row in result.mappings()])
 
 @router.get("/antiguedad")
-def listar_antiguedad(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    result = db.execute(text("SELECT * FROM antig_saldos LIMIT 1500"))
-    return [dict(row) for row in result.mappings()]
+async def listar_antiguedad(
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "antig_saldos", after, limit, fields)
+    result = await db.execute(text("SELECT * FROM antig_saldos LIMIT 1500"))
+    return await _json_en_hilo(lambda: [dict(row) for row in result.mappings()])
 
 
 @router.get("/gestion-clientes")
-def listar_gestion_clientes(folio: Optional[str] = None, db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
+async def listar_gestion_clientes(
+    folio: Optional[str] = None,
+    after: Optional[str] = Query(None, description="Cursor: next_cursor de la página anterior"),
+    limit: Optional[int] = Query(None, description="Filas por página (activa la paginación)"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(es_usuario)
+):
+    if _quiere_pagina(after, limit, fields):
+        return await _pagina(db, "notificaciones_gestion_clientes", after, limit, fields,
+                       "folio = :f" if folio else "", {"f": folio} if folio else None)
     try:
         query_str = "SELECT * FROM notificaciones_gestion_clientes"
         params = {}
@@ -143,12 +300,14 @@ def listar_gestion_clientes(folio: Optional[str] = None, db: Session = Depends(g
             query_str += " WHERE folio = :f"
             params["f"] = folio
 
-        result = db.execute(text(query_str), params)
-        
-        data = [dict(row) for row in result.mappings()]
+        result = await db.execute(text(query_str), params)
 
-        return {
-            "total_encontrados": len(data),"folio_filtrado": folio if folio else "Todos","items": data}
+        def armar():
+            data = [dict(row) for row in result.mappings()]
+            return {
+                "total_encontrados": len(data),"folio_filtrado": folio if folio else "Todos","items": data}
+
+        return await _json_en_hilo(armar)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al consultar notificaciones_gestion_clientes: {str(e)}")
\ No newline at end of file
@@ -3,6 +3,7 @@ import requests
 import logging
 from fastapi import APIRouter, HTTPException, Depends
 from ..services.security import es_admin
+from ..database import estado_conexiones
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +53,11 @@ class FirebaseRepository:
 
 # --- Endpoints ---
 
+@router.get("/conexiones/db")
+def estado_db(user: dict = Depends(es_admin)):
+    """Pool de conexiones (uso, overflow, esperas y timeouts) y estado/reconexiones de los túneles SSH."""
+    return estado_conexiones()
+
 @router.get("/{empresa_id}")
 def consultar_debug(empresa_id: str, user: dict = Depends(es_admin)):
     """Revisa si el modo pruebas está encendido para la empresa."""
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from ..services.security import es_usuario
+from ..services.exportacion import (
+    TABLAS_EXPORTABLES, FORMATOS_EXPORTACION, esquema_arrow, consulta_exportacion, lotes_exportacion, exportar
+)
+
+router = APIRouter(prefix="/export", tags=["Exportación"])
+
+
+@router.get("/{tabla}.{formato}")
+def exportar_tabla(
+    tabla: str,
+    formato: str,
+    anio: Optional[int] = Query(None, description="Filtra por el año de la fecha principal de la tabla"),
+    proyecto: Optional[str] = Query(None, description="Filtra por proyecto / desarrollo"),
+    user: dict = Depends(es_usuario)
+):
+    """
+    Tabla completa en Parquet o Arrow (IPC), con DECIMAL y DATE tipados.
+    Para BI y hojas de cálculo: más chico y más rápido de leer que /datos/* en JSON.
+    """
+    if tabla not in TABLAS_EXPORTABLES:
+        raise HTTPException(status_code=404, detail=f"Tabla no exportable: {tabla}")
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}. Use parquet o arrow")
+
+    try:
+        esquema = esquema_arrow(tabla)
+        sql, params = consulta_exportacion(tabla, esquema, anio, proyecto)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error leyendo el esquema de {tabla}: {str(e)}")
+
+    # Endpoint síncrono (ya corre en el threadpool): la consulta y el primer batch van antes de los encabezados
+    try:
+        lotes = lotes_exportacion(sql, params, esquema)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exportando {tabla}: {str(e)}")
+
+    nombre = f"{tabla}{f'_{anio}' if anio else ''}.{formato}"
+    return StreamingResponse(
+        exportar(tabla, formato, esquema, lotes),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
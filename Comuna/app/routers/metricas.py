@@ -0,0 +1,20 @@
+import os
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+from typing import Optional
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+router = APIRouter(tags=["Métricas"])
+
+# Prometheus manda "Authorization: Bearer <METRICS_TOKEN>"; sin token configurado /metrics no existe
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@router.get("/metrics", include_in_schema=False)
+def metricas(authorization: Optional[str] = Header(None)):
+    """Formato de texto de Prometheus: HTTP, pool de MySQL, APIs externas, barridos y sync."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
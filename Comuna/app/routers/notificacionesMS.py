@@ -2,20 +2,27 @@ import os
 import requests
 import re 
 from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Body
+from fastapi.responses import StreamingResponse, FileResponse
 from ..schemas import EmailSchema, PlantillaBase, PlantillaUpdate, ConfigUpdate,EmailManualSchema, PlantillaWAUpdate, PlantillaWABase, WhatsAppManualSchema, SwitchEtapasSchema, EmailFolioSchema, RecordatoriosUpdate, EmailClusterSchema, SearchboxExpedienteResponse, JuridicoBase, JuridicoUpdate
 from ..utils.datos_proveedores import get_komunah_data, set_wa_komunah_lote, set_email_komunah_lote, set_email_komunah_marketing, set_wa_komunah_marketing, get_folios_a_notificar_komunah, actualizar_switches_etapas, actualizar_switches_proyecto, get_estado_etapas_komunah, get_folios_deudores_komunah, get_folios_dinamico_komunah
 from urllib.parse import quote
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from sqlalchemy import text
 from zoneinfo import ZoneInfo
 import base64, json, time
-from typing import List, Optional, Union, Any
+from typing import List, Optional, Union, Any, Callable
 import hashlib
 from ..services.security import get_current_user, es_admin, es_super_admin, es_usuario
+from ..services.scheduler_control import reprogramar_barrido
+from ..services.jobs import job_manager, clasificar_canal
+from ..services.checkpoints import CheckpointEnvio, CorridaNoReanudable, ENTREGADO, LIMITADO
+from ..services.rate_limiter import enviar_con_limite, EnvioLimitado
+from ..services.respuestas import RespuestaJSONRapida
+from ..services.busqueda_expedientes import buscador_expedientes
+from ..services.metricas import contar_barrido
 from argparse import Namespace
-from ..models import Venta, Cliente
 from mailersend import MailerSendClient
  
 router = APIRouter(prefix="/v1/notificaciones", tags=["Motor Envios"])
@@ -276,6 +283,22 @@ class FirebaseRepository:
         except Exception:
             return defaults
     
+    def obtener_horario_recordatorios(self, empresa_id: str):
+        """Lectura ligera: solo hora y minuto (mask), sin traer el documento completo."""
+        url = (f"{self.base_url}/empresas/{empresa_id}/configuracion/recordatorios"
+               "?mask.fieldPaths=hora_recordatorio&mask.fieldPaths=minuto_recordatorio")
+        try:
+            resp = requests.get(url, headers=self.headers, timeout=5)
+            if resp.status_code != 200:
+                return None
+            f = resp.json().get("fields", {})
+            return (
+                int(f.get("hora_recordatorio", {}).get("integerValue", 10)),
+                int(f.get("minuto_recordatorio", {}).get("integerValue", 0))
+            )
+        except Exception:
+            return None
+
     def actualizar_config_recordatorios(self, empresa_id: str, datos: dict):
         """Recibe un diccionario y parchea solo los campos presentes en él."""
         url = f"{self.base_url}/empresas/{empresa_id}/configuracion/recordatorios"
@@ -343,8 +366,18 @@ class FirebaseRepository:
         url = f"{self.base_url}/empresas/{empresa_id}/plantillas_juridico/{doc_id}?{query_params}"
         return requests.patch(url, json={"fields": fields}, headers=self.headers, timeout=10)
 
+def _estado_checkpoint(status_code: int) -> str:
+    """Estado por destinatario: un 429 que no salió tras la espera máxima queda LIMITADO (se reintenta al reanudar)."""
+    if status_code in [200, 201, 202]:
+        return ENTREGADO
+    return LIMITADO if status_code == 429 else f"FALLO_{status_code}"
+
 class NotificationGateway:
-    """Maneja la comunicación pura con MailerSend."""
+    """
+    Maneja la comunicación pura con MailerSend y Respond.io.
+    Cada envío pasa por el rate limiter del proveedor: un 429 se reintenta hasta RATE_LIMIT_ESPERA_MAX.
+    Si el proveedor sigue limitando se regresa el 429 y el barrido lo marca LIMITADO para reintentarlo.
+    """
     @staticmethod
     def enviar_email(payload: dict):
         api_key = os.getenv("MAILERSEND_API_KEY")
@@ -354,7 +387,10 @@ class NotificationGateway:
             "Content-Type": "application/json"
         }
         
-        return requests.post(url, headers=headers, json=payload, timeout=10)
+        try:
+            return enviar_con_limite("mailersend", api_key, lambda: requests.post(url, headers=headers, json=payload, timeout=10))
+        except EnvioLimitado as e:
+            return e.respuesta
     
     @staticmethod
     def enviar_whatsapp(numero: str, template_name: str, language_code: str, parametros: list, texto_cuerpo: str = ""):
@@ -384,7 +420,10 @@ class NotificationGateway:
         }
         
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        return requests.post(url, headers=headers, json=payload, timeout=10)
+        try:
+            return enviar_con_limite("respondio", token, lambda: requests.post(url, headers=headers, json=payload, timeout=10))
+        except EnvioLimitado as e:
+            return e.respuesta
 
 class StaticNotificationUseCase:
     def __init__(self, gateway: NotificationGateway):
@@ -582,7 +621,15 @@ class NotificationUseCase:
         self.repo = repo
         self.gateway = gateway
 
-    def ejecutar_barrido_automatico(self, empresa_id: str, dias: int, categoria: str, db: Session, tipo: str = "normal"):
+    def ejecutar_barrido_automatico(self, empresa_id: str, dias: int, categoria: str, db: Session, tipo: str = "normal",
+                                    on_resultado: Optional[Callable] = None, checkpoint: Optional[CheckpointEnvio] = None,
+                                    fecha_objetivo: Optional[str] = None):
+        """
+        Si se manda on_resultado(evento, *resultados), cada destinatario se reporta ahí
+        (modo job) en lugar de acumularse en la respuesta.
+        Con checkpoint, se guarda el avance por lotes y se saltan folios/destinatarios ya entregados.
+        fecha_objetivo fija la fecha buscada (al reanudar, la de la corrida original).
+        """
         pack_empresa = PROVIDERS.get(empresa_id, {})
         extraer_datos = pack_empresa.get("get")
         if not extraer_datos:
@@ -590,11 +637,11 @@ class NotificationUseCase:
             raise HTTPException(status_code=400, detail=f"Empresa '{empresa_id}' no configurada.")
 
         config = self.repo.obtener_config_empresa(empresa_id)
-        sistema_email_ok = config.get("email")
-        sistema_wa_ok = config.get("whatsapp")
         
         if not config.get("proyecto"):
             self.repo.registrar_log_falla(empresa_id, f"Barrido cancelado: Proyecto desactivado en configuración global", "AUTO_BARRIDO")
+            if checkpoint:
+                checkpoint.finalizar("cancelado")
             return {"status": "off", "msj": "Proyecto desactivado"}
         
         docs_email = self.repo.query_categoria(empresa_id, categoria, "plantillas")
@@ -621,7 +668,7 @@ class NotificationUseCase:
                 "texto_base": f_wa.get("mensaje", {}).get("stringValue", ""),
                 "variables": [v.get("stringValue") for v in f_wa.get("variables", {}).get("arrayValue", {}).get("values", [])]
             }
-        fecha_t = (datetime.now(ZoneInfo("America/Mexico_City")) + timedelta(days=dias)).strftime('%Y-%m-%d')
+        fecha_t = fecha_objetivo or self.fecha_objetivo(dias)
         try:
             if tipo == "deudores":
                 registros = pack_empresa.get("get_deudores")(db, fecha_t)
@@ -631,21 +678,40 @@ class NotificationUseCase:
             self.repo.registrar_log_falla(empresa_id, f"Error SQL: {str(e)}", "DATABASE")
             raise
         
+        sistema_email_ok = config.get("email")
+        sistema_wa_ok = config.get("whatsapp")
         reporte_detallado = []
+        total_intentos = 0
 
         for row in registros:
+            if checkpoint and checkpoint.folio_completo(row):
+                if on_resultado:
+                    on_resultado({"folio": row, "estado": "YA_COMPLETO"}, "omitidos")
+                continue
+
             data_sql = extraer_datos(row, db)
             
 
             if not data_sql:
                 self.repo.registrar_log_falla(empresa_id, f"El folio {row} no trajo info de SQL", "DATOS_SQL")
+                contar_barrido("folio", "SIN_DATOS_SQL")
+                if on_resultado:
+                    on_resultado({"folio": row, "estado": "SIN_DATOS_SQL"}, "omitidos")
+                if checkpoint:
+                    checkpoint.terminar_folio(row)
                 continue
 
             if data_sql.get("{sys.etapa_activa}") == "0":
                 motivo = data_sql.get("{sys.bloqueo_motivo}", "Bloqueo por configuración de Etapa/Proyecto")
                 self.repo.registrar_log_falla(empresa_id, f"Folio {row} saltado: {motivo}", "BLOQUEO_ADMINISTRATIVO")
+                contar_barrido("folio", "BLOQUEO_ADMINISTRATIVO")
+                if on_resultado:
+                    on_resultado({"folio": row, "estado": "BLOQUEO_ADMINISTRATIVO", "motivo": motivo}, "bloqueados")
+                if checkpoint:
+                    checkpoint.terminar_folio(row)
                 continue
             
+            folio_con_fallas = False
             for i in range(1, 7):
                 nombre = data_sql.get(f"{{c{i}.client_name}}")
                 if not nombre: continue
@@ -670,6 +736,8 @@ class NotificationUseCase:
                 elif not email:
                     self.repo.registrar_log_falla(empresa_id, f"Email omitido para {nombre}: No tiene correo registrado.", "DATA_MISSING")
                     resultado_envio["email"] = "NO_DATA"
+                elif checkpoint and checkpoint.ya_entregado(row, email, "email"):
+                    resultado_envio["email"] = "YA_ENTREGADO"
                 else:
                     lista_adjuntos = []
                     adjuntos_raw = p_email.get("adjuntos_url", {}).get("arrayValue", {}).get("values", [])
@@ -688,6 +756,9 @@ class NotificationUseCase:
                     })
                     if res_mail.status_code not in [200, 201, 202]:
                         self.repo.registrar_log_falla(empresa_id, f"Email falló ({res_mail.status_code}) para {email}", "MAIL_PROVIDER")
+                        folio_con_fallas = True
+                    if checkpoint:
+                        checkpoint.marcar(row, email, "email", _estado_checkpoint(res_mail.status_code))
                     resultado_envio["email"] = f"Status: {res_mail.status_code} | {res_mail.text[:100]}"
 
 
@@ -703,6 +774,8 @@ class NotificationUseCase:
                 elif not phone:
                     self.repo.registrar_log_falla(empresa_id, f"WA saltado para {nombre}: Falta número de teléfono.", "DATA_MISSING")
                     resultado_envio["wa"] = "NO_PHONE"
+                elif checkpoint and checkpoint.ya_entregado(row, phone, "wa"):
+                    resultado_envio["wa"] = "YA_ENTREGADO"
                 else:
 
                     parametros_dinamicos = []
@@ -725,15 +798,30 @@ class NotificationUseCase:
                     res_wa = self.gateway.enviar_whatsapp(num_wa, p_wa["id_respond"], p_wa["lenguaje"], parametros_dinamicos, texto_cuerpo=texto_completo)
                     if res_wa.status_code not in [200, 201, 202]:
                         self.repo.registrar_log_falla(empresa_id, f"WhatsApp falló ({res_wa.status_code}) para {phone}", "WA_PROVIDER")
+                        folio_con_fallas = True
+                    if checkpoint:
+                        checkpoint.marcar(row, phone, "wa", _estado_checkpoint(res_wa.status_code))
                     resultado_envio["wa"] = f"Status: {res_wa.status_code}"
 
-                reporte_detallado.append(resultado_envio)
+                total_intentos += 1
+                contar_barrido("email", resultado_envio["email"])
+                contar_barrido("whatsapp", resultado_envio["wa"])
+                if on_resultado:
+                    on_resultado(resultado_envio, clasificar_canal(resultado_envio["email"]), clasificar_canal(resultado_envio["wa"]))
+                else:
+                    reporte_detallado.append(resultado_envio)
+
+            if checkpoint:
+                checkpoint.terminar_folio(row, completo=not folio_con_fallas)
 
+        if checkpoint:
+            checkpoint.finalizar()
 
         return {
             "status": "proceso_finalizado",
             "fecha_buscada": fecha_t,
-            "total_intentos": len(reporte_detallado),
+            "run_id": checkpoint.run_id if checkpoint else None,
+            "total_intentos": total_intentos,
             "reporte": reporte_detallado,
             "DEBUG": {
                 "plantilla_email_activa": p_email is not None,
@@ -744,6 +832,40 @@ class NotificationUseCase:
     
     
 
+    @staticmethod
+    def fecha_objetivo(dias: int) -> str:
+        return (datetime.now(ZoneInfo("America/Mexico_City")) + timedelta(days=dias)).strftime('%Y-%m-%d')
+
+    def ejecutar_barrido_reanudable(self, empresa_id: str, dias: int, categoria: str, db: Session, tipo: str = "normal",
+                                    on_resultado: Optional[Callable] = None):
+        """Barrido con checkpoint nuevo. Si no se puede abrir el checkpoint, el barrido corre igual."""
+        fecha_t = self.fecha_objetivo(dias)
+        try:
+            checkpoint = CheckpointEnvio.nueva("barrido", empresa_id, {
+                "dias": dias, "categoria": categoria, "tipo": tipo, "fecha_buscada": fecha_t
+            })
+        except Exception as e:
+            self.repo.registrar_log_falla(empresa_id, f"Barrido sin checkpoint: {str(e)[:200]}", "CHECKPOINT")
+            checkpoint = None
+        try:
+            return self.ejecutar_barrido_automatico(empresa_id, dias, categoria, db, tipo, on_resultado, checkpoint, fecha_t)
+        except Exception:
+            if checkpoint:
+                checkpoint.guardar("interrumpido")
+            raise
+
+    def reanudar_barrido(self, checkpoint: CheckpointEnvio, db: Session, on_resultado: Optional[Callable] = None):
+        """Retoma una corrida con su misma fecha buscada, saltando lo ya entregado."""
+        p = checkpoint.parametros
+        try:
+            return self.ejecutar_barrido_automatico(
+                checkpoint.empresa_id, p["dias"], p["categoria"], db, p.get("tipo", "normal"),
+                on_resultado, checkpoint, p["fecha_buscada"]
+            )
+        except Exception:
+            checkpoint.guardar("interrumpido")
+            raise
+
     def _limpiar(self, texto, vars, nombre, email_persona, tel_persona):
         texto = texto.replace("{cliente}", nombre)
         texto = texto.replace("{email_cliente}", str(email_persona))
@@ -798,7 +920,14 @@ class StaticEmailClusterUseCase:
         # Inicializamos el cliente de MailerSend para el envío masivo
         self.ms = MailerSendClient()
 
-    def ejecutar_proceso_cluster(self, empresa_id: str, datos: Any, db: Session):
+    def ejecutar_proceso_cluster(self, empresa_id: str, datos: Any, db: Session, on_resultado: Optional[Callable] = None,
+                                 on_bloque: Optional[Callable] = None, checkpoint: Optional[CheckpointEnvio] = None):
+        """
+        Los correos se mandan en bloques de 500 conforme se arman, sin juntar toda la campaña en RAM.
+        on_resultado(evento, *resultados) y on_bloque(cantidad, ok) se usan en modo job: ahí un bloque
+        fallido se cuenta y se sigue con el resto. Sin on_bloque (llamada síncrona) el error se propaga.
+        Con checkpoint, cada bloque enviado queda registrado y al reanudar se salta lo ya entregado.
+        """
         pack_empresa = PROVIDERS.get(empresa_id, {})
         buscador_dinamico = pack_empresa.get("get_folios_por_cluster")
         
@@ -814,21 +943,66 @@ class StaticEmailClusterUseCase:
         excluir_nombres = {str(n).lower().strip() for n in (datos.excluir_clientes or [])}
 
         reporte_global = []
-        conteo = {"exitosos": 0, "bloqueados_sys": 0, "omitidos_user": 0, "excluidos_manual": 0}
+        conteo = {"exitosos": 0, "bloqueados_sys": 0, "omitidos_user": 0, "excluidos_manual": 0, "fallidos_envio": 0}
         procesador = NotificationUseCase(self.repo, self.gateway)
 
         # Preparar la cola para el envío masivo
         cola_bulk_moderna = []
+        destinos_en_cola = []       # (folio, email) de cada correo en la cola
+        folios_por_confirmar = []   # folios ya recorridos cuyos correos siguen en la cola
+        folios_fallidos = set()     # folios con algún correo en un bloque que falló
+
+        def _enviar_cola():
+            bloque = list(cola_bulk_moderna)
+            cola_bulk_moderna.clear()
+            error = None
+            try:
+                enviar_con_limite("mailersend_bulk", os.getenv("MAILERSEND_API_KEY"), lambda: self.ms.emails.send_bulk(bloque))
+                ok = True
+                conteo["exitosos"] += len(bloque)
+            except Exception as e:
+                ok = False
+                error = e
+                conteo["fallidos_envio"] += len(bloque)
+            estado_fallo = LIMITADO if isinstance(error, EnvioLimitado) else "FALLO_BULK"
+            if error is not None:
+                self.repo.registrar_log_falla(empresa_id, f"Envío bulk de cluster falló ({len(bloque)} correos): {str(error)[:200]}", "MAIL_PROVIDER")
+            if checkpoint:
+                for folio_d, email_d in destinos_en_cola:
+                    checkpoint.marcar(folio_d, email_d, "email", ENTREGADO if ok else estado_fallo)
+                    if not ok:
+                        folios_fallidos.add(folio_d)
+                for folio_d in folios_por_confirmar:
+                    checkpoint.terminar_folio(folio_d, completo=folio_d not in folios_fallidos)
+                checkpoint.guardar()
+            destinos_en_cola.clear()
+            folios_por_confirmar.clear()
+            if on_bloque:
+                on_bloque(len(bloque), ok)
+            elif error is not None:
+                raise error
 
         for f in folios_brutos:
             f_str = str(f).strip()
+            if checkpoint and checkpoint.folio_completo(f_str):
+                if on_resultado:
+                    on_resultado({"folio": f_str, "estado": "YA_COMPLETO"}, "omitidos")
+                continue
             if f_str in excluir_folios:
                 conteo["excluidos_manual"] += 1
+                if on_resultado:
+                    on_resultado({"folio": f_str, "estado": "EXCLUIDO_MANUAL"}, "omitidos")
+                if checkpoint:
+                    checkpoint.terminar_folio(f_str)
                 continue
 
             data_sql = get_komunah_data(f_str, db)
             if data_sql.get("{sys.etapa_activa}") == "0":
                 conteo["bloqueados_sys"] += 1
+                if on_resultado:
+                    on_resultado({"folio": f_str, "estado": "BLOQUEO_ADMINISTRATIVO", "motivo": data_sql.get("{sys.bloqueo_motivo}")}, "bloqueados")
+                if checkpoint:
+                    checkpoint.terminar_folio(f_str)
                 continue
 
             clientes_lote = []
@@ -846,14 +1020,19 @@ class StaticEmailClusterUseCase:
                 if not nombre or not email: continue
                 if nombre.lower().strip() in excluir_nombres or email.lower().strip() in excluir_emails:
                     conteo["excluidos_manual"] += 1
+                    if on_resultado:
+                        on_resultado({"folio": f_str, "cliente": nombre, "email": email, "estado": "EXCLUIDO_MANUAL"}, "omitidos")
                     continue
 
                 # Limpieza con tus etiquetas {cliente}, {cl.monto}, etc.
                 asunto_final = procesador._limpiar(datos.asunto, data_sql, nombre, email, phone)
                 html_final = procesador._limpiar(datos.contenido_html, data_sql, nombre, email, phone)
 
+                # Si ya salió en una corrida anterior, no se repite
+                if checkpoint and checkpoint.ya_entregado(f_str, email, "email"):
+                    estado = "YA_ENTREGADO"
                 # Si es envío REAL y tiene permiso, armamos el objeto para la cola
-                if not datos.simular and permiso:
+                elif not datos.simular and permiso:
                     email_obj = {
                         "from": {"email": datos.remitente, "name": f"Notificaciones {empresa_id.capitalize()}"},
                         "to": [{"email": email, "name": nombre}],
@@ -863,23 +1042,72 @@ class StaticEmailClusterUseCase:
                         "reply_to": {"email": datos.reply_to} if datos.reply_to else None
                     }
                     cola_bulk_moderna.append(email_obj)
-                    conteo["exitosos"] += 1
+                    destinos_en_cola.append((f_str, email))
+                    if len(cola_bulk_moderna) >= 500:
+                        _enviar_cola()
+                    estado = "EN_COLA"
                 elif datos.simular:
                     conteo["exitosos"] += 1
+                    estado = "SIMULADO"
+                else:
+                    conteo["omitidos_user"] += 1
+                    estado = "LOTE_OFF"
 
-                clientes_lote.append({"cliente": nombre, "email": email, "status": "OK"})
+                if on_resultado:
+                    # Los EN_COLA se cuentan como enviados cuando su bloque sale (on_bloque)
+                    contador = {"SIMULADO": "enviados", "LOTE_OFF": "bloqueados", "YA_ENTREGADO": "omitidos"}.get(estado)
+                    on_resultado({"folio": f_str, "cliente": nombre, "email": email, "estado": estado}, contador)
+                else:
+                    # Sin on_bloque un bloque fallido propaga el error: si se llega al final, lo encolado salió
+                    clientes_lote.append({"cliente": nombre, "email": email, "status": "ENVIADO" if estado == "EN_COLA" else estado})
 
             if clientes_lote:
                 reporte_global.append({"folio": f_str, "clientes": clientes_lote})
 
-        
+            if checkpoint:
+                # El folio se confirma hasta que sus correos salgan en un bloque
+                if any(folio_d == f_str for folio_d, _ in destinos_en_cola):
+                    folios_por_confirmar.append(f_str)
+                else:
+                    checkpoint.terminar_folio(f_str, completo=f_str not in folios_fallidos)
+
         if not datos.simular and cola_bulk_moderna:
-            for i in range(0, len(cola_bulk_moderna), 500):
-                bloque = cola_bulk_moderna[i:i + 500]
-                self.ms.emails.send_bulk(bloque)
-                time.sleep(0.5)
+            _enviar_cola()
+        if checkpoint:
+            checkpoint.finalizar()
+
+        return {"modo": "SIMULACION" if datos.simular else "REAL", "run_id": checkpoint.run_id if checkpoint else None,
+                "resumen": conteo, "detalles": reporte_global}
+
+    def ejecutar_cluster_reanudable(self, empresa_id: str, config: dict, db: Session,
+                                    on_resultado: Optional[Callable] = None, on_bloque: Optional[Callable] = None):
+        """
+        Envío de cluster con checkpoint nuevo. Se guarda la configuración completa (adjuntos incluidos)
+        para poder reanudar. Las simulaciones no abren checkpoint.
+        """
+        checkpoint = None
+        if not config.get("simular"):
+            try:
+                checkpoint = CheckpointEnvio.nueva("cluster", empresa_id, config)
+            except Exception as e:
+                self.repo.registrar_log_falla(empresa_id, f"Cluster sin checkpoint: {str(e)[:200]}", "CHECKPOINT")
+        try:
+            return self.ejecutar_proceso_cluster(empresa_id, Namespace(**config), db, on_resultado, on_bloque, checkpoint)
+        except Exception:
+            if checkpoint:
+                checkpoint.guardar("interrumpido")
+            raise
 
-        return {"modo": "SIMULACION" if datos.simular else "REAL", "resumen": conteo, "detalles": reporte_global}
+    def reanudar_cluster(self, checkpoint: CheckpointEnvio, db: Session,
+                         on_resultado: Optional[Callable] = None, on_bloque: Optional[Callable] = None):
+        """Retoma un envío de cluster con la configuración original, saltando lo ya entregado."""
+        try:
+            return self.ejecutar_proceso_cluster(
+                checkpoint.empresa_id, Namespace(**checkpoint.parametros), db, on_resultado, on_bloque, checkpoint
+            )
+        except Exception:
+            checkpoint.guardar("interrumpido")
+            raise
 
 @router_crud.get("/{empresa_id}/conteo/{categoria}")
 def api_contar_plantillas(empresa_id: str, categoria: str,user: dict = Depends(es_admin)):
@@ -1188,7 +1416,28 @@ def api_disparar_barrido(
     repo = FirebaseRepository()
     gateway = NotificationGateway()
     use_case = NotificationUseCase(repo, gateway)
-    return use_case.ejecutar_barrido_automatico(empresa_id, dias, categoria, db, tipo=tipo)
+    return use_case.ejecutar_barrido_reanudable(empresa_id, dias, categoria, db, tipo=tipo)
+
+
+@router.post("/auto-notificar/{empresa_id}/job", status_code=202, tags=["Motor Notificaciones"])
+def api_disparar_barrido_job(
+    empresa_id: str, 
+    dias: int, 
+    categoria: str,  
+    tipo: str = "normal",
+    user: dict = Depends(es_usuario)
+):
+    """Mismo barrido que /auto-notificar, pero en segundo plano. Regresa el job_id para seguir el avance."""
+    def _correr(job):
+        db = SessionLocal()
+        try:
+            use_case = NotificationUseCase(FirebaseRepository(), NotificationGateway())
+            return use_case.ejecutar_barrido_reanudable(empresa_id, dias, categoria, db, tipo=tipo, on_resultado=job.registrar)
+        finally:
+            db.close()
+
+    job = job_manager.lanzar("barrido", empresa_id, {"dias": dias, "categoria": categoria, "tipo": tipo}, _correr)
+    return job.a_dict()
 
 @router_wa.post("/{empresa_id}", status_code=201, tags=["CRUD WhatsApp"])
 def api_crear_plantilla_wa(empresa_id: str, p: PlantillaWABase, user: dict = Depends(es_admin)):
@@ -1479,7 +1728,12 @@ def api_actualizar_dias_recordatorio(
     if res.status_code != 200:
         raise HTTPException(status_code=res.status_code, detail=res.text)
 
-    return {"status": "ok", "msj": "Configuración actualizada", "campos": list(datos.dict(exclude_unset=True).keys())}
+    # El cron del barrido vive en este proceso: se ajusta al momento, sin esperar a Firestore
+    reprogramado = False
+    if empresa_id == "komunah" and (datos.hora is not None or datos.minuto is not None):
+        reprogramado = reprogramar_barrido(datos.hora, datos.minuto)
+
+    return {"status": "ok", "msj": "Configuración actualizada", "campos": list(datos.dict(exclude_unset=True).keys()), "cron_reprogramado": reprogramado}
 
 @router_globales.get("/config-recordatorios/{empresa_id}")
 def api_obtener_config_recordatorios(
@@ -1539,66 +1793,137 @@ async def api_proceso_cluster(
     config_final['adjuntos'] = adjuntos
 
     use_case = StaticEmailClusterUseCase(FirebaseRepository(), NotificationGateway())
-    return use_case.ejecutar_proceso_cluster(empresa_id, Namespace(**config_final), db)
+    return use_case.ejecutar_cluster_reanudable(empresa_id, config_final, db)
 
 
-@router.get("/busqueda-expedientes", response_model=List[SearchboxExpedienteResponse])
-def api_busqueda_expedientes(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    # 1. Filtramos activos: Diferente a 'Expirado' y 'Cancelado'
-    # Usamos notin_ para que Carlitos solo vea lo que está "vivo"
-    expedientes = db.query(Venta).filter(
-        Venta.estado_expediente.notin_(['Expirado', 'Cancelado', 'EXPIRADO', 'CANCELADO'])
-    ).all()
-    
-    resultado = []
+@router.post("/{empresa_id}/enviar-cluster/job", status_code=202)
+async def api_proceso_cluster_job(
+    empresa_id: str,
+    datos_json: str = Form(
+        default=json.dumps(EJEMPLO_FINAL, indent=2),
+        description="Pega el JSON con la configuración masiva"
+    ), 
+    archivos: Optional[List[UploadFile]] = File(None), 
+    user: dict = Depends(es_admin)
+):
+    """Mismo envío que /enviar-cluster, pero en segundo plano. Regresa el job_id para seguir el avance."""
+    try:
+        data_dict = json.loads(datos_json)
+        datos_validados = EmailClusterSchema(**data_dict)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en formato JSON: {str(e)}")
 
-    for v in expedientes:
-        coprops_nombres = []
-        ids_a_buscar = []
-        
-        # 2. Lógica de Integrantes (del 2 al 6)
-        # Revisamos si hay nombre y si hay ID para ir a buscar el correo
-        for i in range(2, 7):
-            nom_val = getattr(v, f"cliente_{i}")
-            id_val = getattr(v, f"id_cliente_{i}")
-
-            if nom_val and str(nom_val).strip() not in ["", "None", "NULL"]:
-                coprops_nombres.append(str(nom_val))
-                if id_val:
-                    try:
-                        # Limpiamos el ID por si viene como 1331.0
-                        ids_a_buscar.append(str(int(float(id_val))))
-                    except: pass
-
-        # 3. EL SALTO A LA TABLA CLIENTES: Traemos los correos reales
-        correos_list = []
-        if ids_a_buscar:
-            # Buscamos masivamente los correos de todos los IDs de este folio
-            clientes_query = db.query(Cliente.email).filter(Cliente.client_id.in_(ids_a_buscar)).all()
-            correos_list = [c.email for c in clientes_query if c.email]
-
-        # 4. Limpieza Canal de Ventas (Quitar la diagonal / y poner N/A)
-        canal = str(v.canal_ventas).strip() if v.canal_ventas else "N/A"
-        if canal in ["/", "NA", "", "None", "NULL"]:
-            canal = "N/A"
-
-        # 5. Armado del JSON para el Front
-        resultado.append({
-            "folio": str(v.folio),
-            "cliente_principal": str(v.cliente or "Sin Nombre"),
-            "conteo_copropietarios": len(coprops_nombres),
-            "nombres_copropietarios": coprops_nombres,
-            "correos_copropietarios": correos_list,
-            "proyecto": str(v.desarrollo or "N/A"),
-            "cluster": str(v.etapa or "N/A"),
-            "lote": str(v.numero or "N/A"),
-            "estatus_expediente": str(v.estado_expediente or "Activo"),
-            "m2": float(v.metros_cuadrados or 0.0),
-            "canal_ventas": canal,
-            "asesor": str(v.asesor or "N/A")
-        })
+    adjuntos = []
+    if archivos:
+        for f in archivos:
+            if f.filename:
+                adjuntos.append({
+                    "content": base64.b64encode(await f.read()).decode(),
+                    "filename": f.filename
+                })
 
-    return resultado
+    config_final = datos_validados.dict()
+    config_final['adjuntos'] = adjuntos
+
+    def _correr(job):
+        db = SessionLocal()
+        try:
+            use_case = StaticEmailClusterUseCase(FirebaseRepository(), NotificationGateway())
+            return use_case.ejecutar_cluster_reanudable(
+                empresa_id, config_final, db,
+                on_resultado=job.registrar,
+                on_bloque=lambda cantidad, ok: job.sumar("enviados" if ok else "fallidos", cantidad)
+            )
+        finally:
+            db.close()
+
+    parametros = {k: v for k, v in config_final.items() if k != "adjuntos"}
+    parametros["adjuntos"] = [a["filename"] for a in adjuntos]
+    job = job_manager.lanzar("cluster", empresa_id, parametros, _correr)
+    return job.a_dict()
+
+
+@router.get("/corridas/{empresa_id}", tags=["Jobs de Envío"])
+def api_listar_corridas(empresa_id: str, incompletas: bool = True, user: dict = Depends(es_admin)):
+    """Corridas con checkpoint. Por defecto solo las que no terminaron (candidatas a reanudar)."""
+    return CheckpointEnvio.listar(empresa_id, solo_incompletas=incompletas)
+
+
+@router.post("/corridas/{run_id}/reanudar", status_code=202, tags=["Jobs de Envío"])
+def api_reanudar_corrida(run_id: str, user: dict = Depends(es_admin)):
+    """Retoma una corrida desde su checkpoint como job: solo se envía a quien no se le entregó."""
+    try:
+        checkpoint = CheckpointEnvio.cargar(run_id)
+    except CorridaNoReanudable as e:
+        raise HTTPException(status_code=409, detail=f"No se puede reanudar: la corrida está '{e.estado}'")
+    if not checkpoint:
+        raise HTTPException(status_code=404, detail="Corrida no encontrada")
+
+    def _correr(job):
+        db = SessionLocal()
+        try:
+            if checkpoint.tipo == "cluster":
+                use_case = StaticEmailClusterUseCase(FirebaseRepository(), NotificationGateway())
+                return use_case.reanudar_cluster(
+                    checkpoint, db,
+                    on_resultado=job.registrar,
+                    on_bloque=lambda cantidad, ok: job.sumar("enviados" if ok else "fallidos", cantidad)
+                )
+            use_case = NotificationUseCase(FirebaseRepository(), NotificationGateway())
+            return use_case.reanudar_barrido(checkpoint, db, on_resultado=job.registrar)
+        finally:
+            db.close()
+
+    parametros = {k: v for k, v in checkpoint.parametros.items() if k != "adjuntos"}
+    parametros["run_id"] = run_id
+    job = job_manager.lanzar(checkpoint.tipo, checkpoint.empresa_id, parametros, _correr)
+    return job.a_dict()
+
+
+def _obtener_job_o_404(job_id: str):
+    job = job_manager.obtener(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado en esta instancia")
+    return job
+
+
+@router.get("/jobs/{job_id}", tags=["Jobs de Envío"])
+def api_estado_job(job_id: str, user: dict = Depends(es_usuario)):
+    return _obtener_job_o_404(job_id).a_dict()
+
+
+@router.get("/jobs/{job_id}/stream", tags=["Jobs de Envío"])
+def api_stream_job(job_id: str, formato: str = "ndjson", user: dict = Depends(es_usuario)):
+    """Avance en vivo: una línea por destinatario con los contadores acumulados y una línea final tipo 'fin'."""
+    if formato not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="formato debe ser 'ndjson' o 'sse'")
+    job = _obtener_job_o_404(job_id)
+    media = "text/event-stream" if formato == "sse" else "application/x-ndjson"
+    return StreamingResponse(job_manager.seguir(job, formato), media_type=media)
+
+
+@router.get("/jobs/{job_id}/reporte", tags=["Jobs de Envío"])
+def api_descargar_reporte_job(job_id: str, user: dict = Depends(es_usuario)):
+    job = _obtener_job_o_404(job_id)
+    return FileResponse(job.ruta_reporte, media_type="application/x-ndjson", filename=f"reporte_{job.tipo}_{job.id}.ndjson")
+
+
+@router.get("/busqueda-expedientes", response_model=List[SearchboxExpedienteResponse])
+def api_busqueda_expedientes(
+    q: Optional[str] = None,
+    limite: int = 20,
+    user: dict = Depends(es_usuario)
+):
+    """
+    Expedientes activos (distintos de 'Expirado' y 'Cancelado') con copropietarios y sus correos.
+    Sin `q` regresa la lista completa; con `q` solo los `limite` mejores resultados
+    (folio, cliente, copropietarios, lote, cluster y asesor; tolera typos).
+    """
+    indice = buscador_expedientes.indice()
+    if q and q.strip():
+        return RespuestaJSONRapida(indice.buscar(q, max(1, min(limite, 200))))
+    # Cada campo ya va convertido al tipo de SearchboxExpedienteResponse
+    return RespuestaJSONRapida(indice.expedientes)
 
 router_juridico = APIRouter(prefix="/v1/plantillas-juridico", tags=["CRUD Jurídico"])
 
@@ -1,14 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import text, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
 from typing import List, Optional
 import re
-from ..database import get_db
+from ..database import get_read_db, get_async_db, lee_de_replica
 from .. import schemas
 from datetime import datetime
 from typing import Any, Dict 
 from ..services.security import get_current_user, es_admin, es_usuario
-from ..models import Venta, Pago
+from ..services.respuestas import RespuestaJSONRapida, RespuestaJSONNumerica, llaves_schema
+import os
+from types import SimpleNamespace
+from ..services.cache_datos import CacheRespuestas, generacion_datos
+import numpy as np
+import pandas as pd
 
 router = APIRouter(prefix="/reportes", tags=["Reportes Financieros"])
 
@@ -17,114 +23,125 @@ def extraer_numeros_finales(valor: Optional[str]) -> str:
     match = re.search(r"(\d+)\s*$", texto)
     return match.group(1) if match else ""
 
+ANIO_INICIO_REPORTES = 2021
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio",
+         "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+
+def _anios_reporte() -> List[int]:
+    return list(range(ANIO_INICIO_REPORTES, datetime.now().year + 1))
+
+def _folio_entero(folio):
+    """FOLIO es texto en ventas; los schemas con folio int lo reciben convertido (como haría Pydantic)."""
+    texto = str(folio).strip() if folio is not None else ""
+    return int(texto) if texto.isdigit() else folio
+
 @router.get("/pagos-historico", response_model=List[schemas.ConciliacionClienteResponse])
-def get_conciliacion_clientes(anio: Optional[int] = None, folio: Optional[str] = None, db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
+async def get_conciliacion_clientes(anio: Optional[int] = None, folio: Optional[str] = None, db: AsyncSession = Depends(get_async_db), user: dict = Depends(es_usuario)):
 
     if anio:
         folio = None 
     elif not folio:
         raise HTTPException(status_code=400, detail="¿Te falla o qué? Debes proporcionar el Año o el Folio.")
-   
-    col = "p.`Fecha del comprobante de pago`"
-    bus_anio = f"%{anio}%" if anio else None
+
+    # Sale del cubo pagos_mensuales (lo arma la sync): ya viene sumado por folio x año x mes
+    filtro = "AND m.anio = :anio_val" if anio else "AND m.folio = :folio_val"
+    sql_meses = ",\n".join(
+        f"SUM(CASE WHEN m.mes = {i} THEN m.monto_activo ELSE 0 END) as {nombre}"
+        for i, nombre in enumerate(MESES, start=1)
+    )
     query = text(f"""
         SELECT 
             v.FOLIO as FOLIO,
             v.`DESARROLLO` as PROYECTO,
             NULL as `FECHA PROMESA`,
-            p.`Cliente` as `NOMBRE CLIENTE`,
+            m.cliente as `NOMBRE CLIENTE`,
             v.`NÚMERO` as LOTE,
             v.`ETAPA` as CLUSTER,
             v.`METROS CUADRADOS` as M2,
             v.`PRECIO DE LISTA` as `PRECIO LISTA`,
-            YEAR(p.`Fecha del comprobante de pago`) as AÑO,
-            SUM(CASE WHEN ({col} LIKE '%-01-%' OR {col} LIKE '%/01/%') THEN p.`Monto pagado` ELSE 0 END) as enero,
-            SUM(CASE WHEN ({col} LIKE '%-02-%' OR {col} LIKE '%/02/%') THEN p.`Monto pagado` ELSE 0 END) as febrero,
-            SUM(CASE WHEN ({col} LIKE '%-03-%' OR {col} LIKE '%/03/%') THEN p.`Monto pagado` ELSE 0 END) as marzo,
-            SUM(CASE WHEN ({col} LIKE '%-04-%' OR {col} LIKE '%/04/%') THEN p.`Monto pagado` ELSE 0 END) as abril,
-            SUM(CASE WHEN ({col} LIKE '%-05-%' OR {col} LIKE '%/05/%') THEN p.`Monto pagado` ELSE 0 END) as mayo,
-            SUM(CASE WHEN ({col} LIKE '%-06-%' OR {col} LIKE '%/06/%') THEN p.`Monto pagado` ELSE 0 END) as junio,
-            SUM(CASE WHEN ({col} LIKE '%-07-%' OR {col} LIKE '%/07/%') THEN p.`Monto pagado` ELSE 0 END) as julio,
-            SUM(CASE WHEN ({col} LIKE '%-08-%' OR {col} LIKE '%/08/%') THEN p.`Monto pagado` ELSE 0 END) as agosto,
-            SUM(CASE WHEN ({col} LIKE '%-09-%' OR {col} LIKE '%/09/%') THEN p.`Monto pagado` ELSE 0 END) as septiembre,
-            SUM(CASE WHEN ({col} LIKE '%-10-%' OR {col} LIKE '%/10/%') THEN p.`Monto pagado` ELSE 0 END) as octubre,
-            SUM(CASE WHEN ({col} LIKE '%-11-%' OR {col} LIKE '%/11/%') THEN p.`Monto pagado` ELSE 0 END) as noviembre,
-            SUM(CASE WHEN ({col} LIKE '%-12-%' OR {col} LIKE '%/12/%') THEN p.`Monto pagado` ELSE 0 END) as diciembre,
-            SUM(p.`Monto pagado`) as TOTAL_ANIO
-        FROM ventas v
-        INNER JOIN pagos p ON v.FOLIO = p.`Folio de la venta`
-        WHERE p.`Estatus` = 'active'
-          AND p.`Método de pago` != 'Nota de Crédito'
-          AND p.`Cliente` IS NOT NULL
-          AND p.`Cliente` != ''
-          AND {col} IS NOT NULL 
-          AND {col} != ''
-          AND (:anio_val IS NULL OR {col} LIKE :bus_anio)
-          AND (:folio_val IS NULL OR v.FOLIO = :folio_val)
-        GROUP BY v.FOLIO, p.`Cliente`, AÑO
-        ORDER BY p.`Cliente` ASC
+            m.anio as AÑO,
+            {sql_meses},
+            SUM(m.monto_activo) as TOTAL_ANIO
+        FROM pagos_mensuales m
+        INNER JOIN ventas v ON v.FOLIO = m.folio
+        WHERE m.metodo_pago != 'Nota de Crédito'
+          AND m.cliente IS NOT NULL
+          AND m.cliente != ''
+          {filtro}
+        GROUP BY v.FOLIO, m.cliente, m.anio
+        ORDER BY m.cliente ASC
     """)
 
     try:
-        result = db.execute(query, {"anio_val": anio, "bus_anio": bus_anio, "folio_val": folio})
-        return result.mappings().all()
+        result = await db.execute(query, {"anio_val": anio, "folio_val": folio})
+        # Los alias del SELECT ya son las llaves de ConciliacionClienteResponse: sin revalidar fila por fila
+        return RespuestaJSONNumerica([dict(r) for r in result.mappings()])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @router.get("/pagos-historico-anual", response_model=List[Dict[str, Any]])
-def get_conciliacion_anual(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    anio_inicio = 2021
-    anio_actual = datetime.now().year 
-    anios = list(range(anio_inicio, anio_actual + 1))
-    
-    col_fecha = "p.`Fecha del comprobante de pago`"
-    
-    sql_anios = ""
-    for anio in anios:
-        sql_anios += f"""
-            SUM(CASE WHEN {col_fecha} LIKE '%{anio}%' THEN p.`Monto pagado` ELSE 0 END) as `{anio}`,"""
+def get_conciliacion_anual(db: Session = Depends(get_read_db), user: dict = Depends(es_usuario)):
+    anios = _anios_reporte()
 
-    query = text(f"""
+    # Una fila por (folio, cliente, año) desde pagos_mensuales; las columnas por año se arman aquí
+    query = text("""
         SELECT 
             v.FOLIO as FOLIO,
             v.`DESARROLLO` as PROYECTO,
-            NULL as `FECHA PROMESA`,
-            p.`Cliente` as `NOMBRE CLIENTE`,
+            m.cliente as `NOMBRE CLIENTE`,
             v.`NÚMERO` as LOTE,
             v.`ETAPA` as CLUSTER,
             v.`METROS CUADRADOS` as M2,
             v.`PRECIO DE LISTA` as `PRECIO_LISTA`,
-            {sql_anios}
-            SUM(p.`Monto pagado`) as TOTAL_HISTORICO
-        FROM ventas v
-        INNER JOIN pagos p ON v.FOLIO = p.`Folio de la venta`
-        WHERE p.`Estatus` = 'active'
-            AND p.`Método de pago` != 'Nota de Crédito'
-            AND p.`Cliente` IS NOT NULL
-            AND p.`Cliente` != ''
-            AND {col_fecha} IS NOT NULL 
-            AND {col_fecha} != ''
-        GROUP BY v.FOLIO, p.`Cliente`
-        ORDER BY p.`Cliente` ASC
+            m.anio as anio,
+            SUM(m.monto_activo) as monto
+        FROM pagos_mensuales m
+        INNER JOIN ventas v ON v.FOLIO = m.folio
+        WHERE m.metodo_pago != 'Nota de Crédito'
+            AND m.cliente IS NOT NULL
+            AND m.cliente != ''
+        GROUP BY v.FOLIO, m.cliente, m.anio
+        ORDER BY m.cliente ASC
     """)
 
     try:
-        result = db.execute(query).mappings().all()
-        return result
+        filas = {}
+        for r in db.execute(query).mappings():
+            clave = (r["FOLIO"], r["NOMBRE CLIENTE"])
+            fila = filas.get(clave)
+            if fila is None:
+                fila = {
+                    "FOLIO": r["FOLIO"],
+                    "PROYECTO": r["PROYECTO"],
+                    "FECHA PROMESA": None,
+                    "NOMBRE CLIENTE": r["NOMBRE CLIENTE"],
+                    "LOTE": r["LOTE"],
+                    "CLUSTER": r["CLUSTER"],
+                    "M2": r["M2"],
+                    "PRECIO_LISTA": r["PRECIO_LISTA"],
+                    **{str(a): 0 for a in anios},
+                    "TOTAL_HISTORICO": 0,
+                }
+                filas[clave] = fila
+            monto = r["monto"] or 0
+            if r["anio"] in anios:
+                fila[str(r["anio"])] += monto
+            fila["TOTAL_HISTORICO"] += monto
+        return list(filas.values())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en reporte anual: {str(e)}")
     
 @router.get("/contabilidad", response_model=List[schemas.ComplementoPago])
-def get_complementos_pago(anio: Optional[int] = None, folio: Optional[str] = None, db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
+def get_complementos_pago(anio: Optional[int] = None, folio: Optional[str] = None, db: Session = Depends(get_read_db), user: dict = Depends(es_usuario)):
     try:
         if anio is None and folio is None:
             raise HTTPException(status_code=400, detail="Debe proporcionar el Año o el Folio.")
         
         if anio:
             folio = None
-      
-        col_fecha = "p.`Fecha del comprobante de pago`"
-        
+
+        # Pagos sin fecha siempre salen (contabilidad los tiene que revisar)
+        filtro = "(p.anio = :anio_val OR p.anio IS NULL)" if anio else "v.FOLIO = :folio_val"
         query = text(f"""
             SELECT 
                 v.CLIENTE, 
@@ -139,7 +156,8 @@ def get_complementos_pago(anio: Optional[int] = None, folio: Optional[str] = Non
                 p.`Fecha de aplicación de pago registro en sistema` as fecha_aplicacion,
 
                 (SELECT COUNT(*) FROM ventas v2 WHERE v2.CLIENTE = v.CLIENTE) as total_lotes,
-                COALESCE(p.`Fecha del comprobante de pago`, '') as fecha_pago_real,
+                p.`Fecha del comprobante de pago` as fecha_pago_real,
+                p.anio as anio,
                 COALESCE(p.`Folio de pago`, '') as folio_pago_real,
                 COALESCE(p.`Método de pago`, '') as metodo_real,
                 COALESCE(p.`Concepto de pago`, '') as concepto_real,
@@ -151,54 +169,52 @@ def get_complementos_pago(anio: Optional[int] = None, folio: Optional[str] = Non
             FROM pagos p
             -- INNER JOIN directo: Solo trae ventas que tengan pagos en el filtro
             INNER JOIN ventas v ON p.`Folio de la venta` = v.FOLIO
-            WHERE ({col_fecha} IS NULL 
-                    OR {col_fecha} = '' 
-                    OR {col_fecha} = 'NULL'
-                    OR (:anio_val IS NULL OR {col_fecha} LIKE :bus_anio))
-              AND (:folio_val IS NULL OR v.FOLIO = :folio_val) 
+            WHERE {filtro}
             ORDER BY v.CLIENTE ASC, p.`Fecha del comprobante de pago` ASC
         """)
         
         
         rows = db.execute(query, {
             "anio_val": anio, 
-            "bus_anio": f"%{anio}%" if anio else None, 
             "folio_val": folio
         }).mappings().all()
         
-        return [{
+        # Filas ya con los tipos y el orden de ComplementoPago: se serializan directo, sin Pydantic por fila
+        return RespuestaJSONNumerica([{
             "cliente": r["CLIENTE"],
             "pagador": r["PAGADOR"],
-            "fecha_pago": r["fecha_pago_real"],
-            "folio_venta": r["FOLIO_VENTA"],
+            "proyecto": r["proyecto_pago"],
+            "fecha_pago": str(r["fecha_pago_real"]) if r["fecha_pago_real"] else "",
+            "fecha_aplicacion": str(r["fecha_aplicacion"]) if r["fecha_aplicacion"] else None,
+            "folio_venta": _folio_entero(r["FOLIO_VENTA"]),
             "folio_pago": r["folio_pago_real"], 
             "metodo": r["metodo_real"],
             "concepto": r["concepto_real"],
+            "banco": r["banco"],
+            "num_pago": r["num_pago"],
+            "estatus_pago": r["estatus_pago"],
             "lote": r["LOTE"],
             "varios": True if r["total_lotes"] > 1 else False,
             "total": r["total_lotes"],
             "abono": float(r["monto_individual"]) * -1 if r["metodo_real"] == "Nota de Crédito" else float(r["monto_individual"]),
             "saldo": None,
-            "anio": int(str(r["fecha_pago_real"])[:4]) if r["fecha_pago_real"] and str(r["fecha_pago_real"])[:4].isdigit() else (int(str(r["fecha_pago_real"])[-4:]) if r["fecha_pago_real"] and str(r["fecha_pago_real"])[-4:].isdigit() else 0),
+            "anio": r["anio"] or 0,
             "id_pago": r["id_pago"],
             "id_flujo": r["id_flujo"],
             "estatus_flujo": r["estatus_flujo"],
-            "monto_flujo": r["monto_flujo"],
-
-            "proyecto": r["proyecto_pago"],
-            "num_pago": r["num_pago"],
-            "banco": r["banco"],
-            "estatus_pago": r["estatus_pago"],
-            "fecha_aplicacion": r["fecha_aplicacion"]
-        } for r in rows]
+            "monto_flujo": float(r["monto_flujo"]),
+        } for r in rows])
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en Contabilidad: {str(e)}")
 
+COLUMNAS_ANTIGUEDAD = ["01 A 30 DÍAS", "31 A 60 DÍAS", "61 A 90 DÍAS", "91 A 120 DÍAS", "MÁS DE 120 DÍAS"]
+LLAVES_ANTIGUEDAD = llaves_schema(schemas.AntigSaldosResponse) + ["anio"]
+
 @router.get("/antiguedad-completo",response_model=schemas.ReporteAntiguedadCompleto)
-def get_reporte_detallado(anio: Optional[int] = None, db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    busqueda = f"%{anio}%" if anio else None
-    query = text("""
+def get_reporte_detallado(anio: Optional[int] = None, db: Session = Depends(get_read_db), user: dict = Depends(es_usuario)):
+    filtro_anio = "AND a.`FECHA DE PAGO` BETWEEN :inicio_anio AND :fin_anio" if anio else ""
+    query = text(f"""
         SELECT 
             a.`FOLIO` as FOLIO, 
             a.`CLIENTE` as CLIENTE,
@@ -220,79 +236,43 @@ def get_reporte_detallado(anio: Optional[int] = None, db: Session = Depends(get_
             a.`CARTERA TOTAL` as `CARTERA TOTAL`,
             a.`TOTAL PAGADO` as `TOTAL PAGADO`,
             v.`ESTADO DEL EXPEDIENTE` as `ESTATUS PIPELINE`,
-            cv.`NÚMERO DE PARCIALIDADES VENCIDAS TOTALES` as `PARCIALIDADES_VENCIDAS_TOTALES`
+            cv.parcialidades_vencidas as `PARCIALIDADES_VENCIDAS_TOTALES`
             
         FROM antig_saldos a
         LEFT JOIN ventas v ON a.`FOLIO` = v.`FOLIO`
-        LEFT JOIN (
-            SELECT FOLIO, `NÚMERO DE PARCIALIDADES VENCIDAS TOTALES`
-            FROM (
-                SELECT 
-                    FOLIO, 
-                    `NÚMERO DE PARCIALIDADES VENCIDAS TOTALES`,
-                    ROW_NUMBER() OVER (
-                        PARTITION BY FOLIO 
-                        -- Ordenamos por cercanía a hoy (usando tus columnas Text)
-                        ORDER BY ABS(DATEDIFF(STR_TO_DATE(`FECHA DE PAGO`, '%d/%m/%Y'), CURDATE())) ASC
-                    ) as rank_fecha
-                FROM cartera_vencida
-            ) t WHERE rank_fecha = 1
-        ) cv ON a.`FOLIO` = cv.`FOLIO`
+        -- Fila más cercana a hoy por folio: la precalcula la sync / el job de medianoche
+        LEFT JOIN cartera_resumen cv ON cv.folio = a.`FOLIO`
         WHERE a.`FECHA DE PAGO` IS NOT NULL 
-          AND a.`FECHA DE PAGO` != ''
-          AND (:anio_val IS NULL OR a.`FECHA DE PAGO` LIKE :busqueda_anio)
+          {filtro_anio}
     """)
 
     try:
-        result = db.execute(query, {"anio_val": anio, "busqueda_anio": busqueda}).mappings().all()
-        
-    
-        t_vigente = 0.0
-        t_01_30 = 0.0
-        t_31_60 = 0.0
-        t_61_90 = 0.0
-        t_91_120 = 0.0
-        t_mas_120 = 0.0
-        t_mensualidades = 0
-        t_vencido = 0.0
-        t_cartera = 0.0
-
-        detalles = []
-        for row in result:
-            anio_real = int(str(row["FECHA DE PAGO"])[:4]) if row["FECHA DE PAGO"] and str(row["FECHA DE PAGO"])[:4].isdigit() else (int(str(row["FECHA DE PAGO"])[-4:]) if row["FECHA DE PAGO"] and str(row["FECHA DE PAGO"])[-4:].isdigit() else 0)
-            v01 = abs(float(row.get('01 A 30 DÍAS') or 0))
-            v31 = abs(float(row.get('31 A 60 DÍAS') or 0))
-            v61 = abs(float(row.get('61 A 90 DÍAS') or 0))
-            v91 = abs(float(row.get('91 A 120 DÍAS') or 0))
-            v120 = abs(float(row.get('MÁS DE 120 DÍAS') or 0))
-            
-            suma_vencido_2 = v01 + v31 + v61 + v91 + v120
-            fila_con_anio = {
-                **dict(row), 
-                "anio": anio_real, 
-                "TOTAL VENCIDO 2": suma_vencido_2,
-                "01 A 30 DÍAS": v01,      # <--- Obligas a que sea el positivo
-                "31 A 60 DÍAS": v31,
-                "61 A 90 DÍAS": v61,
-                "91 A 120 DÍAS": v91,
-                "MÁS DE 120 DÍAS": v120
-            }
-            
-            t_vigente += float(row.get('SALDO VIGENTE') or 0)
-            t_01_30 += v01
-            t_31_60 += v31
-            t_61_90 += v61
-            t_91_120 += v91
-            t_mas_120 += v120
-            t_vencido += float(row.get('TOTAL VENCIDO') or 0)
-            t_cartera += float(row.get('CARTERA TOTAL') or 0)
-            t_mensualidades += int(row.get('MENSUALIDADES VENCIDAS') or 0)
-            detalles.append(schemas.AntigSaldosResponse(**fila_con_anio))
-
-        if t_vencido == 0:
-            denominador = 1
-        else:
-            denominador = t_vencido
+        params = {"inicio_anio": f"{anio}-01-01", "fin_anio": f"{anio}-12-31"} if anio else {}
+        res = db.execute(query, params)
+        columnas = list(res.keys())
+        filas = res.all()
+        n = len(filas)
+        # Columnas completas (una lista por columna) para operar en bloque
+        datos = dict(zip(columnas, map(list, zip(*filas)))) if filas else {c: [] for c in columnas}
+
+        def numeros(columna):
+            return pd.to_numeric(pd.Series(datos[columna], dtype=object), errors="coerce").fillna(0).to_numpy(dtype=float)
+
+        # Buckets siempre en positivo, TOTAL VENCIDO 2 y año en una sola pasada
+        buckets = np.abs(np.column_stack([numeros(c) for c in COLUMNAS_ANTIGUEDAD])) if n else np.zeros((0, len(COLUMNAS_ANTIGUEDAD)))
+        for i, columna in enumerate(COLUMNAS_ANTIGUEDAD):
+            datos[columna] = buckets[:, i].tolist()
+        datos["TOTAL VENCIDO 2"] = buckets.sum(axis=1).tolist()
+        fechas = pd.to_datetime(pd.Series(datos["FECHA DE PAGO"], dtype=object), errors="coerce")
+        datos["anio"] = fechas.dt.year.fillna(0).astype(int).tolist()
+
+        t_01_30, t_31_60, t_61_90, t_91_120, t_mas_120 = (float(t) for t in buckets.sum(axis=0))
+        t_vigente = float(numeros("SALDO VIGENTE").sum())
+        t_vencido = float(numeros("TOTAL VENCIDO").sum())
+        t_cartera = float(numeros("CARTERA TOTAL").sum())
+        t_mensualidades = int(numeros("MENSUALIDADES VENCIDAS").astype(int).sum())
+
+        denominador = t_vencido if t_vencido != 0 else 1
 
         pct_01_30 = (t_01_30 / denominador) * 100
         pct_31_60 = (t_31_60 / denominador) * 100
@@ -306,7 +286,11 @@ def get_reporte_detallado(anio: Optional[int] = None, db: Session = Depends(get_
 
         riesgo_total = ((t_31_60 + t_61_90 + t_91_120 + t_mas_120) / denominador) * 100
 
-        return {
+        # Filas ya en las llaves/orden de AntigSaldosResponse: se serializan directo, sin Pydantic por fila
+        vacio = [None] * n
+        detalles = [dict(zip(LLAVES_ANTIGUEDAD, fila)) for fila in zip(*(datos.get(k, vacio) for k in LLAVES_ANTIGUEDAD))]
+
+        return RespuestaJSONRapida({
             "detalles": detalles,
             "total_vigente": t_vigente,
             "total_01_30": t_01_30,
@@ -328,18 +312,16 @@ def get_reporte_detallado(anio: Optional[int] = None, db: Session = Depends(get_
             "analisis_mas_120": round(analisis_mas_120, 2),
             "riesgo_total": round(riesgo_total, 2),
             "anio": anio
-        }
+        })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error procesando reporte: {str(e)}")
     
 @router.get("/pagos-fecha-nula", response_model=List[schemas.PagoResponse])
-def get_pagos_sin_fecha(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
+def get_pagos_sin_fecha(db: Session = Depends(get_read_db), user: dict = Depends(es_usuario)):
     query = text("""
         SELECT * FROM pagos
         WHERE `Fecha del comprobante de pago` IS NULL 
-           OR `Fecha del comprobante de pago` = ''
-           OR `Fecha del comprobante de pago` = 'NULL'
         ORDER BY Cliente ASC
     """)
 
@@ -350,21 +332,11 @@ def get_pagos_sin_fecha(db: Session = Depends(get_db), user: dict = Depends(es_u
         raise HTTPException(status_code=500, detail=f"Error al obtener pagos nulos: {str(e)}")
 
 @router.get("/reporte-expedientes-liquidados")
-def get_reporte_expedientes_liquidados(db: Session = Depends(get_db), user: dict = Depends(es_usuario)):
-    anio_inicio = 2021
-    anio_actual = datetime.now().year 
-    anios = list(range(anio_inicio, anio_actual + 1))
-    
-    col_fecha = "p.`Fecha del comprobante de pago`"
-    
-  
-    sql_anios_pagos = ""
-    sql_anios_anticipos = ""
-    for anio in anios:
-        sql_anios_pagos += f"SUM(CASE WHEN {col_fecha} LIKE '%{anio}%' AND p.`Método de pago` != 'Nota de Crédito' THEN p.`Monto pagado` ELSE 0 END) as `PAGOS {anio}`,"
-        sql_anios_anticipos += f"SUM(CASE WHEN {col_fecha} LIKE '%{anio}%' AND p.`Método de pago` != 'Nota de Crédito' THEN p.`Monto pagado` ELSE 0 END) as `Anticipo {anio}`,"
-        sql_anios_pagos += f"SUM(CASE WHEN {col_fecha} LIKE '%{anio}%' AND p.`Método de pago` = 'Nota de Crédito' THEN p.`Monto pagado` ELSE 0 END) as `NC {anio}`,"
-    query = text(f"""
+def get_reporte_expedientes_liquidados(db: Session = Depends(get_read_db), user: dict = Depends(es_usuario)):
+    anios = _anios_reporte()
+
+    # Una fila por (folio, año) desde pagos_mensuales; pagos/NC por año se reparten en columnas al armar la respuesta
+    query = text("""
         SELECT 
             v.FOLIO as FOLIO,
             v.`FECHA DE INICIO DE OPERACIÓN` as `INICIO_OPERACIONES`,
@@ -374,42 +346,79 @@ def get_reporte_expedientes_liquidados(db: Session = Depends(get_db), user: dict
             v.`NÚMERO` as LOTE,
             v.`METROS CUADRADOS` as M2,
             v.`CLIENTE` as CLIENTE,
-            NULL as `FECHA FIRMA`,
             v.`FECHA DE FINALIZACIÓN DE ENGANCHE` as `FECHA DE FINALIZACIÓN DE ENGANCHE`,
             v.`FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE` as `FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE`,
             v.`PRECIO FINAL` as `PRECIO FINAL`,
-            {sql_anios_pagos}
-            SUM(CASE WHEN p.`Método de pago` != 'Nota de Crédito' THEN p.`Monto pagado` ELSE 0 END) as `TOTAL PAGADO`,
-            (v.`PRECIO FINAL` - SUM(CASE WHEN p.`Método de pago` != 'Nota de Crédito' THEN p.`Monto pagado` ELSE 0 END)) as VALIDACION,
-            NULL as `COMENTARIO`,
-            {sql_anios_anticipos}
-            SUM(CASE WHEN p.`Método de pago` = 'Nota de Crédito' THEN 1 ELSE 0 END) as `CANTIDAD_TOTAL_NC`,
-            MAX(CASE WHEN p.`Método de pago` = 'Nota de Crédito' THEN 'SÍ' ELSE 'NO' END) as `ALERTA NOTA CRÉDITO`,
-            NULL as `% (anticipo)`,
-            NULL as `% aplicable (anticipo)`,
-            NULL as `Pago total 2023`,
-            NULL as `% (pago 2023)`,
-            NULL as `% aplicable (pago 2023)`,
-            NULL as `Pago total 2024`,
-            NULL as `% (pago 2024)`,
-            NULL as `% aplicable (pago 2024)`,
-            NULL as `Saldo 2023`
+            m.anio as anio,
+            SUM(m.monto_activo) as pagos,
+            SUM(m.monto_nc) as nc,
+            SUM(CASE WHEN m.metodo_pago = 'Nota de Crédito' THEN m.conteo ELSE 0 END) as cantidad_nc
         FROM ventas v
-        INNER JOIN pagos p ON v.FOLIO = p.`Folio de la venta`
-        WHERE p.`Estatus` = 'active'
-            AND v.`ESTADO DEL EXPEDIENTE` IN (
+        INNER JOIN pagos_mensuales m ON m.folio = v.FOLIO
+        WHERE v.`ESTADO DEL EXPEDIENTE` IN (
                 'liquidado', 'proceso de escritura', 
                 'agenda escritura', 'escriturado'
             )
-            AND {col_fecha} IS NOT NULL 
-            AND {col_fecha} != ''
-        GROUP BY v.FOLIO, v.CLIENTE
+        GROUP BY v.FOLIO, v.CLIENTE, m.anio
         ORDER BY v.CLIENTE ASC
     """)
 
     try:
-        result = db.execute(query).mappings().all()
-        
+        filas = {}
+        for r in db.execute(query).mappings():
+            clave = (r["FOLIO"], r["CLIENTE"])
+            fila = filas.get(clave)
+            if fila is None:
+                fila = {
+                    "FOLIO": r["FOLIO"],
+                    "INICIO_OPERACIONES": r["INICIO_OPERACIONES"],
+                    "PROYECTO": r["PROYECTO"],
+                    "CLUSTER": r["CLUSTER"],
+                    "ESTATUS": r["ESTATUS"],
+                    "LOTE": r["LOTE"],
+                    "M2": r["M2"],
+                    "CLIENTE": r["CLIENTE"],
+                    "FECHA FIRMA": None,
+                    "FECHA DE FINALIZACIÓN DE ENGANCHE": r["FECHA DE FINALIZACIÓN DE ENGANCHE"],
+                    "FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE": r["FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE"],
+                    "PRECIO FINAL": r["PRECIO FINAL"],
+                }
+                for a in anios:
+                    fila[f"PAGOS {a}"] = 0
+                    fila[f"NC {a}"] = 0
+                fila.update({"TOTAL PAGADO": 0, "VALIDACION": None, "COMENTARIO": None})
+                for a in anios:
+                    fila[f"Anticipo {a}"] = 0
+                fila.update({
+                    "CANTIDAD_TOTAL_NC": 0,
+                    "ALERTA NOTA CRÉDITO": "NO",
+                    "% (anticipo)": None,
+                    "% aplicable (anticipo)": None,
+                    "Pago total 2023": None,
+                    "% (pago 2023)": None,
+                    "% aplicable (pago 2023)": None,
+                    "Pago total 2024": None,
+                    "% (pago 2024)": None,
+                    "% aplicable (pago 2024)": None,
+                    "Saldo 2023": None,
+                })
+                filas[clave] = fila
+
+            pagos = r["pagos"] or 0
+            if r["anio"] in anios:
+                fila[f"PAGOS {r['anio']}"] += pagos
+                fila[f"NC {r['anio']}"] += r["nc"] or 0
+                fila[f"Anticipo {r['anio']}"] += pagos
+            fila["TOTAL PAGADO"] += pagos
+            fila["CANTIDAD_TOTAL_NC"] += r["cantidad_nc"] or 0
+            if r["cantidad_nc"]:
+                fila["ALERTA NOTA CRÉDITO"] = "SÍ"
+
+        result = list(filas.values())
+        for fila in result:
+            if fila["PRECIO FINAL"] is not None:
+                fila["VALIDACION"] = fila["PRECIO FINAL"] - fila["TOTAL PAGADO"]
+
         campos_fecha = [
             "FECHA DE FINALIZACIÓN DE ENGANCHE", 
             "FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE",
@@ -418,8 +427,7 @@ def get_reporte_expedientes_liquidados(db: Session = Depends(get_db), user: dict
         ]
 
         final_data = []
-        for row in result:
-            d = dict(row)
+        for d in result:
             for k, v in d.items():
                 if k in campos_fecha:
                     if v is None or str(v).strip().upper() in ['NULL', '']:
@@ -440,47 +448,91 @@ def get_reporte_expedientes_liquidados(db: Session = Depends(get_db), user: dict
 
 # ENDPOINTS DE REPORTES JURÍDICOS
 
+ESTADOS_JURIDICO = ['Jurídico', 'Verificación de datos', 'Firma', 'Firmado por Cliente', 'Firma de Testigos', 'Contrato Firmado ']
+cache_juridico = CacheRespuestas("juridico", ttl=float(os.getenv("JURIDICO_CACHE_TTL", 300)))
+
+def _base_juridico(db: Session, start_date: str, end_date: str, proyecto: Optional[str]) -> list:
+    """
+    Ventas en estados de jurídico con inicio de operación en el rango y al menos un pago activo
+    en el rango: una fila por folio con su pago más reciente (ROW_NUMBER en MySQL, no en Python).
+    Regresa [(venta, pago)] con los mismos atributos que los modelos; se cachea unos minutos
+    por (rango, proyecto) porque los 4 reportes se piden juntos (solo si se leyó del primario).
+    """
+    filtrar_proyecto = bool(proyecto and proyecto.lower() != "todos")
+    clave = (start_date, end_date, proyecto if filtrar_proyecto else None, generacion_datos())
+    return cache_juridico.obtener(
+        clave, lambda: _consultar_base_juridico(db, start_date, end_date, proyecto if filtrar_proyecto else None),
+        guardar=not lee_de_replica(db)
+    )
+
+def _consultar_base_juridico(db: Session, start_date: str, end_date: str, proyecto: Optional[str]) -> list:
+    estados = {f"estado_{i}": e for i, e in enumerate(ESTADOS_JURIDICO)}
+    filtro_proyecto = "AND v.DESARROLLO = :proyecto" if proyecto else ""
+    query = text(f"""
+        SELECT * FROM (
+            SELECT
+                v.FOLIO AS folio,
+                v.CLIENTE AS cliente,
+                v.CLIENTE_2 AS cliente_2,
+                v.CLIENTE_3 AS cliente_3,
+                v.CLIENTE_4 AS cliente_4,
+                v.CLIENTE_5 AS cliente_5,
+                v.CLIENTE_6 AS cliente_6,
+                v.`FECHA DE INICIO DE OPERACIÓN` AS fecha_inicio_operacion,
+                v.`NÚMERO` AS numero,
+                v.ETAPA AS etapa,
+                v.CLASIFICADOR AS clasificador,
+                v.`METROS CUADRADOS` AS metros_cuadrados,
+                v.`PRECIO FINAL` AS precio_final,
+                v.ASESOR AS asesor,
+                v.`CANAL DE VENTAS` AS canal_ventas,
+                v.`FECHA DE FINALIZACIÓN DE PAGO DE ENGANCHE` AS fecha_fin_pago_enganche,
+                p.`Promoción` AS promocion,
+                p.`Estatus expediente` AS estatus_expediente,
+                ROW_NUMBER() OVER (
+                    PARTITION BY v.FOLIO
+                    ORDER BY p.`Fecha del comprobante de pago` DESC, p.`Número de pago` DESC
+                ) AS rn
+            FROM ventas v
+            INNER JOIN pagos p
+                ON p.`Folio de la venta` = v.FOLIO
+               AND p.`Fecha del comprobante de pago` BETWEEN :inicio AND :fin
+               AND p.`Estatus flujo` = 'active'
+               AND p.`Estatus` = 'active'
+               AND LOWER(p.`Método de pago`) != 'nota de crédito'
+            WHERE v.`FECHA DE INICIO DE OPERACIÓN` BETWEEN :inicio AND :fin
+              AND v.`ESTADO DEL EXPEDIENTE` IN ({", ".join(f":{k}" for k in estados)})
+              {filtro_proyecto}
+        ) t
+        WHERE rn = 1
+        ORDER BY folio
+    """)
+    columnas_pago = ("promocion", "estatus_expediente")
+    filas = db.execute(query, {"inicio": start_date, "fin": end_date, "proyecto": proyecto, **estados}).mappings()
+    return [
+        (
+            SimpleNamespace(**{k: r[k] for k in r.keys() if k not in columnas_pago and k != "rn"}),
+            SimpleNamespace(**{k: r[k] for k in columnas_pago}),
+        )
+        for r in filas
+    ]
+
 @router.get("/Juridico", response_model=List[schemas.ReporteJuridicoResponse])
 def get_reporte_juridico(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_usuario)
 ):
     try:
-        # Consulta base con join a pagos para acceder a datos relacionados
-        query = db.query(Venta, Pago).join(
-            Pago,
-            and_(
-                Pago.folio_venta == Venta.folio,
-                Pago.fecha_comprobante >= start_date,
-                Pago.fecha_comprobante <= end_date,
-                Pago.estatus_flujo == 'active',
-                Pago.estatus == 'active',
-                func.lower(Pago.metodo_pago) != 'nota de crédito'
-            )
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date,
-            Venta.estado_expediente.in_(['Jurídico', 'Verificación de datos', 'Firma', 'Firmado por Cliente', 'Firma de Testigos', 'Contrato Firmado '])   
-        ).order_by(Venta.folio, Pago.fecha_comprobante.desc(), Pago.numero_pago.desc())
-
-        if proyecto and proyecto.lower() != "todos":
-            query = query.filter(Venta.desarrollo == proyecto)
-
-        filas = query.all()
-
-        # Evita duplicados por múltiples pagos (incluyendo pagos divididos)
-        ventas = {}
-        for venta, pago in filas:
-            if venta.folio not in ventas:
-                ventas[venta.folio] = (venta, pago)
+        # Una fila por folio (su último pago que califica), compartida por los 4 reportes jurídicos
+        ventas = _base_juridico(db, start_date, end_date, proyecto)
 
         meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
 
         reporte_final = []
-        for v, p in ventas.values():
+        for v, p in ventas:
             # --- Lógica de Nombres y Copropietarios ---
             nombres_lista = []
             if v.cliente:
@@ -579,40 +631,17 @@ def get_reporteADMVentas_juridico(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_usuario)
 ):
     try:
-        query = db.query(Venta, Pago).join(
-            Pago,
-            and_(
-                Pago.folio_venta == Venta.folio,
-                Pago.fecha_comprobante >= start_date,
-                Pago.fecha_comprobante <= end_date,
-                Pago.estatus_flujo == 'active',
-                Pago.estatus == 'active',
-                func.lower(Pago.metodo_pago) != 'nota de crédito'
-            )
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date,
-            Venta.estado_expediente.in_(['Jurídico', 'Verificación de datos', 'Firma', 'Firmado por Cliente', 'Firma de Testigos', 'Contrato Firmado '])
-        ).order_by(Venta.folio, Pago.fecha_comprobante.desc(), Pago.numero_pago.desc())
-
-        if proyecto and proyecto.lower() != "todos":
-            query = query.filter(Venta.desarrollo == proyecto)
-
-        filas = query.all()
-
-        ventas = {}
-        for venta, pago in filas:
-            if venta.folio not in ventas:
-                ventas[venta.folio] = (venta, pago)
+        # Una fila por folio (su último pago que califica), compartida por los 4 reportes jurídicos
+        ventas = _base_juridico(db, start_date, end_date, proyecto)
 
         meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
 
         reporte_final = []
-        for v, p in ventas.values():
+        for v, p in ventas:
             nombres_lista = []
             if v.cliente:
                 nombres_lista.append(str(v.cliente))
@@ -661,38 +690,15 @@ def get_recordatorioFirma_juridico(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_usuario)
 ):
     try:
-        query = db.query(Venta, Pago).join(
-            Pago,
-            and_(
-                Pago.folio_venta == Venta.folio,
-                Pago.fecha_comprobante >= start_date,
-                Pago.fecha_comprobante <= end_date,
-                Pago.estatus_flujo == 'active',
-                Pago.estatus == 'active',
-                func.lower(Pago.metodo_pago) != 'nota de crédito'
-            )
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date,
-            Venta.estado_expediente.in_(['Jurídico', 'Verificación de datos', 'Firma', 'Firmado por Cliente', 'Firma de Testigos', 'Contrato Firmado '])
-        ).order_by(Venta.folio, Pago.fecha_comprobante.desc(), Pago.numero_pago.desc())
-
-        if proyecto and proyecto.lower() != "todos":
-            query = query.filter(Venta.desarrollo == proyecto)
-
-        filas = query.all()
-
-        ventas = {}
-        for venta, pago in filas:
-            if venta.folio not in ventas:
-                ventas[venta.folio] = (venta, pago)
+        # Una fila por folio (su último pago que califica), compartida por los 4 reportes jurídicos
+        ventas = _base_juridico(db, start_date, end_date, proyecto)
 
         recordatorios = []
-        for v, _ in ventas.values():
+        for v, _ in ventas:
             recordatorios.append(
                 schemas.RecordatorioFirmaJuridicoResponse(
                     FechaNotificacion=str(getattr(v, 'fecha_notificacion_juridico', "") or ""),
@@ -713,38 +719,15 @@ def get_escriturados_juridico(
     start_date: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     end_date: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     proyecto: Optional[str] = Query(None, description="Filtrar por nombre del proyecto"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user: dict = Depends(es_usuario)
 ):
     try:
-        query = db.query(Venta, Pago).join(
-            Pago,
-            and_(
-                Pago.folio_venta == Venta.folio,
-                Pago.fecha_comprobante >= start_date,
-                Pago.fecha_comprobante <= end_date,
-                Pago.estatus_flujo == 'active',
-                Pago.estatus == 'active',
-                func.lower(Pago.metodo_pago) != 'nota de crédito'
-            )
-        ).filter(
-            Venta.fecha_inicio_operacion >= start_date,
-            Venta.fecha_inicio_operacion <= end_date,
-            Venta.estado_expediente.in_(['Jurídico', 'Verificación de datos', 'Firma', 'Firmado por Cliente', 'Firma de Testigos', 'Contrato Firmado '])
-        ).order_by(Venta.folio, Pago.fecha_comprobante.desc(), Pago.numero_pago.desc())
-
-        if proyecto and proyecto.lower() != "todos":
-            query = query.filter(Venta.desarrollo == proyecto)
-
-        filas = query.all()
-
-        ventas = {}
-        for venta, pago in filas:
-            if venta.folio not in ventas:
-                ventas[venta.folio] = (venta, pago)
+        # Una fila por folio (su último pago que califica), compartida por los 4 reportes jurídicos
+        ventas = _base_juridico(db, start_date, end_date, proyecto)
 
         recordatorios = []
-        for v, _ in ventas.values():
+        for v, _ in ventas:
             recordatorios.append(
                 schemas.EscrituradosJuridicoResponse(
                     NombreCliente=str(getattr(v, 'cliente', "") or ""),
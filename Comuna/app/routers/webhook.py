@@ -10,9 +10,9 @@ from typing import Any, Dict, Optional, List
 from urllib.parse import quote
 from pydantic import BaseModel
 from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from ..database import SessionLocal
-from sqlalchemy import and_
-from ..models import Cartera, Venta, Amortizacion
+from ..services.indice_ventas import indice_ventas
+from ..services.rate_limiter import enviar_con_limite, RATE_LIMIT_ESPERA_MAX_INTERACTIVA
+from ..services.metricas import medir_externo
 from dotenv import load_dotenv
 from datetime import datetime
 import vertexai
@@ -106,7 +106,9 @@ def enviar_whatsapp(numero: str, texto: str):
 
     try:
         headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        # Corre en una BackgroundTask (threadpool de Starlette): espera corta si Respond.io limita
+        response = enviar_con_limite("respondio", token, lambda: requests.post(url, headers=headers, json=payload, timeout=15),
+                                     espera_max=RATE_LIMIT_ESPERA_MAX_INTERACTIVA)
         response.raise_for_status()
         logger.info(f"Mensaje enviado a {numero}")
         return response
@@ -151,7 +153,8 @@ def analizar_comprobante(url_imagen: str) -> Dict[str, Any]:
 # - IMPORTANTE: Identifica si dentro del "concepto" aparece un folio de 4 números. Si no aparece, devuelve el JSON con un campo extra: {"error": "No se encontró un folio válido en el concepto"}.
 
         logger.info(">>> DEBUG: Llamada a Vertex AI...")
-        ai_response = model.generate_content([image_part, prompt])
+        with medir_externo("vertex_ai"):
+            ai_response = model.generate_content([image_part, prompt])
         
         # Limpieza de formato markdown si el modelo lo incluye
         raw_text = ai_response.text.strip()
@@ -307,39 +310,31 @@ def procesar_evento_background(evento: Dict[str, Any]):
         # --- 3. CONSULTA SQL CON BÚSQUEDA FLEXIBLE ---
         datos_sincronizados = {}
 
-        with SessionLocal() as db:
-            # USAMOS ilike con %lote% para permitir coincidencias parciales y no distinguir Mayús/Minús
-            registro_venta = db.query(Venta).filter(
-                and_(
-                    Venta.numero.ilike(f"%{lote_final}%"),
-                    Venta.estado_expediente.notin_(['Cancelado', 'Expirado'])
-                )
-            ).first()
-            
-            logger.info(f">>> DEBUG: Respuesta sql: {registro_venta}")
-          
-            if registro_venta:
-                folio_db = registro_venta.folio
-                nombre_cliente = registro_venta.cliente
-                lote_cliente = registro_venta.numero
-                
-                # Guardamos datos limpios de la BD para Firebase
-                datos_sincronizados = {
-                    "folio": folio_db,
-                    "cliente": nombre_cliente,
-                    "lote": lote_cliente,
-                    "proyecto": registro_venta.desarrollo,
-                    "etapa": registro_venta.etapa,
-                    "EstatusExpediente": registro_venta.estado_expediente,
-                    "cliente2": registro_venta.cliente_2 or "Sin copropietario adicional",
-                    "cliente3": registro_venta.cliente_3 or "Sin copropietario adicional",
-                    "cliente4": registro_venta.cliente_4 or "Sin copropietario adicional",
-                    "cliente5": registro_venta.cliente_5 or "Sin copropietario adicional",
-                    "cliente6": registro_venta.cliente_6 or "Sin copropietario adicional"
-                }
-            else:
-                logger.warning(f"Lote '{lote_final}' no válido o cancelado en Cartera.")
-                return
+        # Índice en memoria (se arma en la sync): lote normalizado, tolera ruido del OCR y no adivina si hay empate
+        # (ni entre lotes parecidos ni entre folios con el mismo lote que el teléfono no desempata)
+        registros_venta = indice_ventas.indice().folio_unico(lote_final, telefono_contacto)
+        logger.info(f">>> DEBUG: Folios para el lote: {[r['folio'] for r in registros_venta]}")
+
+        if registros_venta:
+            registro_venta = registros_venta[0]
+
+            # Guardamos datos limpios de la BD para Firebase
+            datos_sincronizados = {
+                "folio": registro_venta["folio"],
+                "cliente": registro_venta["cliente"],
+                "lote": registro_venta["lote"],
+                "proyecto": registro_venta["proyecto"],
+                "etapa": registro_venta["etapa"],
+                "EstatusExpediente": registro_venta["estado_expediente"],
+                "cliente2": registro_venta["cliente_2"] or "Sin copropietario adicional",
+                "cliente3": registro_venta["cliente_3"] or "Sin copropietario adicional",
+                "cliente4": registro_venta["cliente_4"] or "Sin copropietario adicional",
+                "cliente5": registro_venta["cliente_5"] or "Sin copropietario adicional",
+                "cliente6": registro_venta["cliente_6"] or "Sin copropietario adicional"
+            }
+        else:
+            logger.warning(f"Lote '{lote_final}' no válido o cancelado en Cartera.")
+            return
 
         # --- 5. GUARDADO EN FIREBASE ---
         id_comprobante = str(uuid.uuid4())
@@ -440,53 +435,47 @@ def obtener_Mensaje_Folios(evento: LotesRequest):
         telefono_recibido = f"+{telefono_recibido}"
         lotes_temporales = evento.lotestemporales
 
-        with SessionLocal() as db:
-            # 2. Consulta de todos los registros activos
-            registros_ventas = db.query(Venta).filter(
-                and_(
-                    Venta.telefono == telefono_recibido,
-                    Venta.estado_expediente.notin_(['Cancelado', 'Expirado'])
-                )
-            ).all() 
+        # 2. Registros activos del teléfono (índice por E.164, sin tocar la BD)
+        registros_ventas = indice_ventas.indice().por_telefono(telefono_recibido)
+        
+        if registros_ventas:
+            # Extraemos y ordenamos los lotes únicos encontrados en la BD
+            lotes_encontrados = sorted(list(set([str(r["lote"]) for r in registros_ventas])))
             
-            if registros_ventas:
-                # Extraemos y ordenamos los lotes únicos encontrados en la BD
-                lotes_encontrados = sorted(list(set([str(r.numero) for r in registros_ventas])))
+            # --- LÓGICA DE VERIFICACIÓN DE LOTES TEMPORALES ---
+            if lotes_temporales:
+                lotes_temporales_lista = sorted([l.strip() for l in lotes_temporales.split(",") if l.strip()])
                 
-                # --- LÓGICA DE VERIFICACIÓN DE LOTES TEMPORALES ---
-                if lotes_temporales:
-                    lotes_temporales_lista = sorted([l.strip() for l in lotes_temporales.split(",") if l.strip()])
-                    
-                    if lotes_temporales_lista != lotes_encontrados:
-                        lotes_encontrados = lotes_temporales_lista
-                # --------------------------------------------------
-
-                logger.info(f">>> LOTES A MOSTRAR para {telefono_recibido}: {lotes_encontrados}")
-
-                # 3. Construcción del mensaje numerado
-                encabezado = "🤖 Consultando en mi base de datos encontré los siguientes folios:\n\n"
-                lineas_folios = []
-                
-                for i, lote in enumerate(lotes_encontrados, 1):
-                    lineas_folios.append(f"{i}.- {lote}")
-                
-                mensaje_final = encabezado + "\n".join(lineas_folios)
+                if lotes_temporales_lista != lotes_encontrados:
+                    lotes_encontrados = lotes_temporales_lista
+            # --------------------------------------------------
 
-                # 4. Envío del mensaje por WhatsApp
-                envio = enviar_whatsapp(telefono_recibido, mensaje_final)
-                
-                if envio:
-                    return {
-                        "status": "success",
-                        "mensaje_enviado": mensaje_final,
-                        "lotes": lotes_encontrados
-                    }
-                else:
-                    return {"status": "error", "message": "No se pudo enviar el mensaje por WhatsApp"}
+            logger.info(f">>> LOTES A MOSTRAR para {telefono_recibido}: {lotes_encontrados}")
+
+            # 3. Construcción del mensaje numerado
+            encabezado = "🤖 Consultando en mi base de datos encontré los siguientes folios:\n\n"
+            lineas_folios = []
+            
+            for i, lote in enumerate(lotes_encontrados, 1):
+                lineas_folios.append(f"{i}.- {lote}")
             
+            mensaje_final = encabezado + "\n".join(lineas_folios)
+
+            # 4. Envío del mensaje por WhatsApp
+            envio = enviar_whatsapp(telefono_recibido, mensaje_final)
+            
+            if envio:
+                return {
+                    "status": "success",
+                    "mensaje_enviado": mensaje_final,
+                    "lotes": lotes_encontrados
+                }
             else:
-                logger.warning(f">>> INFO: No se encontró registro activo para {telefono_recibido}")
-                return {"status": "not_found", "message": "No se encontró registro activo"}
+                return {"status": "error", "message": "No se pudo enviar el mensaje por WhatsApp"}
+        
+        else:
+            logger.warning(f">>> INFO: No se encontró registro activo para {telefono_recibido}")
+            return {"status": "not_found", "message": "No se encontró registro activo"}
 
     except Exception as e:
         logger.error(f"❌ Error crítico en obtener_Mensaje_Folios: {e}")
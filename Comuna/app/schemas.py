@@ -1,9 +1,16 @@
-from pydantic import BaseModel, Field, StrictBool, ConfigDict
-from typing import List, Any, Optional, Dict
+from pydantic import BaseModel, Field, StrictBool, ConfigDict, BeforeValidator
+from typing import List, Any, Optional, Dict, Annotated
+from datetime import date
 from pydantic import EmailStr
 from decimal import Decimal,ROUND_HALF_UP
 from pydantic import BaseModel
 
+def _fecha_a_texto(valor):
+    """Las columnas de fecha ya son DATE en MySQL: llegan como date y el contrato sigue siendo 'AAAA-MM-DD'."""
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+FechaTexto = Annotated[Optional[str], BeforeValidator(_fecha_a_texto)]
+
 class ConfigBase:
     from_attributes = True
     populate_by_name = True
@@ -231,8 +238,8 @@ class ComplementoPago(BaseModel):
     cliente: str
     pagador: Optional[str] = None
     proyecto: str
-    fecha_pago: Optional[str] = None      
-    fecha_aplicacion: Optional[str] = None            
+    fecha_pago: FechaTexto = None      
+    fecha_aplicacion: FechaTexto = None            
     folio_venta: int           
     folio_pago: str            
     metodo: str
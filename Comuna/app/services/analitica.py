@@ -0,0 +1,255 @@
+import time
+import logging
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.database import engine
+from app.services.cache_datos import generacion_datos
+
+logger = logging.getLogger(__name__)
+
+EPOCA = date(1970, 1, 1)
+
+# Columnas que se copian a memoria: nombre interno -> columna en MySQL.
+# "texto" se guarda como códigos int32 + diccionario; "fecha" como días desde 1970 (int32, -1 = sin fecha).
+ESQUEMA_ANALITICO = {
+    "pagos": {
+        "fecha": ("Fecha del comprobante de pago", "fecha"),
+        "folio": ("Folio de la venta", "texto"),
+        "proyecto": ("Proyecto", "texto"),
+        "etapa": ("Etapa", "texto"),
+        "metodo_pago": ("Método de pago", "texto"),
+        "concepto": ("Concepto de pago", "texto"),
+        "banco": ("Banco Caja", "texto"),
+        "estatus": ("Estatus", "texto"),
+        "estatus_flujo": ("Estatus flujo", "texto"),
+        "monto_pagado": ("Monto pagado", "numero"),
+        "monto_flujo": ("Monto flujo", "numero"),
+        "monto_a_pagar": ("Monto a pagar", "numero"),
+    },
+    "ventas": {
+        "fecha": ("FECHA DE INICIO DE OPERACIÓN", "fecha"),
+        "folio": ("FOLIO", "texto"),
+        "desarrollo": ("DESARROLLO", "texto"),
+        "etapa": ("ETAPA", "texto"),
+        "estado_expediente": ("ESTADO DEL EXPEDIENTE", "texto"),
+        "asesor": ("ASESOR", "texto"),
+        "canal_ventas": ("CANAL DE VENTAS", "texto"),
+        "precio_final": ("PRECIO FINAL", "numero"),
+        "precio_lista": ("PRECIO DE LISTA", "numero"),
+        "metros_cuadrados": ("METROS CUADRADOS", "numero"),
+    },
+}
+
+# Dimensiones que salen de la fecha
+DIMENSIONES_FECHA = ("anio", "mes", "dia")
+
+
+def dia_numero(d: date) -> int:
+    return (d - EPOCA).days
+
+
+class ColumnaTexto:
+    """
+    Texto codificado por diccionario. El código 0 es NULL, así un bincount sobre
+    los códigos nunca recibe negativos. `minusculas` sirve para comparar sin mayúsculas
+    igual que la collation de MySQL.
+    """
+
+    def __init__(self, serie: pd.Series):
+        # El NULL de MySQL llega como None o NaN según el dtype; ambos van al código 0
+        valores = serie.map(lambda v: None if pd.isna(v) else str(v).strip())
+        codigos, categorias = pd.factorize(valores, use_na_sentinel=True)
+        self.codigos = (codigos + 1).astype(np.int32)
+        self.categorias = [None] + [str(c) for c in categorias]
+        self.minusculas = np.array([""] + [c.lower() for c in self.categorias[1:]], dtype=object)
+        self._grupos = None
+
+    def codigos_de(self, *valores) -> np.ndarray:
+        buscados = {str(v).strip().lower() for v in valores}
+        return np.flatnonzero(np.isin(self.minusculas, list(buscados)) & (np.arange(len(self.categorias)) > 0))
+
+    def mascara(self, *valores) -> np.ndarray:
+        """Filas cuyo valor es alguno de `valores` (sin distinguir mayúsculas)."""
+        return np.isin(self.codigos, self.codigos_de(*valores))
+
+    def etiqueta(self, codigo: int, vacio: str = "Sin definir") -> str:
+        return self.categorias[codigo] if codigo > 0 else vacio
+
+    def grupos(self):
+        """
+        Códigos agrupados sin distinguir mayúsculas, como un GROUP BY con la collation de MySQL:
+        ("Efectivo", "EFECTIVO") caen en un mismo grupo. Regresa (códigos por fila, etiquetas);
+        cada grupo se etiqueta con el primero de sus valores originales y el 0 sigue siendo NULL.
+        """
+        if self._grupos is None:
+            claves, unicas = pd.factorize(self.minusculas[1:])
+            mapa = np.concatenate(([0], claves + 1)).astype(np.int32)
+            etiquetas = [None] * (len(unicas) + 1)
+            for codigo in range(len(self.categorias) - 1, 0, -1):
+                etiquetas[mapa[codigo]] = self.categorias[codigo]
+            self._grupos = (mapa[self.codigos], etiquetas)
+        return self._grupos
+
+
+class TablaColumnar:
+    def __init__(self, nombre: str, df: pd.DataFrame, esquema: dict):
+        self.nombre = nombre
+        self.n = len(df)
+        self.textos = {}
+        self.numeros = {}
+        self.fechas = {}
+        for interno, (columna, tipo) in esquema.items():
+            serie = df[columna] if columna in df.columns else pd.Series([None] * self.n)
+            if tipo == "texto":
+                self.textos[interno] = ColumnaTexto(serie)
+            elif tipo == "numero":
+                self.numeros[interno] = pd.to_numeric(serie, errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+            else:
+                dias = pd.to_datetime(serie, errors="coerce").to_numpy(dtype="datetime64[D]")
+                self.fechas[interno] = np.where(np.isnat(dias), -1, dias.astype(np.int64)).astype(np.int32)
+
+    def rango(self, inicio: date, fin: date, columna: str = "fecha") -> np.ndarray:
+        dias = self.fechas[columna]
+        return (dias >= dia_numero(inicio)) & (dias <= dia_numero(fin))
+
+    def parte_fecha(self, parte: str, columna: str = "fecha") -> np.ndarray:
+        """anio / mes / dia (días desde 1970) como enteros; -1 si no hay fecha."""
+        dias = self.fechas[columna]
+        fechas = np.where(dias >= 0, dias, 0).astype("datetime64[D]")
+        if parte == "anio":
+            valores = fechas.astype("datetime64[Y]").astype(np.int64) + 1970
+        elif parte == "mes":
+            valores = fechas.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        else:
+            valores = dias.astype(np.int64)
+        return np.where(dias >= 0, valores, -1)
+
+    def nbytes(self) -> int:
+        total = sum(c.codigos.nbytes for c in self.textos.values())
+        total += sum(a.nbytes for a in self.numeros.values())
+        total += sum(a.nbytes for a in self.fechas.values())
+        return total
+
+
+class AlmacenAnalitico:
+    """
+    Copia columnar en memoria de pagos y ventas para el dashboard.
+    Se reconstruye tras cada sync; si otra instancia fue la que sincronizó,
+    se nota por el cambio de generacion_datos() y se reconstruye al primer uso.
+    Las consultas toman la referencia actual, así una reconstrucción nunca las deja a medias.
+    """
+
+    def __init__(self):
+        self._tablas = None
+        self._generacion = None
+        self._lock = threading.Lock()
+
+    def construir(self, generacion: int = None):
+        inicio = time.monotonic()
+        tablas = {}
+        with engine.connect() as conn:
+            for nombre, esquema in ESQUEMA_ANALITICO.items():
+                columnas = ", ".join(f"`{col}`" for col, _ in esquema.values())
+                df = pd.read_sql(f"SELECT {columnas} FROM {nombre}", conn)
+                tablas[nombre] = TablaColumnar(nombre, df, esquema)
+        self._tablas = tablas
+        self._generacion = generacion_datos() if generacion is None else generacion
+        megas = sum(t.nbytes() for t in tablas.values()) / 1024 / 1024
+        logger.info(f"📊 Copia analítica lista: {', '.join(f'{t.nombre}={t.n}' for t in tablas.values())} "
+                    f"({megas:.1f} MB, {time.monotonic() - inicio:.1f}s)")
+
+    def tabla(self, nombre: str) -> TablaColumnar:
+        generacion = generacion_datos()
+        if self._tablas is None or self._generacion != generacion:
+            with self._lock:
+                if self._tablas is None or self._generacion != generacion:
+                    self.construir(generacion)
+        return self._tablas[nombre]
+
+
+almacen = AlmacenAnalitico()
+
+
+def agrupar(codigos: np.ndarray, mascara: np.ndarray, pesos: np.ndarray = None, tamanio: int = None) -> np.ndarray:
+    """Suma (o cuenta, sin pesos) por código con bincount, solo sobre las filas de la máscara."""
+    return np.bincount(
+        codigos[mascara],
+        weights=None if pesos is None else pesos[mascara],
+        minlength=tamanio or 0
+    )
+
+
+def _dimension(t: TablaColumnar, nombre: str, mascara: np.ndarray):
+    """Códigos compactos (0..k-1) de las filas de la máscara y la etiqueta de cada uno."""
+    if nombre in t.textos:
+        columna = t.textos[nombre]
+        unicos, inversa = np.unique(columna.codigos[mascara], return_inverse=True)
+        return inversa, [columna.etiqueta(int(c)) for c in unicos]
+    if nombre in DIMENSIONES_FECHA:
+        unicos, inversa = np.unique(t.parte_fecha(nombre)[mascara], return_inverse=True)
+        if nombre == "dia":
+            etiquetas = [str(EPOCA + timedelta(days=int(u))) if u >= 0 else "Sin fecha" for u in unicos]
+        else:
+            etiquetas = [int(u) if u >= 0 else "Sin fecha" for u in unicos]
+        return inversa, etiquetas
+    raise ValueError(f"Dimensión desconocida para {t.nombre}: {nombre}")
+
+
+def dimensiones_disponibles(nombre_tabla: str) -> dict:
+    esquema = ESQUEMA_ANALITICO[nombre_tabla]
+    return {
+        "dimensiones": [k for k, (_, tipo) in esquema.items() if tipo == "texto"] + list(DIMENSIONES_FECHA),
+        "medidas": [k for k, (_, tipo) in esquema.items() if tipo == "numero"],
+    }
+
+
+def pivot(nombre_tabla: str, filas: str, columnas: str = None, medida: str = None, agregado: str = "sum",
+          inicio: date = None, fin: date = None, filtros: dict = None) -> dict:
+    """
+    Tabla dinámica sobre la copia en memoria: filtros por igualdad (sin mayúsculas) y rango de fecha,
+    filas x columnas con sum/count/avg de una medida. Todo es máscara + bincount, no toca MySQL.
+    """
+    if nombre_tabla not in ESQUEMA_ANALITICO:
+        raise ValueError(f"Tabla desconocida: {nombre_tabla}")
+    if agregado not in ("sum", "count", "avg"):
+        raise ValueError(f"Agregado desconocido: {agregado}")
+    t = almacen.tabla(nombre_tabla)
+    if medida is not None and medida not in t.numeros:
+        raise ValueError(f"Medida desconocida para {nombre_tabla}: {medida}")
+
+    mascara = np.ones(t.n, dtype=bool)
+    if inicio or fin:
+        mascara &= t.rango(inicio or EPOCA, fin or date.max)
+    for nombre, valor in (filtros or {}).items():
+        if nombre not in t.textos:
+            raise ValueError(f"No se puede filtrar {nombre_tabla} por {nombre}")
+        mascara &= t.textos[nombre].mascara(valor)
+
+    cod_filas, etiquetas_filas = _dimension(t, filas, mascara)
+    if columnas:
+        cod_columnas, etiquetas_columnas = _dimension(t, columnas, mascara)
+    else:
+        cod_columnas, etiquetas_columnas = np.zeros(len(cod_filas), dtype=np.int64), ["total"]
+
+    forma = (len(etiquetas_filas), len(etiquetas_columnas))
+    celdas = cod_filas * forma[1] + cod_columnas
+    tamanio = forma[0] * forma[1]
+    conteos = np.bincount(celdas, minlength=tamanio)
+    if agregado == "count" or medida is None:
+        valores = conteos.astype(np.float64)
+    else:
+        valores = np.bincount(celdas, weights=t.numeros[medida][mascara], minlength=tamanio)
+        if agregado == "avg":
+            valores = np.divide(valores, conteos, out=np.zeros_like(valores), where=conteos > 0)
+
+    return {
+        "tabla": nombre_tabla,
+        "filas": etiquetas_filas,
+        "columnas": etiquetas_columnas,
+        "valores": np.round(valores.reshape(forma), 4).tolist(),
+        "registros": int(mascara.sum()),
+    }
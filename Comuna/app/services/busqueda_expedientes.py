@@ -0,0 +1,166 @@
+import re
+import heapq
+import logging
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.cache_datos import generacion_datos
+
+logger = logging.getLogger(__name__)
+
+# Campos en los que busca ?q= y cuánto pesa encontrar ahí la palabra
+CAMPOS_BUSQUEDA = {
+    "folio": 3.0,
+    "cliente_principal": 2.0,
+    "nombres_copropietarios": 1.5,
+    "lote": 1.5,
+    "cluster": 1.0,
+    "asesor": 1.0,
+}
+LARGO_PREFIJO_MAX = 12
+# Una palabra con typo cuenta si comparte al menos esta fracción de trigramas
+UMBRAL_TRIGRAMAS = 0.6
+# Un match por trigramas vale menos que uno por prefijo
+PESO_TRIGRAMAS = 0.6
+ESTADOS_INACTIVOS = ("Expirado", "Cancelado", "EXPIRADO", "CANCELADO")
+NOMBRES_VACIOS = ("", "None", "NULL")
+
+# Una sola consulta: columnas proyectadas de ventas + el correo de cada copropietario.
+# El CTE agrupa clientes por id numérico (ventas guarda los ids como DOUBLE) y MySQL lo
+# materializa una vez con índice, así los 5 LEFT JOIN son búsquedas, no barridos.
+SQL_EXPEDIENTES = text(f"""
+    WITH correos AS (
+        SELECT CAST(client_id AS UNSIGNED) AS id, MIN(email) AS email
+        FROM clientes
+        WHERE client_id IS NOT NULL AND email IS NOT NULL AND email != ''
+        GROUP BY CAST(client_id AS UNSIGNED)
+    )
+    SELECT
+        v.FOLIO AS folio,
+        v.CLIENTE AS cliente,
+        v.DESARROLLO AS proyecto,
+        v.ETAPA AS cluster,
+        v.`NÚMERO` AS lote,
+        v.`ESTADO DEL EXPEDIENTE` AS estatus,
+        v.`METROS CUADRADOS` AS m2,
+        v.`CANAL DE VENTAS` AS canal,
+        v.ASESOR AS asesor,
+        {", ".join(f"v.CLIENTE_{i} AS cliente_{i}, c{i}.email AS correo_{i}" for i in range(2, 7))}
+    FROM ventas v
+    {" ".join(f"LEFT JOIN correos c{i} ON c{i}.id = v.`ID CLIENTE_{i}`" for i in range(2, 7))}
+    WHERE v.`ESTADO DEL EXPEDIENTE` NOT IN ({", ".join(f"'{e}'" for e in ESTADOS_INACTIVOS)})
+""")
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sin acentos y solo letras/números: 'Pérez-Ñúñez' -> 'perez nunez'."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", " ", texto).strip()
+
+
+def trigramas(palabra: str) -> set:
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _expediente(r) -> dict:
+    """Misma forma y limpieza que SearchboxExpedienteResponse."""
+    coprops_nombres, correos = [], []
+    for i in range(2, 7):
+        nombre = r[f"cliente_{i}"]
+        if nombre and str(nombre).strip() not in NOMBRES_VACIOS:
+            coprops_nombres.append(str(nombre))
+            correo = r[f"correo_{i}"]
+            if correo and correo not in correos:
+                correos.append(correo)
+
+    canal = str(r["canal"]).strip() if r["canal"] else "N/A"
+    if canal in ["/", "NA", "", "None", "NULL"]:
+        canal = "N/A"
+
+    return {
+        "folio": str(r["folio"]),
+        "cliente_principal": str(r["cliente"] or "Sin Nombre"),
+        "conteo_copropietarios": len(coprops_nombres),
+        "nombres_copropietarios": coprops_nombres,
+        "correos_copropietarios": correos,
+        "proyecto": str(r["proyecto"] or "N/A"),
+        "cluster": str(r["cluster"] or "N/A"),
+        "lote": str(r["lote"] or "N/A"),
+        "estatus_expediente": str(r["estatus"] or "Activo"),
+        "m2": float(r["m2"] or 0.0),
+        "canal_ventas": canal,
+        "asesor": str(r["asesor"] or "N/A"),
+    }
+
+
+class IndiceExpedientes:
+    """
+    Índice en memoria sobre los expedientes activos: prefijos de cada palabra (lo que se va
+    tecleando) y trigramas (tolera typos). Cada campo tiene su peso en CAMPOS_BUSQUEDA.
+    """
+
+    def __init__(self, expedientes: list):
+        self.expedientes = expedientes
+        self._prefijos = defaultdict(dict)   # prefijo -> {expediente: peso}
+        self._trigramas = defaultdict(set)   # trigrama -> {expediente}
+        for n, exp in enumerate(expedientes):
+            for campo, peso in CAMPOS_BUSQUEDA.items():
+                valores = exp[campo] if isinstance(exp[campo], list) else [exp[campo]]
+                for palabra in normalizar(" ".join(valores)).split():
+                    for k in range(1, min(len(palabra), LARGO_PREFIJO_MAX) + 1):
+                        # La palabra completa pesa más que un prefijo
+                        valor = peso if k == len(palabra) else peso * 0.8
+                        if valor > self._prefijos[palabra[:k]].get(n, 0):
+                            self._prefijos[palabra[:k]][n] = valor
+                    for t in trigramas(palabra):
+                        self._trigramas[t].add(n)
+
+    def buscar(self, q: str, limite: int = 20) -> list:
+        puntajes = defaultdict(float)
+        for palabra in normalizar(q).split():
+            por_expediente = dict(self._prefijos.get(palabra[:LARGO_PREFIJO_MAX], {}))
+            buscados = trigramas(palabra)
+            coincidencias = Counter(n for t in buscados for n in self._trigramas.get(t, ()))
+            for n, c in coincidencias.items():
+                similitud = c / len(buscados)
+                if similitud >= UMBRAL_TRIGRAMAS:
+                    por_expediente[n] = max(por_expediente.get(n, 0), similitud * PESO_TRIGRAMAS)
+            for n, puntaje in por_expediente.items():
+                puntajes[n] += puntaje
+        mejores = heapq.nlargest(limite, puntajes.items(), key=lambda x: x[1])
+        return [self.expedientes[n] for n, _ in mejores]
+
+
+class BuscadorExpedientes:
+    """
+    Expedientes activos + su índice. Se arma tras cada sync; en otras instancias
+    se nota por el cambio de generacion_datos() y se arma al primer uso.
+    """
+
+    def __init__(self):
+        self._indice = None
+        self._generacion = None
+        self._lock = threading.Lock()
+
+    def construir(self, generacion: int = None):
+        with engine.connect() as conn:
+            expedientes = [_expediente(r) for r in conn.execute(SQL_EXPEDIENTES).mappings()]
+        self._indice = IndiceExpedientes(expedientes)
+        self._generacion = generacion_datos() if generacion is None else generacion
+        logger.info(f"🔎 Índice de expedientes listo: {len(expedientes)} activos")
+
+    def indice(self) -> IndiceExpedientes:
+        generacion = generacion_datos()
+        if self._indice is None or self._generacion != generacion:
+            with self._lock:
+                if self._indice is None or self._generacion != generacion:
+                    self.construir(generacion)
+        return self._indice
+
+
+buscador_expedientes = BuscadorExpedientes()
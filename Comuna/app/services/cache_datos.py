@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se vuelve a leer la generación de MySQL (otra instancia pudo haber sincronizado)
+GENERACION_REVISION_SEGUNDOS = float(os.getenv("CACHE_GENERACION_REVISION", 15))
+
+_tabla_lista = False
+_generacion = {"valor": 0, "leida_en": 0.0}
+_generacion_lock = threading.Lock()
+
+
+def _crear_tabla():
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS sync_generacion (
+                    id TINYINT NOT NULL PRIMARY KEY,
+                    generacion BIGINT NOT NULL DEFAULT 0,
+                    actualizado_en DATETIME NOT NULL
+                )
+            """))
+            conn.execute(text("INSERT IGNORE INTO sync_generacion (id, generacion, actualizado_en) VALUES (1, 0, NOW())"))
+        _tabla_lista = True
+    except Exception as e:
+        logger.error(f"❌ No se pudo crear la tabla sync_generacion: {e}")
+
+
+def generacion_datos() -> int:
+    """
+    Número que cambia cada vez que termina una sync. Va en la llave de los caches:
+    al cambiar, todo lo cacheado con la generación anterior deja de usarse.
+    """
+    with _generacion_lock:
+        if time.monotonic() - _generacion["leida_en"] < GENERACION_REVISION_SEGUNDOS:
+            return _generacion["valor"]
+    _crear_tabla()
+    try:
+        with engine.connect() as conn:
+            valor = conn.execute(text("SELECT generacion FROM sync_generacion WHERE id = 1")).scalar() or 0
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer sync_generacion: {e}")
+        valor = _generacion["valor"]
+    with _generacion_lock:
+        _generacion.update(valor=valor, leida_en=time.monotonic())
+    return valor
+
+
+def nueva_generacion():
+    """La llama la sync al terminar: invalida los caches de todas las instancias."""
+    _crear_tabla()
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE sync_generacion SET generacion = generacion + 1, actualizado_en = NOW() WHERE id = 1"))
+            valor = conn.execute(text("SELECT generacion FROM sync_generacion WHERE id = 1")).scalar() or 0
+    except Exception as e:
+        logger.error(f"❌ No se pudo avanzar sync_generacion: {e}")
+        return
+    with _generacion_lock:
+        _generacion.update(valor=valor, leida_en=time.monotonic())
+    for cache in _caches:
+        cache.limpiar()
+    logger.info(f"🧹 Caches invalidados (generación {valor})")
+
+
+_caches = []
+
+
+class CacheRespuestas:
+    """
+    Cache en memoria con TTL y tope de entradas (LRU). La llave la arma quien llama;
+    si incluye generacion_datos(), una sync nueva la invalida sola. Con guardar=False
+    se calcula sin guardar (lecturas de la réplica, que puede ir atrasada).
+    """
+
+    def __init__(self, nombre: str, ttl: float, max_entradas: int = 256):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def obtener(self, clave, calcular, guardar: bool = True):
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._datos.get(clave)
+            if guardado and guardado[0] > ahora:
+                self._datos.move_to_end(clave)
+                return guardado[1]
+        valor = calcular()
+        if guardar:
+            self._guardar(clave, valor, ahora)
+        return valor
+
+    async def obtener_async(self, clave, calcular, guardar: bool = True):
+        """Como obtener(), para endpoints async: `calcular` regresa un awaitable."""
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._datos.get(clave)
+            if guardado and guardado[0] > ahora:
+                self._datos.move_to_end(clave)
+                return guardado[1]
+        valor = await calcular()
+        if guardar:
+            self._guardar(clave, valor, ahora)
+        return valor
+
+    def _guardar(self, clave, valor, ahora: float):
+        with self._lock:
+            self._datos[clave] = (ahora + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
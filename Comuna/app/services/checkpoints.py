@@ -0,0 +1,216 @@
+import os
+import json
+import uuid
+import logging
+from sqlalchemy import text
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_LOTE_FOLIOS = int(os.getenv("CHECKPOINT_LOTE_FOLIOS", 20))
+# Una corrida 'corriendo' sin checkpoint en este tiempo se da por abandonada (el proceso murió)
+CHECKPOINT_ABANDONO_MINUTOS = int(os.getenv("CHECKPOINT_ABANDONO_MINUTOS", 30))
+
+ENTREGADO = "ENTREGADO"
+# El proveedor siguió limitando (EnvioLimitado): no salió y se vuelve a intentar al reanudar
+LIMITADO = "LIMITADO_429"
+FOLIO_COMPLETO = "__folio__"
+
+# 'reintentable': terminó de recorrer, pero con envíos LIMITADO pendientes
+ESTADOS_REANUDABLES = ("interrumpido", "fallido", "reintentable")
+
+_tablas_listas = False
+
+
+class CorridaNoReanudable(Exception):
+    """La corrida existe pero sigue corriendo o ya terminó."""
+
+    def __init__(self, estado: str):
+        super().__init__(f"La corrida está en estado '{estado}'")
+        self.estado = estado
+
+
+def _crear_tablas():
+    global _tablas_listas
+    if _tablas_listas:
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS envios_corrida (
+                    run_id VARCHAR(32) NOT NULL PRIMARY KEY,
+                    tipo VARCHAR(30) NOT NULL,
+                    empresa_id VARCHAR(50) NOT NULL,
+                    parametros LONGTEXT,
+                    estado VARCHAR(20) NOT NULL,
+                    ultimo_folio VARCHAR(50),
+                    folios_procesados INT NOT NULL DEFAULT 0,
+                    creado_en DATETIME NOT NULL,
+                    actualizado_en DATETIME NOT NULL,
+                    INDEX idx_corrida_empresa_estado (empresa_id, estado)
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS envios_corrida_destinatario (
+                    run_id VARCHAR(32) NOT NULL,
+                    folio VARCHAR(50) NOT NULL,
+                    destinatario VARCHAR(255) NOT NULL,
+                    canal VARCHAR(10) NOT NULL,
+                    estado VARCHAR(30) NOT NULL,
+                    actualizado_en DATETIME NOT NULL,
+                    PRIMARY KEY (run_id, folio, destinatario, canal)
+                )
+            """))
+        _tablas_listas = True
+    except Exception as e:
+        logger.error(f"❌ No se pudieron crear las tablas de checkpoints: {e}")
+
+
+class CheckpointEnvio:
+    """
+    Checkpoint de una corrida de envíos (barrido o cluster).
+    Guarda en MySQL cada lote de folios: último folio procesado y el estado por destinatario/canal.
+    Al reanudar, se saltan los folios ya completos y los destinatarios ya entregados,
+    así que la recuperación solo paga lo que faltó.
+    """
+
+    def __init__(self, run_id: str, tipo: str, empresa_id: str, parametros: dict,
+                 entregados: set = None, folios_completos: set = None, folios_procesados: int = 0):
+        self.run_id = run_id
+        self.tipo = tipo
+        self.empresa_id = empresa_id
+        self.parametros = parametros
+        self._entregados = entregados or set()
+        self._folios_completos = folios_completos or set()
+        self.folios_procesados = folios_procesados
+        self.ultimo_folio = None
+        self._pendientes = []
+        self._folios_sin_guardar = 0
+        self.limitados = 0
+
+    @classmethod
+    def nueva(cls, tipo: str, empresa_id: str, parametros: dict) -> "CheckpointEnvio":
+        _crear_tablas()
+        cp = cls(uuid.uuid4().hex, tipo, empresa_id, parametros)
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO envios_corrida (run_id, tipo, empresa_id, parametros, estado, creado_en, actualizado_en)
+                VALUES (:r, :t, :e, :p, 'corriendo', NOW(), NOW())
+            """), {"r": cp.run_id, "t": tipo, "e": empresa_id,
+                   "p": json.dumps(parametros, ensure_ascii=False, default=str)})
+        return cp
+
+    @classmethod
+    def cargar(cls, run_id: str):
+        """
+        Carga una corrida previa con lo ya entregado. None si no existe.
+        La pasa a 'corriendo' solo si estaba interrumpida (o abandonada): el UPDATE condicional
+        hace que de dos reanudaciones simultáneas solo una gane; la otra recibe CorridaNoReanudable.
+        """
+        _crear_tablas()
+        with engine.begin() as conn:
+            corrida = conn.execute(
+                text("SELECT tipo, empresa_id, parametros, estado, folios_procesados FROM envios_corrida WHERE run_id = :r"),
+                {"r": run_id}
+            ).mappings().first()
+            if not corrida:
+                return None
+            tomada = conn.execute(text(f"""
+                UPDATE envios_corrida SET estado = 'corriendo', actualizado_en = NOW()
+                WHERE run_id = :r
+                  AND (estado IN ({", ".join(f"'{e}'" for e in ESTADOS_REANUDABLES)})
+                       OR (estado = 'corriendo' AND actualizado_en < NOW() - INTERVAL :min MINUTE))
+            """), {"r": run_id, "min": CHECKPOINT_ABANDONO_MINUTOS}).rowcount
+        if not tomada:
+            raise CorridaNoReanudable(corrida["estado"])
+
+        with engine.connect() as conn:
+            filas = conn.execute(text("""
+                SELECT folio, destinatario, canal FROM envios_corrida_destinatario
+                WHERE run_id = :r AND estado = :ok
+            """), {"r": run_id, "ok": ENTREGADO}).all()
+
+        entregados, completos = set(), set()
+        for folio, destinatario, canal in filas:
+            if destinatario == FOLIO_COMPLETO:
+                completos.add(folio)
+            else:
+                entregados.add((folio, destinatario, canal))
+
+        return cls(run_id, corrida["tipo"], corrida["empresa_id"], json.loads(corrida["parametros"] or "{}"),
+                   entregados, completos, corrida["folios_procesados"])
+
+    @staticmethod
+    def listar(empresa_id: str, solo_incompletas: bool = True, limite: int = 20):
+        _crear_tablas()
+        filtro = "AND estado <> 'finalizado'" if solo_incompletas else ""
+        with engine.connect() as conn:
+            filas = conn.execute(text(f"""
+                SELECT run_id, tipo, estado, ultimo_folio, folios_procesados, creado_en, actualizado_en
+                FROM envios_corrida
+                WHERE empresa_id = :e {filtro}
+                ORDER BY creado_en DESC
+                LIMIT :l
+            """), {"e": empresa_id, "l": limite}).mappings().all()
+        return [dict(f) for f in filas]
+
+    def folio_completo(self, folio) -> bool:
+        return str(folio) in self._folios_completos
+
+    def ya_entregado(self, folio, destinatario, canal: str) -> bool:
+        return (str(folio), str(destinatario), canal) in self._entregados
+
+    def marcar(self, folio, destinatario, canal: str, estado: str):
+        """Registra el estado de un destinatario/canal. Se escribe con el siguiente lote."""
+        folio, destinatario = str(folio), str(destinatario)[:255]
+        self._pendientes.append({"r": self.run_id, "f": folio, "d": destinatario, "c": canal, "s": estado})
+        if estado == ENTREGADO:
+            self._entregados.add((folio, destinatario, canal))
+        elif estado == LIMITADO:
+            self.limitados += 1
+
+    def terminar_folio(self, folio, completo: bool = True):
+        """
+        Cierra un folio. Si quedó completo (nada falló), al reanudar ni siquiera se vuelve a consultar.
+        Cada CHECKPOINT_LOTE_FOLIOS folios se guarda el checkpoint.
+        """
+        folio = str(folio)
+        if completo:
+            self.marcar(folio, FOLIO_COMPLETO, "-", ENTREGADO)
+            self._folios_completos.add(folio)
+        self.ultimo_folio = folio
+        self.folios_procesados += 1
+        self._folios_sin_guardar += 1
+        if self._folios_sin_guardar >= CHECKPOINT_LOTE_FOLIOS:
+            self.guardar()
+
+    def guardar(self, estado: str = "corriendo"):
+        pendientes, self._pendientes = self._pendientes, []
+        try:
+            with engine.begin() as conn:
+                if pendientes:
+                    conn.execute(text("""
+                        INSERT INTO envios_corrida_destinatario (run_id, folio, destinatario, canal, estado, actualizado_en)
+                        VALUES (:r, :f, :d, :c, :s, NOW())
+                        ON DUPLICATE KEY UPDATE estado = VALUES(estado), actualizado_en = NOW()
+                    """), pendientes)
+                conn.execute(text("""
+                    UPDATE envios_corrida
+                    SET estado = :s, ultimo_folio = COALESCE(:u, ultimo_folio),
+                        folios_procesados = :n, actualizado_en = NOW()
+                    WHERE run_id = :r
+                """), {"s": estado, "u": self.ultimo_folio, "n": self.folios_procesados, "r": self.run_id})
+            self._folios_sin_guardar = 0
+        except Exception as e:
+            # Se reintenta con el siguiente lote; perder un checkpoint solo implica repetir ese lote
+            self._pendientes = pendientes + self._pendientes
+            logger.error(f"❌ No se pudo guardar el checkpoint {self.run_id}: {e}")
+
+    def finalizar(self, estado: str = "finalizado"):
+        """Si quedaron envíos limitados la corrida no se da por terminada: queda 'reintentable'."""
+        if estado == "finalizado" and self.limitados:
+            estado = "reintentable"
+            logger.warning(f"🚦 Corrida {self.run_id}: {self.limitados} envío(s) limitados por el proveedor; "
+                           f"queda reintentable (reanudar con su run_id)")
+        self.guardar(estado)
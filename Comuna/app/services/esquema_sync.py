@@ -0,0 +1,171 @@
+import logging
+import pandas as pd
+from sqlalchemy.types import (
+    DECIMAL, BIGINT, DOUBLE, TEXT, VARCHAR, Float, Numeric, BigInteger, Integer, Boolean, Date, DateTime, String, Text
+)
+
+from app.models import Pago, Venta, Cartera, AntigSaldos, Amortizacion, Cliente, GestionClientes, ConfigEtapa, FlujoCaja
+
+logger = logging.getLogger(__name__)
+
+# Tabla en MySQL -> modelo que declara su esquema
+MODELOS_SYNC = {
+    "pagos": Pago,
+    "ventas": Venta,
+    "cartera_vencida": Cartera,
+    "antig_saldos": AntigSaldos,
+    "amortizaciones": Amortizacion,
+    "clientes": Cliente,
+    "flujo_caja": FlujoCaja,
+    "notificaciones_gestion_clientes": GestionClientes,
+    "config_etapas": ConfigEtapa,
+}
+
+# Tabla -> columna fecha de la que se derivan anio/mes
+COLUMNAS_ANIO_MES = {
+    "pagos": "Fecha del comprobante de pago",
+}
+
+VERDADEROS = {"1", "1.0", "true", "t", "si", "sí", "yes", "y"}
+FALSOS = {"0", "0.0", "0.0000", "false", "f", "no", "n", ""}
+
+
+def _tipo_por_nombre(col: str):
+    """Tipo adivinado por nombre, solo para columnas nuevas que aún no están en models.py."""
+    col_lower = col.lower()
+    if col_lower == 'id':
+        return BIGINT
+    if any(x in col_lower for x in ['monto', 'total', 'saldo', 'pagado', 'pagar', 'días', 'vigente']):
+        return DECIMAL(20, 4)
+    if any(x in col_lower for x in ['id', 'folio', 'folder_id', 'number']):
+        return VARCHAR(150)
+    return TEXT
+
+
+def columnas_modelo(modelo) -> dict:
+    """Nombre real de la columna en MySQL -> Column del modelo."""
+    return {c.name: c for c in modelo.__table__.columns}
+
+
+def tipo_sql(columna):
+    """Tipo con el que se crea la columna. Float va a DOUBLE (FLOAT de MySQL pierde precisión)."""
+    tipo = columna.type
+    if isinstance(tipo, Float):
+        return DOUBLE
+    if isinstance(tipo, Numeric):
+        return DECIMAL(tipo.precision or 20, tipo.scale if tipo.scale is not None else 4)
+    if isinstance(tipo, String) and not isinstance(tipo, Text) and not tipo.length:
+        return VARCHAR(255)
+    return tipo
+
+
+def _a_bool(v):
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return None
+    if isinstance(v, bool):
+        return v
+    texto = str(v).strip().lower()
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    try:
+        return float(texto) != 0
+    except ValueError:
+        return None
+
+
+def _a_llave(v):
+    """Llaves como texto limpio: 123.0 -> '123', '' -> NULL."""
+    if v is None or (isinstance(v, float) and pd.isna(v)):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    texto = str(v).strip()
+    return texto if texto not in ("", "nan", "None", "NaN", "<NA>") else None
+
+
+def _a_numero(serie: pd.Series) -> pd.Series:
+    if serie.dtype == object:
+        serie = serie.astype(str).str.replace(r"[\s,$]", "", regex=True)
+    return pd.to_numeric(serie, errors="coerce")
+
+
+def _a_fecha(serie: pd.Series) -> pd.Series:
+    """estandarizar_fechas ya deja '%Y-%m-%d'; lo que no cumpla se intenta como dd/mm/aaaa."""
+    fechas = pd.to_datetime(serie, errors="coerce", format="%Y-%m-%d")
+    faltantes = fechas.isna() & serie.notna()
+    if faltantes.any():
+        fechas[faltantes] = pd.to_datetime(serie[faltantes], errors="coerce", dayfirst=True)
+    return fechas
+
+
+def _sin_nulos_pandas(serie: pd.Series) -> pd.Series:
+    return serie.astype(object).where(serie.notna(), None)
+
+
+def _vacio(serie: pd.Series) -> pd.Series:
+    return serie.isna() | serie.astype(str).str.strip().isin(["", "nan", "None", "NaN", "<NA>"])
+
+
+def _reportar_no_convertidos(tabla: str, nombre: str, tipo, antes: pd.Series, despues: pd.Series):
+    """Valores que traían algo y quedaron NULL al convertir: se avisa cuántos y cuáles."""
+    perdidos = ~_vacio(antes) & despues.isna()
+    if not perdidos.any():
+        return
+    ejemplos = ", ".join(repr(v) for v in antes[perdidos].astype(str).unique()[:5])
+    logger.warning(f"⚠️ {tabla}.`{nombre}`: {int(perdidos.sum())} fila(s) no se pudieron convertir a {tipo} "
+                   f"y quedan NULL (p. ej. {ejemplos})")
+
+
+def coercionar(df: pd.DataFrame, modelo) -> pd.DataFrame:
+    """
+    Convierte cada columna al tipo que declara el modelo antes de escribir.
+    Lo que no se puede convertir queda NULL (p. ej. 'abc' en columnas numéricas) y se
+    registra en el log, así la tabla nunca trae valores que el ORM no sepa leer.
+    """
+    columnas = columnas_modelo(modelo)
+    for nombre in df.columns:
+        columna = columnas.get(nombre)
+        if columna is None:
+            continue
+        tipo = columna.type
+        serie = df[nombre]
+        try:
+            if isinstance(tipo, (Date, DateTime)):
+                fechas = _a_fecha(serie)
+                df[nombre] = _sin_nulos_pandas(fechas.dt.date if isinstance(tipo, Date) else fechas)
+            elif isinstance(tipo, Boolean):
+                df[nombre] = serie.map(_a_bool)
+            elif isinstance(tipo, (BigInteger, Integer)):
+                df[nombre] = _a_numero(serie).round().astype("Int64")
+            elif isinstance(tipo, (Float, Numeric)):
+                df[nombre] = _sin_nulos_pandas(_a_numero(serie))
+            elif isinstance(tipo, String) and not isinstance(tipo, Text):
+                df[nombre] = serie.map(_a_llave)
+            else:
+                df[nombre] = _sin_nulos_pandas(serie)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo convertir `{nombre}` a {tipo}: {e}")
+            continue
+        _reportar_no_convertidos(modelo.__tablename__, nombre, tipo, serie, df[nombre])
+    return df
+
+
+def agregar_anio_mes(df: pd.DataFrame, columna_fecha: str) -> pd.DataFrame:
+    """anio y mes como enteros (NULL si no hay fecha); los reportes agrupan sobre ellos."""
+    if columna_fecha not in df.columns:
+        return df
+    fechas = pd.to_datetime(df[columna_fecha], errors="coerce")
+    df["anio"] = fechas.dt.year.astype("Int64")
+    df["mes"] = fechas.dt.month.astype("Int64")
+    return df
+
+
+def dtypes_para(df: pd.DataFrame, modelo=None) -> dict:
+    """dtype para to_sql: lo declarado en el modelo y, si la columna no está declarada, el tipo por nombre."""
+    columnas = columnas_modelo(modelo) if modelo is not None else {}
+    return {
+        nombre: tipo_sql(columnas[nombre]) if nombre in columnas else _tipo_por_nombre(nombre)
+        for nombre in df.columns
+    }
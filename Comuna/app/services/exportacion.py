@@ -0,0 +1,179 @@
+import os
+import logging
+import itertools
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import inspect
+from sqlalchemy.types import Boolean, Integer, Float, Numeric, Date, DateTime
+
+from app.database import engine, conectar_lectura
+from app.services.cache_datos import generacion_datos
+from app.services.respuestas import filas_en_bloques
+
+logger = logging.getLogger(__name__)
+
+# Filas por record batch (y por row group en Parquet)
+BLOQUE_EXPORTACION = int(os.getenv("EXPORT_BLOQUE", 50000))
+COMPRESION = os.getenv("EXPORT_COMPRESION", "zstd")
+
+# Tablas replicadas que se pueden exportar -> (columna fecha para ?anio=, columna proyecto para ?proyecto=)
+TABLAS_EXPORTABLES = {
+    "pagos": ("Fecha del comprobante de pago", "Proyecto"),
+    "ventas": ("FECHA DE INICIO DE OPERACIÓN", "DESARROLLO"),
+    "cartera_vencida": ("FECHA DE PAGO", "PROYECTO"),
+    "antig_saldos": ("FECHA DE PAGO", "PROYECTO"),
+    "amortizaciones": ("date", None),
+    "clientes": ("created_at", None),
+    "flujo_caja": ("Fecha", "Proyecto"),
+}
+
+FORMATOS_EXPORTACION = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+_esquemas = {}
+
+
+def _tipo_arrow(tipo) -> pa.DataType:
+    """Tipo de la columna en MySQL -> tipo Arrow. DECIMAL conserva precisión y escala."""
+    # BOOLEAN en MySQL es TINYINT(1)
+    if isinstance(tipo, Boolean) or (isinstance(tipo, Integer) and getattr(tipo, "display_width", None) == 1):
+        return pa.bool_()
+    if isinstance(tipo, Integer):
+        return pa.int64()
+    if isinstance(tipo, Float):
+        return pa.float64()
+    if isinstance(tipo, Numeric):
+        return pa.decimal128(min(tipo.precision or 38, 38), tipo.scale or 0)
+    if isinstance(tipo, DateTime):
+        return pa.timestamp("us")
+    if isinstance(tipo, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def esquema_arrow(tabla: str) -> pa.Schema:
+    """
+    Se lee del catálogo de MySQL (incluye columnas que no están en models.py); cambia con la sync.
+    Sale de la misma fuente que las filas (conectar_lectura: réplica si responde). Lo leído de la
+    réplica no se cachea: puede ir atrás de la generación, que sale del primario.
+    """
+    generacion = generacion_datos()
+    clave = (tabla, generacion)
+    if clave in _esquemas:
+        return _esquemas[clave]
+    with conectar_lectura() as conn:
+        columnas = inspect(conn).get_columns(tabla)
+        del_primario = conn.engine is engine
+    esquema = pa.schema([pa.field(c["name"], _tipo_arrow(c["type"])) for c in columnas])
+    if del_primario:
+        for vieja in [k for k in _esquemas if k[1] != generacion]:
+            _esquemas.pop(vieja, None)
+        _esquemas[clave] = esquema
+    return esquema
+
+
+def _valor(v, tipo: pa.DataType):
+    if v is None:
+        return None
+    if pa.types.is_boolean(tipo):
+        return bool(v)
+    if pa.types.is_string(tipo) and not isinstance(v, str):
+        return v.isoformat() if isinstance(v, date) else str(v)
+    return v
+
+
+def _lote(bloque: list, esquema: pa.Schema) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays(
+        [pa.array([_valor(fila[campo.name], campo.type) for fila in bloque], type=campo.type) for campo in esquema],
+        schema=esquema
+    )
+
+
+class _Sumidero:
+    """Archivo de solo escritura en memoria que se vacía en cada bloque, para mandarlo por chunks."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def consulta_exportacion(tabla: str, esquema: pa.Schema, anio: int = None, proyecto: str = None):
+    """SELECT con las columnas del esquema y los filtros opcionales. ValueError si el filtro no aplica."""
+    col_fecha, col_proyecto = TABLAS_EXPORTABLES[tabla]
+    condiciones, params = [], {}
+    if anio:
+        condiciones.append(f"`{col_fecha}` BETWEEN :inicio AND :fin")
+        params.update(inicio=f"{anio}-01-01", fin=f"{anio}-12-31")
+    if proyecto:
+        if not col_proyecto:
+            raise ValueError(f"{tabla} no tiene columna de proyecto")
+        condiciones.append(f"`{col_proyecto}` = :proyecto")
+        params["proyecto"] = proyecto
+    sql = f"SELECT {', '.join(f'`{c}`' for c in esquema.names)} FROM {tabla}"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    return sql, params
+
+
+def lotes_exportacion(sql: str, params: dict, esquema: pa.Schema):
+    """
+    Record batches de la consulta, un bloque del cursor del servidor por batch. La consulta y el
+    primer batch se hacen aquí, antes de armar la StreamingResponse: un error de SQL o un
+    ArrowInvalid en el primer bloque sale como 500 y no como un archivo truncado con 200.
+    """
+    lotes = (_lote(bloque, esquema) for bloque in filas_en_bloques(sql, params, BLOQUE_EXPORTACION) if bloque)
+    primero = next(lotes, None)
+    return itertools.chain([] if primero is None else [primero], lotes)
+
+
+def exportar(tabla: str, formato: str, esquema: pa.Schema, lotes):
+    """
+    Genera el archivo por pedazos: cada record batch de lotes_exportacion() es un row group en
+    Parquet y se manda en cuanto está escrito. La memoria depende del bloque, no de la tabla.
+    """
+    sumidero = _Sumidero()
+    archivo = pa.PythonFile(sumidero, mode="w")
+    if formato == "parquet":
+        escritor = pq.ParquetWriter(archivo, esquema, compression=COMPRESION)
+    else:
+        escritor = pa.ipc.new_file(archivo, esquema, options=pa.ipc.IpcWriteOptions(compression=COMPRESION))
+
+    filas = 0
+    try:
+        for lote in lotes:
+            escritor.write_batch(lote)
+            filas += lote.num_rows
+            datos = sumidero.vaciar()
+            if datos:
+                yield datos
+    finally:
+        escritor.close()
+    datos = sumidero.vaciar()
+    if datos:
+        yield datos
+    logger.info(f"📦 Exportación {tabla}.{formato}: {filas} filas")
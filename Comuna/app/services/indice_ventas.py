@@ -0,0 +1,178 @@
+import os
+import re
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.cache_datos import generacion_datos
+
+logger = logging.getLogger(__name__)
+
+# Lada que se asume cuando el teléfono viene sin país (10 dígitos)
+LADA_PAIS = os.getenv("TELEFONO_LADA_PAIS", "52")
+# Máximo de ediciones (letra de más, de menos o cambiada) que se toleran al buscar un lote del OCR
+LOTE_DISTANCIA_MAX = int(os.getenv("LOTE_DISTANCIA_MAX", 1))
+
+# Confusiones típicas del OCR entre letras y dígitos
+_OCR = str.maketrans({"O": "0", "I": "1", "L": "1", "S": "5", "B": "8", "Z": "2"})
+
+SQL_VENTAS_ACTIVAS = text("""
+    SELECT
+        FOLIO AS folio,
+        CLIENTE AS cliente,
+        `NÚMERO` AS lote,
+        `TELÉFONO` AS telefono,
+        DESARROLLO AS proyecto,
+        ETAPA AS etapa,
+        `ESTADO DEL EXPEDIENTE` AS estado_expediente,
+        CLIENTE_2 AS cliente_2,
+        CLIENTE_3 AS cliente_3,
+        CLIENTE_4 AS cliente_4,
+        CLIENTE_5 AS cliente_5,
+        CLIENTE_6 AS cliente_6
+    FROM ventas
+    WHERE `ESTADO DEL EXPEDIENTE` NOT IN ('Cancelado', 'Expirado')
+    ORDER BY FOLIO
+""")
+
+
+def normalizar_lote(lote) -> str:
+    """'12 g-cm 3' -> '12GCM3': sin mayúsculas/minúsculas, espacios, guiones ni puntos."""
+    return re.sub(r"[^0-9A-Z]", "", str(lote or "").upper())
+
+
+def normalizar_telefono(telefono) -> Optional[str]:
+    """E.164: '+52 (999) 123-4567', '529991234567', '9991234567' y '5219991234567' -> '+529991234567'."""
+    digitos = re.sub(r"\D", "", str(telefono or ""))
+    if digitos.startswith("00"):
+        digitos = digitos[2:]
+    if len(digitos) == 10:
+        digitos = LADA_PAIS + digitos
+    # Prefijo 1 de celulares en México (formato anterior a 2020)
+    elif LADA_PAIS == "52" and len(digitos) == 13 and digitos.startswith("521"):
+        digitos = "52" + digitos[3:]
+    return f"+{digitos}" if 8 <= len(digitos) <= 15 else None
+
+
+def _distancia(a: str, b: str, tope: int) -> int:
+    """Levenshtein que se corta en cuanto pasa de `tope` (los lotes son cortos)."""
+    if abs(len(a) - len(b)) > tope:
+        return tope + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(actual) > tope:
+            return tope + 1
+        anterior = actual
+    return anterior[-1]
+
+
+class IndiceVentas:
+    """
+    Ventas activas por lote normalizado y por teléfono E.164, para el webhook de Respond.io.
+    Las búsquedas son de diccionario y siempre regresan los folios en el mismo orden.
+    """
+
+    def __init__(self, registros: list):
+        self._por_lote = defaultdict(list)
+        self._por_lote_ocr = defaultdict(list)
+        self._por_telefono = defaultdict(list)
+        self._lotes_por_largo = defaultdict(set)
+        for r in registros:
+            lote = normalizar_lote(r["lote"])
+            if lote:
+                self._por_lote[lote].append(r)
+                clave_ocr = lote.translate(_OCR)
+                self._por_lote_ocr[clave_ocr].append(r)
+                self._lotes_por_largo[len(clave_ocr)].add(clave_ocr)
+            telefono = normalizar_telefono(r["telefono"])
+            if telefono:
+                self._por_telefono[telefono].append(r)
+        self.total = len(registros)
+
+    def por_lote(self, lote) -> list:
+        """
+        Exacto (normalizado), luego con las confusiones del OCR resueltas y al final a
+        LOTE_DISTANCIA_MAX ediciones. Si el parecido empata entre varios lotes no se adivina: [].
+        """
+        buscado = normalizar_lote(lote)
+        if not buscado:
+            return []
+        if buscado in self._por_lote:
+            return self._por_lote[buscado]
+        clave_ocr = buscado.translate(_OCR)
+        if clave_ocr in self._por_lote_ocr:
+            return self._sin_ambiguedad(lote, self._por_lote_ocr[clave_ocr])
+
+        mejores, mejor_distancia = [], LOTE_DISTANCIA_MAX + 1
+        for largo in range(len(clave_ocr) - LOTE_DISTANCIA_MAX, len(clave_ocr) + LOTE_DISTANCIA_MAX + 1):
+            for candidato in self._lotes_por_largo.get(largo, ()):
+                d = _distancia(clave_ocr, candidato, LOTE_DISTANCIA_MAX)
+                if d < mejor_distancia:
+                    mejores, mejor_distancia = [candidato], d
+                elif d == mejor_distancia:
+                    mejores.append(candidato)
+        if len(mejores) == 1:
+            return self._sin_ambiguedad(lote, self._por_lote_ocr[mejores[0]])
+        if mejores:
+            logger.warning(f"⚠️ Lote '{lote}' ambiguo: {len(mejores)} lotes a distancia {mejor_distancia}")
+        return []
+
+    @staticmethod
+    def _sin_ambiguedad(lote, registros: list) -> list:
+        """Una clave OCR puede juntar lotes distintos (p. ej. '12O' y '120'): entonces no se elige ninguno."""
+        lotes = {normalizar_lote(r["lote"]) for r in registros}
+        if len(lotes) > 1:
+            logger.warning(f"⚠️ Lote '{lote}' ambiguo entre {sorted(lotes)}")
+            return []
+        return registros
+
+    def por_telefono(self, telefono) -> list:
+        return self._por_telefono.get(normalizar_telefono(telefono), [])
+
+    def folio_unico(self, lote, telefono=None) -> list:
+        """
+        por_lote, pero el mismo lote puede existir en varios desarrollos (varios folios).
+        Entonces se desempata con el teléfono del remitente; si aun así queda más de un folio, [].
+        """
+        registros = self.por_lote(lote)
+        if len({r["folio"] for r in registros}) <= 1:
+            return registros
+        telefono = normalizar_telefono(telefono)
+        del_remitente = [r for r in registros if telefono and normalizar_telefono(r["telefono"]) == telefono]
+        if len({r["folio"] for r in del_remitente}) == 1:
+            return del_remitente
+        logger.warning(f"⚠️ Lote '{lote}' con {len({r['folio'] for r in registros})} folios y el teléfono no desempata")
+        return []
+
+
+class BuscadorVentas:
+    """Igual que el buscador de expedientes: se arma tras la sync o al primer uso de una generación nueva."""
+
+    def __init__(self):
+        self._indice = None
+        self._generacion = None
+        self._lock = threading.Lock()
+
+    def construir(self, generacion: int = None):
+        with engine.connect() as conn:
+            registros = [dict(r) for r in conn.execute(SQL_VENTAS_ACTIVAS).mappings()]
+        self._indice = IndiceVentas(registros)
+        self._generacion = generacion_datos() if generacion is None else generacion
+        logger.info(f"📇 Índice de lotes/teléfonos listo: {len(registros)} ventas activas")
+
+    def indice(self) -> IndiceVentas:
+        generacion = generacion_datos()
+        if self._indice is None or self._generacion != generacion:
+            with self._lock:
+                if self._indice is None or self._generacion != generacion:
+                    self.construir(generacion)
+        return self._indice
+
+
+indice_ventas = BuscadorVentas()
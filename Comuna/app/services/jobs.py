@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "komunah_jobs"))
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", 2))
+# Jobs terminados (y su NDJSON) que se conservan: por antigüedad y por cantidad
+JOBS_TTL_HORAS = float(os.getenv("JOBS_TTL_HORAS", 24))
+JOBS_MAX_TERMINADOS = int(os.getenv("JOBS_MAX_TERMINADOS", 200))
+
+ESTADOS_FINALES = ("finalizado", "error")
+
+
+def clasificar_canal(valor: Optional[str]) -> Optional[str]:
+    """Traduce el resultado de un canal (email/wa) del barrido a un contador."""
+    if not valor or valor == "n/a":
+        return None
+    if valor.startswith("Status: "):
+        return "enviados" if valor[8:11] in ("200", "201", "202") else "fallidos"
+    if valor in ("GLOBAL_OFF", "NO_TEMPLATE", "LOTE_OFF"):
+        return "bloqueados"
+    return "omitidos"
+
+
+class JobEnvio:
+    """
+    Estado de un envío en segundo plano.
+    Los eventos se escriben a un archivo NDJSON (el reporte completo) y en memoria
+    solo quedan los contadores, así que la RAM no crece con el tamaño de la campaña.
+    """
+
+    def __init__(self, tipo: str, empresa_id: str, parametros: dict):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.empresa_id = empresa_id
+        self.parametros = parametros
+        self.estado = "en_cola"
+        self.contadores = {"enviados": 0, "bloqueados": 0, "omitidos": 0, "fallidos": 0}
+        self.total_eventos = 0
+        self.resumen = None
+        self.error = None
+        self.creado_en = self._ahora()
+        self.terminado_en = None
+        self.terminado_ts = None
+        self.ruta_reporte = os.path.join(JOBS_DIR, f"{self.id}.ndjson")
+        self._lock = threading.Lock()
+        open(self.ruta_reporte, "w").close()
+
+    @staticmethod
+    def _ahora():
+        return datetime.now(ZoneInfo("America/Mexico_City")).isoformat()
+
+    def registrar(self, evento: dict, *resultados: Optional[str]):
+        """Escribe un evento al reporte y suma sus resultados a los contadores."""
+        with self._lock:
+            for r in resultados:
+                if r in self.contadores:
+                    self.contadores[r] += 1
+            self.total_eventos += 1
+            linea = {"tipo": "resultado", **evento, "contadores": dict(self.contadores)}
+            with open(self.ruta_reporte, "a", encoding="utf-8") as f:
+                f.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+
+    def sumar(self, contador: str, cantidad: int):
+        """Para resultados por bloque (envíos bulk) donde no hay un evento por destinatario."""
+        with self._lock:
+            self.contadores[contador] = self.contadores.get(contador, 0) + cantidad
+
+    def _cerrar(self, estado: str, resumen: dict = None, error: str = None):
+        with self._lock:
+            self.estado = estado
+            self.resumen = resumen
+            self.error = error
+            self.terminado_en = self._ahora()
+            self.terminado_ts = time.time()
+            linea = {"tipo": "fin", "estado": estado, "resumen": resumen, "error": error,
+                     "contadores": dict(self.contadores)}
+            with open(self.ruta_reporte, "a", encoding="utf-8") as f:
+                f.write(json.dumps(linea, ensure_ascii=False, default=str) + "\n")
+
+    def a_dict(self):
+        return {
+            "job_id": self.id,
+            "tipo": self.tipo,
+            "empresa_id": self.empresa_id,
+            "estado": self.estado,
+            "contadores": dict(self.contadores),
+            "total_eventos": self.total_eventos,
+            "creado_en": self.creado_en,
+            "terminado_en": self.terminado_en,
+            "resumen": self.resumen,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """
+    Registro de jobs en memoria del proceso.
+    Un job solo es visible en la instancia que lo lanzó.
+    """
+
+    def __init__(self):
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self._jobs: Dict[str, JobEnvio] = {}
+        self._pool = ThreadPoolExecutor(max_workers=JOBS_MAX_WORKERS, thread_name_prefix="job_envio")
+        self._lock = threading.Lock()
+        self._purgar_huerfanos()
+
+    def lanzar(self, tipo: str, empresa_id: str, parametros: dict, funcion: Callable[[JobEnvio], dict]) -> JobEnvio:
+        self.purgar()
+        job = JobEnvio(tipo, empresa_id, parametros)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._ejecutar, job, funcion)
+        logger.info(f"🧵 Job {job.id} ({tipo}) en cola para {empresa_id}")
+        return job
+
+    def _ejecutar(self, job: JobEnvio, funcion: Callable[[JobEnvio], dict]):
+        job.estado = "corriendo"
+        try:
+            resultado = funcion(job) or {}
+            # El detalle ya está en el NDJSON; el resumen no lo repite
+            resumen = {k: v for k, v in resultado.items() if k not in ("reporte", "detalles")}
+            job._cerrar("finalizado", resumen=resumen)
+            logger.info(f"✅ Job {job.id} finalizado: {job.contadores}")
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} falló: {e}")
+            job._cerrar("error", error=str(e))
+
+    def obtener(self, job_id: str) -> Optional[JobEnvio]:
+        return self._jobs.get(job_id)
+
+    def purgar(self):
+        """Quita los jobs terminados hace más de JOBS_TTL_HORAS y, si sobran, los más viejos."""
+        limite = time.time() - JOBS_TTL_HORAS * 3600
+        with self._lock:
+            terminados = sorted((j for j in self._jobs.values() if j.terminado_ts), key=lambda j: j.terminado_ts)
+            sobrantes = max(len(terminados) - JOBS_MAX_TERMINADOS, 0)
+            viejos = [j for n, j in enumerate(terminados) if n < sobrantes or j.terminado_ts < limite]
+            for job in viejos:
+                self._jobs.pop(job.id, None)
+        for job in viejos:
+            self._borrar_reporte(job.ruta_reporte)
+        if viejos:
+            logger.info(f"🧹 {len(viejos)} job(s) terminados purgados")
+
+    def _purgar_huerfanos(self):
+        """Reportes de procesos anteriores (el registro en memoria ya no existe): se borran por antigüedad."""
+        limite = time.time() - JOBS_TTL_HORAS * 3600
+        for nombre in os.listdir(JOBS_DIR):
+            ruta = os.path.join(JOBS_DIR, nombre)
+            if nombre.endswith(".ndjson") and os.path.getmtime(ruta) < limite:
+                self._borrar_reporte(ruta)
+
+    @staticmethod
+    def _borrar_reporte(ruta: str):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo borrar el reporte {ruta}: {e}")
+
+    async def seguir(self, job: JobEnvio, formato: str = "ndjson"):
+        """Sigue el archivo del job y emite cada línea nueva (NDJSON o Server-Sent Events)."""
+        posicion = 0
+        while True:
+            terminado = job.estado in ESTADOS_FINALES
+            try:
+                with open(job.ruta_reporte, "rb") as f:
+                    f.seek(posicion)
+                    crudo = f.read()
+            except FileNotFoundError:
+                # El job se purgó mientras alguien lo seguía
+                break
+            # Solo líneas completas; lo que quede a medias se lee en la siguiente vuelta
+            corte = crudo.rfind(b"\n") + 1
+            posicion += corte
+            lineas = crudo[:corte].decode("utf-8").splitlines(keepends=True)
+            for linea in lineas:
+                yield f"data: {linea.rstrip()}\n\n" if formato == "sse" else linea
+            if terminado and not lineas:
+                break
+            await asyncio.sleep(0.5)
+
+
+job_manager = JobManager()
@@ -0,0 +1,94 @@
+import os
+import uuid
+import socket
+import logging
+from sqlalchemy import text
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_SEGUNDOS = int(os.getenv("SCHEDULER_LEASE_TTL", 90))
+LEASE_RENOVACION_SEGUNDOS = int(os.getenv("SCHEDULER_LEASE_RENEW", 30))
+
+
+class LeaderElector:
+    """
+    Elección de líder por renta (lease) en MySQL.
+    Una sola fila por nombre de lease: quien la tiene y hasta cuándo.
+    Si el líder muere y deja de renovar, la renta expira y otra instancia la toma.
+    """
+
+    def __init__(self, nombre: str = "scheduler_komunah", ttl: int = LEASE_TTL_SEGUNDOS):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.es_lider = False
+        self._crear_tabla()
+
+    def _crear_tabla(self):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS scheduler_lease (
+                        nombre VARCHAR(100) NOT NULL PRIMARY KEY,
+                        holder VARCHAR(255) NOT NULL,
+                        expira_en DATETIME NOT NULL
+                    )
+                """))
+        except Exception as e:
+            logger.error(f"❌ No se pudo crear la tabla scheduler_lease: {e}")
+
+    def renovar(self) -> bool:
+        """Intenta tomar o extender la renta. Devuelve True si esta instancia es líder."""
+        params = {"n": self.nombre, "h": self.holder_id, "ttl": self.ttl}
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    INSERT IGNORE INTO scheduler_lease (nombre, holder, expira_en)
+                    VALUES (:n, :h, NOW() + INTERVAL :ttl SECOND)
+                """), params)
+                # Solo se actualiza si ya somos dueños o si la renta del otro ya expiró
+                conn.execute(text("""
+                    UPDATE scheduler_lease
+                    SET holder = :h, expira_en = NOW() + INTERVAL :ttl SECOND
+                    WHERE nombre = :n AND (holder = :h OR expira_en < NOW())
+                """), params)
+                holder = conn.execute(
+                    text("SELECT holder FROM scheduler_lease WHERE nombre = :n"), params
+                ).scalar()
+        except Exception as e:
+            # Sin BD no podemos garantizar exclusividad: mejor no correr nada
+            logger.error(f"❌ Error renovando lease '{self.nombre}': {e}")
+            holder = None
+
+        nuevo_estado = holder == self.holder_id
+        if nuevo_estado != self.es_lider:
+            if nuevo_estado:
+                logger.info(f"👑 Lease '{self.nombre}' adquirido por {self.holder_id}")
+            else:
+                logger.info(f"🪑 Lease '{self.nombre}' en manos de {holder}. Esta instancia queda en espera.")
+        self.es_lider = nuevo_estado
+        return nuevo_estado
+
+    def liberar(self):
+        """Suelta la renta al apagar para que el failover sea inmediato."""
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("DELETE FROM scheduler_lease WHERE nombre = :n AND holder = :h"),
+                    {"n": self.nombre, "h": self.holder_id}
+                )
+        except Exception as e:
+            logger.error(f"❌ Error liberando lease '{self.nombre}': {e}")
+        self.es_lider = False
+
+    def solo_lider(self, tarea):
+        """Envuelve un job del scheduler para que solo lo ejecute el dueño de la renta."""
+        def _envuelta(*args, **kwargs):
+            if not self.renovar():
+                logger.info(f"⏭️  {tarea.__name__} omitida: esta instancia no es líder.")
+                return None
+            return tarea(*args, **kwargs)
+        _envuelta.__name__ = tarea.__name__
+        return _envuelta
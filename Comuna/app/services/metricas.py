@@ -0,0 +1,209 @@
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Cubetas en segundos: de una consulta rápida a un reporte/sync pesado
+CUBETAS_HTTP = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CUBETAS_EXTERNO = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 60)
+CUBETAS_SYNC = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 2400)
+
+# --- HTTP ---
+HTTP_DURACION = Histogram(
+    "comuna_http_duracion_segundos", "Latencia de las peticiones HTTP por ruta",
+    ["metodo", "ruta", "status"], buckets=CUBETAS_HTTP
+)
+HTTP_EN_CURSO = Gauge("comuna_http_en_curso", "Peticiones HTTP atendiéndose en este momento")
+
+# --- APIs externas ---
+EXTERNO_DURACION = Histogram(
+    "comuna_externo_duracion_segundos", "Latencia de las llamadas a servicios externos",
+    ["servicio"], buckets=CUBETAS_EXTERNO
+)
+EXTERNO_ERRORES = Counter(
+    "comuna_externo_errores_total", "Llamadas a servicios externos que fallaron (HTTP >= 400, timeout o conexión)",
+    ["servicio", "tipo"]
+)
+
+# --- Barrido de recordatorios ---
+BARRIDO_RESULTADOS = Counter(
+    "comuna_barrido_resultados_total", "Resultado por destinatario y canal en los barridos de recordatorios",
+    ["canal", "resultado"]
+)
+
+# --- Sync BigQuery -> MySQL ---
+SYNC_DURACION = Histogram(
+    "comuna_sync_duracion_segundos", "Duración de la sincronización completa", ["resultado"], buckets=CUBETAS_SYNC
+)
+SYNC_TABLA_DURACION = Gauge(
+    "comuna_sync_tabla_segundos", "Duración de la última sync por tabla y fase (descarga de BigQuery o escritura en MySQL)",
+    ["tabla", "fase"]
+)
+SYNC_FILAS = Gauge("comuna_sync_filas", "Filas escritas por tabla en la última sync", ["tabla"])
+SYNC_ULTIMA_EXITOSA = Gauge("comuna_sync_ultima_exitosa_timestamp", "Fin de la última sync sin errores (epoch)")
+
+# Host -> servicio (etiqueta corta y acotada; el resto cae en "otro")
+SERVICIOS_EXTERNOS = {
+    "firestore.googleapis.com": "firestore",
+    "identitytoolkit.googleapis.com": "firebase_auth",
+    "api.mailersend.com": "mailersend",
+    "api.respond.io": "respondio",
+    "bigquery.googleapis.com": "bigquery",
+    "bigquerystorage.googleapis.com": "bigquery",
+}
+
+
+def servicio_de(host: str) -> str:
+    host = (host or "").lower()
+    if host in SERVICIOS_EXTERNOS:
+        return SERVICIOS_EXTERNOS[host]
+    if host.endswith("aiplatform.googleapis.com"):
+        return "vertex_ai"
+    return "otro"
+
+
+def _tipo_error(e: Exception) -> str:
+    if isinstance(e, requests.Timeout) or isinstance(e, TimeoutError):
+        return "timeout"
+    if isinstance(e, requests.ConnectionError):
+        return "conexion"
+    return type(e).__name__
+
+
+@contextmanager
+def medir_externo(servicio: str):
+    """Para clientes que no pasan por requests (gRPC: Vertex AI, Firestore de firebase_admin)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        EXTERNO_ERRORES.labels(servicio, _tipo_error(e)).inc()
+        raise
+    finally:
+        EXTERNO_DURACION.labels(servicio).observe(time.perf_counter() - inicio)
+
+
+def instrumentar_requests():
+    """
+    Mide todas las llamadas hechas con requests (requests.get/post, Session, SDK de MailerSend
+    y el cliente REST de BigQuery) en un solo punto: Session.send.
+    """
+    if getattr(requests.Session.send, "_medido", False):
+        return
+    send_original = requests.Session.send
+
+    def send(self, request, **kwargs):
+        servicio = servicio_de(urlsplit(request.url).hostname)
+        inicio = time.perf_counter()
+        try:
+            respuesta = send_original(self, request, **kwargs)
+        except Exception as e:
+            EXTERNO_ERRORES.labels(servicio, _tipo_error(e)).inc()
+            raise
+        finally:
+            EXTERNO_DURACION.labels(servicio).observe(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            EXTERNO_ERRORES.labels(servicio, f"http_{respuesta.status_code // 100}xx").inc()
+        return respuesta
+
+    send._medido = True
+    requests.Session.send = send
+
+
+def contar_barrido(canal: str, valor):
+    """
+    Traduce el resultado de un canal del barrido ('Status: 202 | ...', 'LOTE_OFF', 'NO_TEMPLATE'...)
+    a la etiqueta del contador: enviado, error_proveedor o el código tal cual.
+    """
+    if not valor or valor == "n/a":
+        return
+    if valor.startswith("Status: "):
+        resultado = "enviado" if valor[8:11] in ("200", "201", "202") else "error_proveedor"
+    else:
+        resultado = valor
+    BARRIDO_RESULTADOS.labels(canal, resultado).inc()
+
+
+@contextmanager
+def medir_sync_tabla(tabla: str, fase: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        SYNC_TABLA_DURACION.labels(tabla, fase).set(time.perf_counter() - inicio)
+
+
+class _ColectorConexiones:
+    """Pool de SQLAlchemy y túneles SSH, leídos de estado_conexiones() en cada scrape."""
+
+    def describe(self):
+        # Sin esto el registro llamaría collect() al importar el módulo
+        return []
+
+    def collect(self):
+        from app.database import estado_conexiones
+
+        pool = GaugeMetricFamily("comuna_db_pool_conexiones", "Conexiones del pool por motor y estado", labels=["motor", "estado"])
+        esperas = GaugeMetricFamily("comuna_db_pool_espera_ms", "Espera por una conexión del pool (acumulada desde el arranque)",
+                                    labels=["motor", "medida"])
+        timeouts = GaugeMetricFamily("comuna_db_pool_timeouts", "Checkouts que agotaron DB_POOL_TIMEOUT", labels=["motor"])
+        tuneles = GaugeMetricFamily("comuna_tunel_ssh", "Túneles SSH", labels=["medida"])
+        try:
+            estado = estado_conexiones()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el estado del pool para /metrics: {e}")
+            return
+        for motor, datos in estado.items():
+            if not isinstance(datos, dict) or "tamanio" not in datos:
+                continue
+            pool.add_metric([motor, "tamanio"], datos["tamanio"])
+            pool.add_metric([motor, "en_uso"], datos["en_uso"])
+            pool.add_metric([motor, "overflow"], datos["overflow"])
+            pool.add_metric([motor, "max_overflow"], datos["max_overflow"])
+            if "checkouts" in datos:
+                esperas.add_metric([motor, "total"], datos["espera_total_ms"])
+                esperas.add_metric([motor, "max"], datos["espera_max_ms"])
+                timeouts.add_metric([motor], datos["timeouts"])
+        if estado.get("tunel_ssh"):
+            for medida in ("tuneles", "activos", "reconexiones"):
+                tuneles.add_metric([medida], estado["tunel_ssh"][medida])
+        yield from (pool, esperas, timeouts, tuneles)
+
+
+REGISTRY.register(_ColectorConexiones())
+
+
+class MedidorHTTP:
+    """Middleware ASGI: latencia por plantilla de ruta (/reportes/Juridico, no la URL con sus parámetros)."""
+
+    def __init__(self, app):
+        self.app = app
+        instrumentar_requests()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        estado = {"codigo": 500}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        HTTP_EN_CURSO.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            HTTP_EN_CURSO.dec()
+            # Sin ruta (404) se agrupa todo en una sola etiqueta
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            HTTP_DURACION.labels(scope.get("method"), ruta, str(estado["codigo"])).observe(time.perf_counter() - inicio)
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import heapq
+import random
+import logging
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+
+import orjson
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Fracción de peticiones que se perfilan (0 = apagado, 1 = todas)
+MUESTREO = float(os.getenv("SQL_PERFIL_MUESTREO", 0.1))
+# Misma forma de sentencia más de N veces en una petición = sospecha de N+1
+UMBRAL_N_MAS_1 = int(os.getenv("SQL_PERFIL_N1_UMBRAL", 10))
+# Cuántas sentencias lentas van en el log de cada petición
+LENTAS_POR_PETICION = int(os.getenv("SQL_PERFIL_LENTAS", 3))
+LARGO_SQL_LOG = 300
+
+_perfil_actual = ContextVar("perfil_sql", default=None)
+
+# Literales y parámetros fuera: dos consultas que solo cambian de folio tienen la misma forma
+_LITERALES = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=2048)
+def forma_sentencia(sql: str) -> str:
+    """'SELECT * FROM ventas WHERE FOLIO = %(f)s' -> 'SELECT * FROM ventas WHERE FOLIO = ?'."""
+    for patron, reemplazo in _LITERALES:
+        sql = patron.sub(reemplazo, sql)
+    return sql.strip()
+
+
+class PerfilSQL:
+    """Lo que ejecutó una petición: número de consultas, tiempo en MySQL, las más lentas y las repetidas."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_ms = 0.0
+        self.formas = Counter()
+        self._lentas = []   # heap (ms, forma) con las LENTAS_POR_PETICION más lentas
+        self._lock = threading.Lock()
+
+    def registrar(self, sql: str, ms: float):
+        forma = forma_sentencia(sql)
+        with self._lock:
+            self.consultas += 1
+            self.tiempo_ms += ms
+            self.formas[forma] += 1
+            if len(self._lentas) < LENTAS_POR_PETICION:
+                heapq.heappush(self._lentas, (ms, forma))
+            elif ms > self._lentas[0][0]:
+                heapq.heapreplace(self._lentas, (ms, forma))
+
+    def lentas(self) -> list:
+        return [{"ms": round(ms, 1), "sql": forma[:LARGO_SQL_LOG]} for ms, forma in sorted(self._lentas, reverse=True)]
+
+    def repetidas(self) -> list:
+        return [{"veces": n, "sql": forma[:LARGO_SQL_LOG]}
+                for forma, n in self.formas.most_common() if n > UMBRAL_N_MAS_1]
+
+
+# --- HOOKS DE SQLALCHEMY ---
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _perfil_actual.get() is not None:
+        conn.info.setdefault("perfil_inicios", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    perfil = _perfil_actual.get()
+    inicios = conn.info.get("perfil_inicios")
+    if perfil is None or not inicios:
+        return
+    perfil.registrar(statement, (time.perf_counter() - inicios.pop()) * 1000)
+
+
+def _error(contexto):
+    # Si la sentencia falló no hay after_cursor_execute: se descarta su inicio
+    conn = contexto.connection
+    if conn is not None and conn.info.get("perfil_inicios"):
+        conn.info["perfil_inicios"].pop()
+
+
+def instrumentar_motores():
+    """Engancha los hooks a todos los motores (primario, réplica y sus versiones async)."""
+    from app.database import engine, read_engine, async_engine, async_read_engine
+
+    motores = [engine, read_engine, async_engine, async_read_engine]
+    for motor in motores:
+        if motor is None:
+            continue
+        motor = getattr(motor, "sync_engine", motor)
+        if event.contains(motor, "before_cursor_execute", _antes):
+            continue
+        event.listen(motor, "before_cursor_execute", _antes)
+        event.listen(motor, "after_cursor_execute", _despues)
+        event.listen(motor, "handle_error", _error)
+
+
+# --- MIDDLEWARE ---
+
+class PerfiladorSQL:
+    """
+    Middleware ASGI: a las peticiones muestreadas les agrega X-DB-Queries y X-DB-Time-ms y deja
+    una línea de log en JSON con las consultas más lentas. Si una forma de sentencia se repite
+    más de SQL_PERFIL_N1_UMBRAL veces, la línea sale como warning (N+1).
+    En respuestas en streaming los encabezados solo cuentan lo ejecutado antes del primer byte;
+    el log sí incluye todo.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        instrumentar_motores()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or MUESTREO <= 0 or random.random() >= MUESTREO:
+            await self.app(scope, receive, send)
+            return
+
+        perfil = PerfilSQL()
+        token = _perfil_actual.set(perfil)
+        inicio = time.perf_counter()
+        estado = {"codigo": 500}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+                mensaje = {**mensaje, "headers": [
+                    *mensaje.get("headers", []),
+                    (b"x-db-queries", str(perfil.consultas).encode()),
+                    (b"x-db-time-ms", f"{perfil.tiempo_ms:.1f}".encode()),
+                ]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _perfil_actual.reset(token)
+            if perfil.consultas:
+                _registrar(perfil, scope, estado["codigo"], (time.perf_counter() - inicio) * 1000)
+
+
+def _registrar(perfil: PerfilSQL, scope: dict, codigo: int, ms: float):
+    ruta = getattr(scope.get("route"), "path", scope.get("path"))
+    repetidas = perfil.repetidas()
+    linea = orjson.dumps({
+        "metodo": scope.get("method"),
+        "ruta": ruta,
+        "status": codigo,
+        "ms": round(ms, 1),
+        "db_consultas": perfil.consultas,
+        "db_ms": round(perfil.tiempo_ms, 1),
+        "lentas": perfil.lentas(),
+        "n_mas_1": repetidas,
+    }).decode()
+    if repetidas:
+        logger.warning(f"🐢 Posible N+1 en {scope.get('method')} {ruta}: {linea}")
+    else:
+        logger.info(f"🧮 SQL por petición: {linea}")
@@ -0,0 +1,217 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Límites por defecto (peticiones por segundo, ráfaga). Se sobreescriben con
+# RATE_LIMIT_<PROVEEDOR>_RPS y RATE_LIMIT_<PROVEEDOR>_BURST.
+LIMITES_DEFAULT = {
+    "mailersend": (2.0, 5),
+    "mailersend_bulk": (2.0, 1),
+    "respondio": (5.0, 5),
+}
+
+RATE_LIMIT_MAX_REINTENTOS = int(os.getenv("RATE_LIMIT_MAX_REINTENTOS", 5))
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", 1.0))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", 60.0))
+# Tope de espera total por envío (bucket + reintentos); pasado esto el envío se regresa para reintentarlo después
+RATE_LIMIT_ESPERA_MAX = float(os.getenv("RATE_LIMIT_ESPERA_MAX", 30.0))
+# Para envíos dentro de una petición/BackgroundTask (webhook): no se detiene el threadpool de Starlette
+RATE_LIMIT_ESPERA_MAX_INTERACTIVA = float(os.getenv("RATE_LIMIT_ESPERA_MAX_INTERACTIVA", 5.0))
+
+
+class EnvioLimitado(Exception):
+    """
+    El proveedor siguió limitando (429) después de RATE_LIMIT_ESPERA_MAX: el envío no salió.
+    `respuesta` es el último 429 (o uno armado aquí si ni siquiera se intentó) para quien
+    espera un Response; `espera` es lo que falta para que el bucket vuelva a dejar salir.
+    """
+
+    def __init__(self, proveedor: str, espera: float, respuesta=None):
+        super().__init__(f"{proveedor}: limitado por el proveedor, reintentar en {espera:.0f}s")
+        self.proveedor = proveedor
+        self.espera = espera
+        self.respuesta = respuesta if getattr(respuesta, "status_code", None) == 429 else _respuesta_429(espera)
+
+
+def _respuesta_429(espera: float) -> requests.Response:
+    respuesta = requests.Response()
+    respuesta.status_code = 429
+    respuesta.headers["Retry-After"] = str(int(espera) + 1)
+    respuesta._content = b'{"message": "Limitado localmente por el rate limiter; reintentar despues"}'
+    return respuesta
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe. Además de la tasa fija, el proveedor puede frenarlo
+    (Retry-After / X-RateLimit-*) y nadie vuelve a salir hasta que pase la pausa.
+    """
+
+    def __init__(self, tasa: float, capacidad: int):
+        self.tasa = max(tasa, 0.001)
+        self.capacidad = max(capacidad, 1)
+        self._tokens = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def adquirir(self, limite: float = None) -> bool:
+        """Espera un token. Con `limite` (monotonic) regresa False en vez de esperar más allá de él."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                if ahora < self._pausa_hasta:
+                    espera = self._pausa_hasta - ahora
+                else:
+                    self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                    self._ultimo = ahora
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return True
+                    espera = (1 - self._tokens) / self.tasa
+            if limite is not None and ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def espera_restante(self) -> float:
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora < self._pausa_hasta:
+                return self._pausa_hasta - ahora
+            tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+            return max(0.0, (1 - tokens) / self.tasa)
+
+    def pausar(self, segundos: float):
+        with self._lock:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+            self._tokens = 0.0
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def obtener_bucket(proveedor: str, api_key: str = "") -> TokenBucket:
+    """Un bucket por proveedor y por API key (cada key tiene su propio límite del lado del proveedor)."""
+    huella = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    clave = (proveedor, huella)
+    with _buckets_lock:
+        bucket = _buckets.get(clave)
+        if bucket is None:
+            tasa, rafaga = LIMITES_DEFAULT.get(proveedor, (1.0, 1))
+            prefijo = f"RATE_LIMIT_{proveedor.upper()}"
+            bucket = TokenBucket(float(os.getenv(f"{prefijo}_RPS", tasa)), int(os.getenv(f"{prefijo}_BURST", rafaga)))
+            _buckets[clave] = bucket
+        return bucket
+
+
+def _header(headers, nombre: str):
+    """Lectura sin importar mayúsculas (requests ya lo hace; los SDK a veces regresan dict plano)."""
+    if not headers:
+        return None
+    valor = headers.get(nombre)
+    if valor is None:
+        nombre = nombre.lower()
+        valor = next((v for k, v in headers.items() if str(k).lower() == nombre), None)
+    return valor
+
+
+def _segundos_header(headers, nombre: str):
+    valor = _header(headers, nombre)
+    if valor is None:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        # Retry-After también puede venir como fecha HTTP
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def espera_sugerida(headers):
+    """Segundos que el proveedor pide esperar según Retry-After o X-RateLimit-*. None si no dice nada."""
+    if not headers:
+        return None
+    retry_after = _segundos_header(headers, "Retry-After")
+    if retry_after is not None:
+        return retry_after
+    restantes = _header(headers, "X-RateLimit-Remaining")
+    if restantes is not None and str(restantes).strip() == "0":
+        reset = _segundos_header(headers, "X-RateLimit-Reset")
+        if reset is not None:
+            # Algunos proveedores mandan epoch, otros segundos restantes
+            return max(reset - time.time(), 0.0) if reset > 1e9 else reset
+    return None
+
+
+def backoff_con_jitter(intento: int) -> float:
+    espera = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * (2 ** intento))
+    return espera * random.uniform(0.5, 1.5)
+
+
+def _status_y_headers(obj):
+    """Saca status y headers de una respuesta de requests, del SDK o de la excepción que lanzó."""
+    # Ojo: un Response de requests con status >= 400 es falsy, por eso el "is None"
+    respuesta = getattr(obj, "response", None)
+    if respuesta is None:
+        respuesta = obj
+    status = getattr(respuesta, "status_code", None)
+    headers = getattr(respuesta, "headers", None) or {}
+    return status, headers
+
+
+def enviar_con_limite(proveedor: str, api_key: str, enviar, espera_max: float = None):
+    """
+    Ejecuta enviar() respetando el bucket del proveedor/key.
+    Un 429 pausa el bucket (Retry-After o backoff con jitter) y el mismo envío se vuelve a formar,
+    pero el hilo nunca espera más de `espera_max` (RATE_LIMIT_ESPERA_MAX) en total: si el proveedor
+    sigue limitando, o se agotan los RATE_LIMIT_MAX_REINTENTOS, se lanza EnvioLimitado y quien llama
+    lo deja marcado para reintento (checkpoint) en vez de bloquear al worker.
+    """
+    bucket = obtener_bucket(proveedor, api_key)
+    limite = time.monotonic() + (RATE_LIMIT_ESPERA_MAX if espera_max is None else espera_max)
+    intento = 0
+    ultimo_429 = None
+    while True:
+        if not bucket.adquirir(limite):
+            espera = bucket.espera_restante()
+            logger.warning(f"🚦 {proveedor}: limitado, se agotó la espera máxima; queda para reintento en {espera:.0f}s")
+            raise EnvioLimitado(proveedor, espera, ultimo_429)
+        try:
+            resultado = enviar()
+            error = None
+        except Exception as e:
+            resultado, error = None, e
+
+        status, headers = _status_y_headers(error or resultado)
+        sugerida = espera_sugerida(headers)
+
+        if status != 429:
+            # Aunque no haya 429, si el proveedor avisa que ya no quedan cupos frenamos antes de chocar
+            if sugerida:
+                bucket.pausar(sugerida)
+            if error:
+                raise error
+            return resultado
+
+        ultimo_429 = getattr(error, "response", None) if error is not None else resultado
+        if intento >= RATE_LIMIT_MAX_REINTENTOS:
+            logger.warning(f"🚦 {proveedor}: 429 tras {intento} reintentos, queda para reintento")
+            raise EnvioLimitado(proveedor, sugerida or backoff_con_jitter(intento), ultimo_429)
+
+        espera = sugerida if sugerida is not None else backoff_con_jitter(intento)
+        espera += random.uniform(0, 0.25)
+        logger.info(f"🚦 {proveedor}: 429, reintento {intento + 1} en {espera:.1f}s")
+        bucket.pausar(espera)
+        intento += 1
@@ -0,0 +1,117 @@
+import itertools
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+from sqlalchemy import text
+from fastapi.responses import JSONResponse
+
+from app.database import conectar_lectura
+
+# numpy sin convertir y llaves no-texto (p. ej. años como int en los pivotes)
+OPCIONES_ORJSON = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _a_json(valor):
+    """Tipos que orjson no conoce, serializados igual que Pydantic en modo JSON (Decimal como texto)."""
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, np.integer):
+        return int(valor)
+    if isinstance(valor, np.floating):
+        return None if np.isnan(valor) else float(valor)
+    raise TypeError(f"{type(valor).__name__} no es serializable a JSON")
+
+
+def _a_json_numerico(valor):
+    """Como jsonable_encoder de FastAPI: Decimal a número (int si no tiene decimales)."""
+    if isinstance(valor, Decimal):
+        return int(valor) if valor.as_tuple().exponent >= 0 else float(valor)
+    return _a_json(valor)
+
+
+class RespuestaORJSON(JSONResponse):
+    """
+    Respuesta por defecto de la app (main.py): el mismo JSON que JSONResponse, serializado con orjson.
+    El contenido ya pasó por response_model/jsonable_encoder; Decimal sale como número por si acaso.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_a_json_numerico, option=OPCIONES_ORJSON)
+
+
+class RespuestaJSONRapida(RespuestaORJSON):
+    """
+    JSON ya validado: se regresa tal cual, sin pasar otra vez por response_model.
+    Para reportes cuyas filas se arman en el orden y con las llaves del schema.
+    Decimal como texto, igual que Pydantic en campos Decimal.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_a_json, option=OPCIONES_ORJSON)
+
+
+class RespuestaJSONNumerica(RespuestaORJSON):
+    """Como RespuestaJSONRapida, para schemas con campos float: Decimal sale como número."""
+
+
+def llaves_schema(modelo) -> list:
+    """Llaves de salida (alias) de un schema Pydantic, en su orden."""
+    return [campo.alias or nombre for nombre, campo in modelo.model_fields.items()]
+
+
+def _dumps(valor) -> bytes:
+    return orjson.dumps(valor, default=_a_json_numerico, option=OPCIONES_ORJSON)
+
+
+def _bloques(sql: str, params: dict, tamanio: int):
+    with conectar_lectura() as conn:
+        resultado = conn.execution_options(stream_results=True, yield_per=tamanio).execute(text(sql), params or {})
+        for bloque in resultado.mappings().partitions(tamanio):
+            yield [dict(fila) for fila in bloque]
+
+
+def filas_en_bloques(sql: str, params: dict = None, tamanio: int = 2000):
+    """
+    SELECT con cursor del lado del servidor: las filas llegan en bloques de `tamanio`
+    y nunca se tiene la tabla completa en memoria. Abre su propia conexión porque
+    el iterador sigue corriendo después de que el endpoint ya regresó (de la réplica si hay).
+    La consulta se ejecuta y el primer bloque se lee aquí mismo, antes de armar la
+    StreamingResponse: un error de SQL sale como excepción (500) y no como un 200 truncado.
+    """
+    bloques = _bloques(sql, params, tamanio)
+    primero = next(bloques, None)
+    return itertools.chain([] if primero is None else [primero], bloques)
+
+
+def stream_ndjson(bloques, procesar=None):
+    """Una fila JSON por línea; se emite bloque por bloque."""
+    for bloque in bloques:
+        if procesar:
+            bloque = [procesar(fila) for fila in bloque]
+        if bloque:
+            yield b"".join(_dumps(fila) + b"\n" for fila in bloque)
+
+
+def stream_arreglo_json(bloques, procesar=None, encabezado: dict = None, llave: str = "items"):
+    """
+    Arreglo JSON en chunks (mismo JSON que una respuesta normal, pero sin armarlo completo).
+    Con `encabezado` sale {**encabezado, llave: [...]}; sin él, el arreglo solo.
+    """
+    if encabezado is not None:
+        inicio = _dumps(encabezado)
+        yield (inicio[:-1] + b"," if len(inicio) > 2 else b"{") + _dumps(llave) + b":["
+    else:
+        yield b"["
+    primero = True
+    for bloque in bloques:
+        if procesar:
+            bloque = [procesar(fila) for fila in bloque]
+        if not bloque:
+            continue
+        yield (b"" if primero else b",") + b",".join(_dumps(fila) for fila in bloque)
+        primero = False
+    yield b"]}" if encabezado is not None else b"]"
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_BARRIDO = "barrido_automatico_diario"
+# Tiempo máximo para el primer snapshot del listener y cada cuánto se revisa que siga vivo
+LISTENER_ESPERA_SEGUNDOS = float(os.getenv("RECORDATORIOS_LISTENER_ESPERA", 60))
+LISTENER_REVISION_SEGUNDOS = float(os.getenv("RECORDATORIOS_LISTENER_REVISION", 60))
+
+_lock = threading.Lock()
+_scheduler = None
+_horario_actual = None  # (hora, minuto) con el que está programado el barrido
+
+
+def registrar_scheduler(scheduler, hora: int, minuto: int):
+    """Guarda la referencia al scheduler del proceso y el horario inicial del barrido."""
+    global _scheduler, _horario_actual
+    with _lock:
+        _scheduler = scheduler
+        _horario_actual = (int(hora), int(minuto))
+
+
+def horario_actual():
+    return _horario_actual
+
+
+def reprogramar_barrido(hora=None, minuto=None) -> bool:
+    """
+    Reprograma el cron del barrido si el horario cambió.
+    Los campos que no se manden se conservan. Devuelve True si hubo cambio.
+    """
+    global _horario_actual
+    with _lock:
+        if _scheduler is None or _horario_actual is None:
+            return False
+
+        nueva_h = int(hora) if hora is not None else _horario_actual[0]
+        nueva_m = int(minuto) if minuto is not None else _horario_actual[1]
+
+        if (nueva_h, nueva_m) == _horario_actual:
+            return False
+
+        try:
+            _scheduler.reschedule_job(JOB_ID_BARRIDO, trigger='cron', hour=nueva_h, minute=nueva_m)
+        except Exception as e:
+            logger.error(f"❌ No se pudo reprogramar el barrido: {e}")
+            return False
+
+        logger.info(f"🔄 Cron reprogramado: {_horario_actual[0]:02d}:{_horario_actual[1]:02d} -> {nueva_h:02d}:{nueva_m:02d}")
+        _horario_actual = (nueva_h, nueva_m)
+        return True
+
+
+def escuchar_config_recordatorios(empresa_id: str, al_caer=None):
+    """
+    Abre un listener de Firestore sobre empresas/{id}/configuracion/recordatorios.
+    Firestore empuja los cambios: sin tráfico mientras nadie toque el horario.
+    Devuelve el listener (para .unsubscribe()) o None si no se pudo abrir.
+    Un hilo lo vigila: si no llega el primer snapshot a tiempo, el documento no existe en
+    ese proyecto (credenciales ADC de otro proyecto) o el watch se cierra después, se
+    desuscribe y llama a `al_caer` para que el horario se siga revisando por polling.
+    """
+    try:
+        from google.cloud import firestore
+        client = firestore.Client(project=os.getenv("FIREBASE_PLANTILLAS_PROJECT_ID", "").strip() or None)
+        doc_ref = client.document(f"empresas/{empresa_id}/configuracion/recordatorios")
+    except Exception as e:
+        logger.warning(f"⚠️ Listener de Firestore no disponible: {e}")
+        return None
+
+    listener = _ListenerConfig(al_caer)
+
+    def _on_snapshot(docs, changes, read_time):
+        existentes = [doc for doc in docs if doc.exists]
+        if not existentes:
+            listener.caer(f"no existe {doc_ref.path} en el proyecto {client.project}")
+            return
+        listener.primer_snapshot.set()
+        for doc in existentes:
+            f = doc.to_dict() or {}
+            try:
+                reprogramar_barrido(
+                    int(f.get("hora_recordatorio", 10)),
+                    int(f.get("minuto_recordatorio", 0))
+                )
+            except (TypeError, ValueError) as e:
+                logger.error(f"❌ Horario inválido en Firestore: {e}")
+
+    try:
+        listener.watch = doc_ref.on_snapshot(_on_snapshot)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo abrir el listener de Firestore: {e}")
+        return None
+    listener.vigilar()
+    return listener
+
+
+class _ListenerConfig:
+    """Watch de Firestore más el hilo que lo vigila (primer snapshot a tiempo y watch vivo)."""
+
+    def __init__(self, al_caer=None):
+        self.watch = None
+        self.al_caer = al_caer
+        self.primer_snapshot = threading.Event()
+        self._fin = threading.Event()
+        self._motivo = None
+        self._detenido = False
+
+    def caer(self, motivo: str):
+        if not self._fin.is_set():
+            self._motivo = motivo
+            self._fin.set()
+
+    def unsubscribe(self):
+        """Apagado normal (shutdown): sin fallback."""
+        self._detenido = True
+        self._fin.set()
+        self._cerrar_watch()
+
+    def _cerrar_watch(self):
+        try:
+            if self.watch is not None:
+                self.watch.unsubscribe()
+        except Exception as e:
+            logger.debug(f"Watch de Firestore ya cerrado: {e}")
+
+    def vigilar(self):
+        threading.Thread(target=self._vigilar, name="vigia-listener-recordatorios", daemon=True).start()
+
+    def _vigilar(self):
+        limite = time.monotonic() + LISTENER_ESPERA_SEGUNDOS
+        while not self._fin.is_set():
+            if not getattr(self.watch, "is_active", True):
+                self.caer("el watch se cerró")
+            elif not self.primer_snapshot.is_set() and time.monotonic() > limite:
+                self.caer(f"ningún snapshot en {LISTENER_ESPERA_SEGUNDOS:.0f}s")
+            else:
+                self._fin.wait(1 if not self.primer_snapshot.is_set() else LISTENER_REVISION_SEGUNDOS)
+        if self._detenido:
+            return
+        logger.warning(f"⚠️ Listener de Firestore caído ({self._motivo}): se pasa a la revisión periódica del horario")
+        self._cerrar_watch()
+        if self.al_caer:
+            try:
+                self.al_caer()
+            except Exception as e:
+                logger.error(f"❌ No se pudo arrancar la revisión periódica del horario: {e}")
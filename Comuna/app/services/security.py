@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from firebase_admin import auth, firestore
+from app.services.metricas import medir_externo
 
 security = HTTPBearer()
 
@@ -14,7 +15,8 @@ def get_current_user(res: HTTPAuthorizationCredentials = Security(security)):
         
         # Busca el rol en Firestore
         db = firestore.client()
-        user_doc = db.collection("usuarios").document(uid).get()
+        with medir_externo("firestore"):
+            user_doc = db.collection("usuarios").document(uid).get()
         
         if not user_doc.exists:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -1,15 +1,22 @@
 import os
 import json
+import time
 import logging
 import pandas as pd
 from datetime import datetime
 from google.cloud import bigquery
 from google.oauth2 import credentials
 from sqlalchemy import create_engine, text
-from sqlalchemy.types import DECIMAL, BIGINT, DOUBLE, TEXT, VARCHAR
 
 # Importación de tus modelos
 from app.models import Pago, Venta, Cartera, AntigSaldos, Amortizacion, Cliente, GestionClientes, ConfigEtapa
+from app.services.tablas_calculadas import construir_amortizacion_saldos, construir_pagos_mensuales, construir_cartera_resumen
+from app.services.cache_datos import nueva_generacion
+from app.services.analitica import almacen
+from app.services.busqueda_expedientes import buscador_expedientes
+from app.services.indice_ventas import indice_ventas
+from app.services.metricas import SYNC_DURACION, SYNC_FILAS, SYNC_ULTIMA_EXITOSA, medir_sync_tabla
+from app.services.esquema_sync import MODELOS_SYNC, COLUMNAS_ANIO_MES, coercionar, agregar_anio_mes, dtypes_para
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +62,7 @@ class AutoSyncManager:
 
     def ejecutar_sync_total(self):
         """Sincroniza las 8 tablas procesando una por una para no reventar la RAM."""
+        inicio = time.perf_counter()
         try:
             tablas_fuente = ['ventas', 'pagos', 'antig_saldos', 'cartera_vencida', 'clientes', 'amortizaciones', 'flujo_caja']
             
@@ -69,7 +77,8 @@ class AutoSyncManager:
                 logger.info(f"📡 Descargando {t}...")
                 query = f"SELECT * FROM `{self.project_id}.{self.dataset_id}.{t}`"
                 
-                df_temp = self.estandarizar_fechas(self.client.query(query).to_dataframe())
+                with medir_sync_tabla(t, "descarga"):
+                    df_temp = self.estandarizar_fechas(self.client.query(query).to_dataframe())
                 
                 if t == 'ventas':
                     df_ventas_ref = df_temp.copy()
@@ -97,29 +106,51 @@ class AutoSyncManager:
 
             # --- OPTIMIZACIÓN FINAL (Índices idénticos al SQL) ---
             self._aplicar_indices_y_llaves()
+
+            # --- TABLAS DERIVADAS (se arman en MySQL a partir de lo ya cargado) ---
+            construir_amortizacion_saldos(self.engine)
+            construir_pagos_mensuales(self.engine)
+            construir_cartera_resumen(self.engine)
+
+            # Los caches de reportes/dashboard quedan viejos desde aquí
+            nueva_generacion()
+            try:
+                almacen.construir()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo reconstruir la copia analítica (se arma al primer uso): {e}")
+            try:
+                buscador_expedientes.construir()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo reconstruir el índice de expedientes (se arma al primer uso): {e}")
+            try:
+                indice_ventas.construir()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo reconstruir el índice de lotes/teléfonos (se arma al primer uso): {e}")
             
+            SYNC_DURACION.labels("ok").observe(time.perf_counter() - inicio)
+            SYNC_ULTIMA_EXITOSA.set_to_current_time()
             logger.info("🏁 Sincronización completa. Base de datos lista y rápida.")
 
         except Exception as e:
+            SYNC_DURACION.labels("error").observe(time.perf_counter() - inicio)
             logger.error(f"❌ Error crítico en ejecución: {e}")
 
     def _escribir_tabla_individual(self, name, df):
-        """Escribe usando el método estándar (más compatible con el túnel SSH)."""
-        dtype_map = {}
-        for col in df.columns:
-            col_lower = col.lower()
-            if col_lower == 'id':
-                dtype_map[col] = BIGINT
-            elif any(x in col_lower for x in ['monto', 'total', 'saldo', 'pagado', 'pagar', 'días', 'vigente']):
-                dtype_map[col] = DECIMAL(20, 4)
-            elif any(x in col_lower for x in ['id', 'folio', 'folder_id', 'number']):
-                dtype_map[col] = VARCHAR(150)
-            else:
-                dtype_map[col] = TEXT
+        """
+        Escribe usando el método estándar (más compatible con el túnel SSH).
+        Los tipos salen de app/models.py (DATE, DECIMAL, BOOLEAN, VARCHAR en llaves)
+        y los valores se convierten antes de subir.
+        """
+        modelo = MODELOS_SYNC.get(name)
+        if modelo is not None:
+            df = coercionar(df, modelo)
+        if name in COLUMNAS_ANIO_MES:
+            df = agregar_anio_mes(df, COLUMNAS_ANIO_MES[name])
+        dtype_map = dtypes_para(df, modelo)
 
         logger.info(f"🚀 Subiendo {len(df)} filas a `{name}`...")
         
-        with self.engine.begin() as conn:
+        with medir_sync_tabla(name, "escritura"), self.engine.begin() as conn:
             # Quitamos method='multi' porque el driver de MySQL se apendeja con tablas anchas
             df.to_sql(
                 name, 
@@ -130,6 +161,7 @@ class AutoSyncManager:
                 dtype=dtype_map
             )
             logger.info(f"   ✅ `{name}` actualizada correctamente.")
+        SYNC_FILAS.labels(name).set(len(df))
 
     def _aplicar_indices_y_llaves(self):
         """Agrega Primary Keys e Índices tal como en tu archivo SQL."""
@@ -138,12 +170,28 @@ class AutoSyncManager:
             "ALTER TABLE config_etapas MODIFY id BIGINT NOT NULL, ADD PRIMARY KEY (id);",
             "ALTER TABLE notificaciones_gestion_clientes MODIFY id BIGINT NOT NULL, ADD PRIMARY KEY (id);",
             
+            # PK autoincremental en las tablas replicadas: llave para paginar /datos/* por keyset
+            "ALTER TABLE ventas ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE pagos ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE antig_saldos ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE cartera_vencida ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE clientes ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE amortizaciones ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+            "ALTER TABLE flujo_caja ADD COLUMN fila_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY;",
+
             # 2. Índices de Relación (Los que hacen rápidas las consultas)
             "CREATE INDEX idx_ventas_folio ON ventas (FOLIO);",
             "CREATE INDEX idx_pagos_folio ON pagos (`Folio de la venta`);",
             "CREATE INDEX idx_amort_folder ON amortizaciones (folder_id);",
             "CREATE INDEX idx_gestion_folio ON notificaciones_gestion_clientes (folio);",
             "CREATE INDEX idx_antig_folio ON antig_saldos (FOLIO);",
+            "CREATE INDEX idx_antig_fecha_pago ON antig_saldos (`FECHA DE PAGO`);",
+            "CREATE INDEX idx_amort_date ON amortizaciones (date);",
+            "CREATE INDEX idx_pagos_fecha_comprobante ON pagos (`Fecha del comprobante de pago`);",
+            "CREATE INDEX idx_pagos_estatus_anio_folio ON pagos (Estatus, anio, `Folio de la venta`);",
+            "CREATE INDEX idx_pagos_anio_folio ON pagos (anio, `Folio de la venta`);",
+            "CREATE INDEX idx_ventas_fecha_inicio ON ventas (`FECHA DE INICIO DE OPERACIÓN`);",
+            "CREATE INDEX idx_etapas_etapa ON config_etapas (etapa);",
             
             # 3. Optimizar el motor de búsqueda interno
             "ANALYZE TABLE ventas, pagos, amortizaciones, notificaciones_gestion_clientes, antig_saldos, config_etapas;"
@@ -154,7 +202,11 @@ class AutoSyncManager:
                 try:
                     conn.exec_driver_sql(sql)
                 except Exception as e:
-                    logger.debug(f"Nota: {e}") # Ignorar si el índice ya existe
+                    if "fila_id" in sql and "Duplicate column" not in str(e):
+                        # Sin fila_id la paginación de /datos/* responde 500 (Unknown column) hasta la siguiente sync
+                        logger.warning(f"⚠️ No se pudo agregar fila_id: {sql} -> {e}")
+                    else:
+                        logger.debug(f"Nota: {e}") # Ignorar si el índice ya existe
 
     def _reconstruir_gestion(self, df_v, df_c, df_old):
         """
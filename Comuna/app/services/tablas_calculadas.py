@@ -0,0 +1,200 @@
+import logging
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# El "hoy" de los recortes es el de la operación, no el del servidor MySQL
+ZONA_NEGOCIO = ZoneInfo("America/Mexico_City")
+
+
+def _swap_tabla(conn, nombre: str):
+    """Cambia la tabla nueva por la vigente en un solo RENAME (nadie ve la tabla a medias)."""
+    existe = conn.execute(text("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = :t
+    """), {"t": nombre}).scalar()
+    if existe:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS `{nombre}_vieja`")
+        conn.exec_driver_sql(f"RENAME TABLE `{nombre}` TO `{nombre}_vieja`, `{nombre}_nueva` TO `{nombre}`")
+        conn.exec_driver_sql(f"DROP TABLE `{nombre}_vieja`")
+    else:
+        conn.exec_driver_sql(f"RENAME TABLE `{nombre}_nueva` TO `{nombre}`")
+
+
+def construir_amortizacion_saldos(engine, hoy: date = None):
+    """
+    Una fila por letra (folio + número de pago) con lo pagado ya sumado y su saldo.
+    primera_fecha_impaga se repite en todas las letras del folio: es la fecha de la letra
+    más antigua con saldo > 0 (NULL si está al corriente). Con eso los barridos ya no
+    necesitan el EXISTS correlacionado sobre amortizaciones x pagos.
+    is_overdue se calcula contra `hoy` (fecha en Ciudad de México, igual que cartera_resumen).
+    """
+    hoy = hoy or datetime.now(ZONA_NEGOCIO).date()
+    logger.info(f"⏳ Construyendo amortizacion_saldos para {hoy}...")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS amortizacion_saldos_nueva")
+        conn.exec_driver_sql("""
+            CREATE TABLE amortizacion_saldos_nueva (
+                folder_id VARCHAR(150) NOT NULL,
+                number VARCHAR(150) NOT NULL,
+                date DATE NULL,
+                total DECIMAL(20,4) NOT NULL DEFAULT 0,
+                pagado_sum DECIMAL(20,4) NOT NULL DEFAULT 0,
+                saldo DECIMAL(20,4) NOT NULL DEFAULT 0,
+                is_overdue TINYINT(1) NOT NULL DEFAULT 0,
+                primera_fecha_impaga DATE NULL,
+                PRIMARY KEY (folder_id, number),
+                INDEX idx_saldos_fecha_folio (date, folder_id),
+                INDEX idx_saldos_folio_fecha (folder_id, date),
+                INDEX idx_saldos_vencidas (is_overdue, folder_id)
+            )
+        """)
+        # amortizaciones puede traer la misma letra repetida (folio + número): se conserva una sola,
+        # la de fecha más antigua, y se avisa cuántas se descartaron. Sin IGNORE: si algo se cuela, truena.
+        duplicadas = conn.execute(text("""
+            SELECT COUNT(*) - COUNT(DISTINCT folder_id, number)
+            FROM amortizaciones
+            WHERE folder_id IS NOT NULL AND number IS NOT NULL
+        """)).scalar() or 0
+        if duplicadas:
+            logger.warning(f"⚠️ amortizaciones trae {duplicadas} letra(s) repetida(s) (folio + número); se conserva la más antigua")
+        conn.execute(text("""
+            INSERT INTO amortizacion_saldos_nueva (folder_id, number, date, total, pagado_sum, saldo, is_overdue)
+            SELECT
+                a.folder_id,
+                a.number,
+                a.date,
+                IFNULL(a.total, 0),
+                IFNULL(ps.pagado, 0),
+                IFNULL(a.total, 0) - IFNULL(ps.pagado, 0),
+                IFNULL(a.date < :hoy AND IFNULL(a.total, 0) > IFNULL(ps.pagado, 0), 0)
+            FROM (
+                SELECT folder_id, number, date, total,
+                       ROW_NUMBER() OVER (PARTITION BY folder_id, number ORDER BY date IS NULL, date, total DESC) AS rn
+                FROM amortizaciones
+                WHERE folder_id IS NOT NULL AND number IS NOT NULL
+            ) a
+            LEFT JOIN (
+                SELECT `Folio de la venta` AS folio, `Número de pago` AS numero, SUM(`Monto pagado`) AS pagado
+                FROM pagos
+                WHERE IFNULL(Estatus, '') != 'canceled'
+                GROUP BY `Folio de la venta`, `Número de pago`
+            ) ps ON ps.folio = a.folder_id AND ps.numero = a.number
+            WHERE a.rn = 1
+        """), {"hoy": hoy})
+        conn.exec_driver_sql("""
+            UPDATE amortizacion_saldos_nueva s
+            JOIN (
+                SELECT folder_id, MIN(date) AS primera
+                FROM amortizacion_saldos_nueva
+                WHERE saldo > 0
+                GROUP BY folder_id
+            ) x ON x.folder_id = s.folder_id
+            SET s.primera_fecha_impaga = x.primera
+        """)
+        _swap_tabla(conn, "amortizacion_saldos")
+    logger.info("   ✅ `amortizacion_saldos` actualizada correctamente.")
+
+
+def construir_pagos_mensuales(engine):
+    """
+    Cubo de pagos activos por folio x año x mes x método/concepto/banco.
+    monto_activo es lo que tiene método de pago distinto de Nota de Crédito (los pagos con
+    método NULL quedan fuera, igual que en los reportes) y monto_nc lo que sí es NC, así los
+    reportes restan o separan NC sin volver a leer pagos. estatus_flujo queda como
+    dimensión para poder filtrar solo flujo activo.
+    El tamaño depende de folios x meses con pagos, no del histórico de pagos.
+    """
+    logger.info("⏳ Construyendo pagos_mensuales...")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS pagos_mensuales_nueva")
+        conn.exec_driver_sql("""
+            CREATE TABLE pagos_mensuales_nueva (
+                id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                folio VARCHAR(150) NOT NULL,
+                cliente VARCHAR(255) NULL,
+                proyecto VARCHAR(255) NULL,
+                etapa VARCHAR(255) NULL,
+                anio SMALLINT NOT NULL,
+                mes TINYINT NOT NULL,
+                metodo_pago VARCHAR(255) NULL,
+                concepto VARCHAR(255) NULL,
+                banco VARCHAR(255) NULL,
+                estatus_flujo VARCHAR(50) NULL,
+                monto_activo DECIMAL(20,4) NOT NULL DEFAULT 0,
+                monto_nc DECIMAL(20,4) NOT NULL DEFAULT 0,
+                conteo INT NOT NULL DEFAULT 0,
+                INDEX idx_pm_anio_mes_proyecto (anio, mes, proyecto),
+                INDEX idx_pm_folio_anio (folio, anio)
+            )
+        """)
+        conn.exec_driver_sql("""
+            INSERT INTO pagos_mensuales_nueva
+                (folio, cliente, proyecto, etapa, anio, mes, metodo_pago, concepto, banco, estatus_flujo,
+                 monto_activo, monto_nc, conteo)
+            SELECT
+                p.`Folio de la venta`,
+                LEFT(p.`Cliente`, 255),
+                LEFT(p.`Proyecto`, 255),
+                LEFT(p.`Etapa`, 255),
+                p.anio,
+                p.mes,
+                LEFT(p.`Método de pago`, 255),
+                LEFT(p.`Concepto de pago`, 255),
+                LEFT(p.`Banco Caja`, 255),
+                LOWER(LEFT(p.`Estatus flujo`, 50)),
+                -- Como los reportes de siempre: sin método de pago no cuenta ni como pago ni como NC
+                SUM(CASE WHEN p.`Método de pago` != 'Nota de Crédito' THEN IFNULL(p.`Monto pagado`, 0) ELSE 0 END),
+                SUM(CASE WHEN p.`Método de pago` = 'Nota de Crédito' THEN IFNULL(p.`Monto pagado`, 0) ELSE 0 END),
+                COUNT(*)
+            FROM pagos p
+            WHERE p.`Estatus` = 'active'
+              AND p.anio IS NOT NULL
+              AND p.`Folio de la venta` IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
+        """)
+        _swap_tabla(conn, "pagos_mensuales")
+    logger.info("   ✅ `pagos_mensuales` actualizada correctamente.")
+
+
+def construir_cartera_resumen(engine, hoy: date = None):
+    """
+    Una fila por folio de cartera_vencida: la de FECHA DE PAGO más cercana a `hoy` y sus
+    parcialidades vencidas. `hoy` es la fecha en Ciudad de México (no CURDATE(), que sigue la
+    zona de MySQL); por eso además de la sync se refresca a medianoche de esa zona (main.py).
+    Antes la antigüedad de saldos hacía este ROW_NUMBER en cada petición.
+    """
+    hoy = hoy or datetime.now(ZONA_NEGOCIO).date()
+    logger.info(f"⏳ Construyendo cartera_resumen para {hoy}...")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS cartera_resumen_nueva")
+        conn.exec_driver_sql("""
+            CREATE TABLE cartera_resumen_nueva (
+                folio VARCHAR(150) NOT NULL PRIMARY KEY,
+                fecha_pago DATE NULL,
+                parcialidades_vencidas DECIMAL(20,4) NULL,
+                calculado_para DATE NOT NULL
+            )
+        """)
+        conn.execute(text("""
+            INSERT INTO cartera_resumen_nueva (folio, fecha_pago, parcialidades_vencidas, calculado_para)
+            SELECT folio, fecha_pago, parcialidades, :hoy
+            FROM (
+                SELECT
+                    FOLIO AS folio,
+                    `FECHA DE PAGO` AS fecha_pago,
+                    `NÚMERO DE PARCIALIDADES VENCIDAS TOTALES` AS parcialidades,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY FOLIO
+                        -- Sin fecha al final (en MySQL el NULL va primero en ASC)
+                        ORDER BY `FECHA DE PAGO` IS NULL, ABS(DATEDIFF(`FECHA DE PAGO`, :hoy)) ASC
+                    ) AS rank_fecha
+                FROM cartera_vencida
+                WHERE FOLIO IS NOT NULL
+            ) t
+            WHERE rank_fecha = 1
+        """), {"hoy": hoy})
+        _swap_tabla(conn, "cartera_resumen")
+    logger.info("   ✅ `cartera_resumen` actualizada correctamente.")
@@ -0,0 +1,116 @@
+import os
+import time
+import itertools
+import logging
+import threading
+from sshtunnel import SSHTunnelForwarder
+
+logger = logging.getLogger(__name__)
+
+TUNELES_PARALELOS = max(1, int(os.getenv("SSH_TUNELES", 1)))
+COMPRESION = os.getenv("SSH_COMPRESION", "false").lower() in ("1", "true", "si", "sí", "yes")
+KEEPALIVE_SEGUNDOS = float(os.getenv("SSH_KEEPALIVE", 15))
+REVISION_SEGUNDOS = float(os.getenv("SSH_REVISION", 20))
+
+
+class GestorTuneles:
+    """
+    Uno o varios túneles SSH hacia el MySQL remoto. Cada conexión nueva del pool pide
+    un puerto con puerto(): se reparten en round-robin y, si el túnel elegido está caído,
+    se levanta de nuevo antes de entregarlo. Un hilo lo revisa también en reposo.
+    El motor async usa puerto_actual(), que nunca reconecta ni espera: corre dentro del event loop.
+    """
+
+    def __init__(self, host: str, usuario: str, password: str, remoto=("127.0.0.1", 3306)):
+        self.host = host
+        self.usuario = usuario
+        self.password = password
+        self.remoto = remoto
+        self._tuneles = []
+        self._siguiente = 0
+        self._turno_async = itertools.count()
+        self._lock = threading.Lock()
+        self._monitor = None
+        self.reconexiones = 0
+        self.ultima_reconexion = None
+
+    def _nuevo(self) -> SSHTunnelForwarder:
+        tunel = SSHTunnelForwarder(
+            (self.host, 22),
+            ssh_username=self.usuario,
+            ssh_password=self.password,
+            remote_bind_address=self.remoto,
+            compression=COMPRESION,
+            set_keepalive=KEEPALIVE_SEGUNDOS,
+        )
+        tunel.start()
+        return tunel
+
+    def iniciar(self):
+        for _ in range(TUNELES_PARALELOS):
+            self._tuneles.append(self._nuevo())
+        puertos = ", ".join(str(t.local_bind_port) for t in self._tuneles)
+        print(f"✅ {len(self._tuneles)} túnel(es) SSH establecido(s) en puerto(s) local(es): {puertos}"
+              f"{' (con compresión)' if COMPRESION else ''}")
+        self._monitor = threading.Thread(target=self._vigilar, name="monitor-tunel-ssh", daemon=True)
+        self._monitor.start()
+
+    @staticmethod
+    def _vivo(tunel: SSHTunnelForwarder) -> bool:
+        try:
+            return tunel.is_active and tunel.is_alive
+        except Exception:
+            return False
+
+    def _reconectar(self, i: int):
+        viejo = self._tuneles[i]
+        try:
+            viejo.stop()
+        except Exception:
+            pass
+        self._tuneles[i] = self._nuevo()
+        self.reconexiones += 1
+        self.ultima_reconexion = time.time()
+        logger.warning(f"🔁 Túnel SSH {i} restablecido en el puerto {self._tuneles[i].local_bind_port} "
+                       f"(reconexiones: {self.reconexiones})")
+
+    def puerto(self) -> int:
+        with self._lock:
+            i = self._siguiente % len(self._tuneles)
+            self._siguiente += 1
+            if not self._vivo(self._tuneles[i]):
+                self._reconectar(i)
+            return self._tuneles[i].local_bind_port
+
+    def puerto_actual(self) -> int:
+        """
+        Puerto de un túnel vivo sin tomar el lock ni reconectar (el monitor levanta los caídos).
+        Si ninguno está vivo regresa el que toca y la conexión falla rápido en vez de bloquear el loop.
+        """
+        tuneles = list(self._tuneles)
+        i = next(self._turno_async) % len(tuneles)
+        for k in range(len(tuneles)):
+            tunel = tuneles[(i + k) % len(tuneles)]
+            if self._vivo(tunel):
+                return tunel.local_bind_port
+        return tuneles[i].local_bind_port
+
+    def _vigilar(self):
+        while True:
+            time.sleep(REVISION_SEGUNDOS)
+            with self._lock:
+                for i, tunel in enumerate(self._tuneles):
+                    if not self._vivo(tunel):
+                        try:
+                            self._reconectar(i)
+                        except Exception as e:
+                            logger.error(f"❌ No se pudo restablecer el túnel SSH {i}: {e}")
+
+    def estado(self) -> dict:
+        return {
+            "tuneles": len(self._tuneles),
+            "activos": sum(1 for t in self._tuneles if self._vivo(t)),
+            "compresion": COMPRESION,
+            "reconexiones": self.reconexiones,
+            "ultima_reconexion": self.ultima_reconexion,
+        }
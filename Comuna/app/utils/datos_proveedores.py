@@ -95,7 +95,7 @@ def get_komunah_data(folio_ref: str, db: Session):
     if p_act and hasattr(p_act, 'total') and p_act.total is not None:
         monto_val = float(p_act.total)
         p_v_hoy = db.query(Pago).filter(
-            Pago.folio_venta == int(folio_ref), 
+            Pago.folio_venta == str(folio_ref), 
             Pago.numero_pago == p_act.number,
             Pago.estatus == 'active' 
         ).first()
@@ -142,21 +142,8 @@ def get_komunah_data(folio_ref: str, db: Session):
         except:
             c_id_limpio = str(c_id_raw)
 
-        # Algunas columnas Float en la tabla clientes tienen '' en vez de NULL.
-        # SQLAlchemy nativo falla con ValueError al hacer el type-cast.
-        # Intentamos ORM primero; si falla, caemos a SQL crudo que no castea tipos.
-        try:
-            cliente_db = db.query(Cliente).filter(Cliente.client_id == c_id_limpio).first()
-        except ValueError:
-            from types import SimpleNamespace
-            row = db.execute(
-                text("SELECT * FROM clientes WHERE client_id = :id"),
-                {"id": c_id_limpio}
-            ).mappings().first()
-            if row:
-                cliente_db = SimpleNamespace(**{k: (None if v == '' else v) for k, v in dict(row).items()})
-            else:
-                cliente_db = None
+        # La sync ya escribe clientes con los tipos del modelo ('' -> NULL), el ORM lee directo
+        cliente_db = db.query(Cliente).filter(Cliente.client_id == c_id_limpio).first()
 
         if cliente_db:
             prefijo = f"c{i}." 
@@ -181,10 +168,9 @@ def get_komunah_data(folio_ref: str, db: Session):
                 if val_g is not None:
                     data[f"{{{prefijo_g}{col.key.lower()}}}"] = str(val_g)       
     hoy_dt = datetime.now(ZoneInfo("America/Mexico_City")) 
-    hoy_str = hoy_dt.strftime('%Y-%m-%d')
     from ..models import Cartera
     # Buscamos el resumen oficial en la tabla Cartera para este folio
-    cv = db.query(Cartera).filter(Cartera.folio == int(folio_ref)).first()
+    cv = db.query(Cartera).filter(Cartera.folio == str(folio_ref)).first()
 
     # Si el CRM dice que debe, jalamos sus totales; si no, es 0
     ven_meses_atraso = int(float(cv.parcialidades_vencidas or 0)) if cv else 0
@@ -200,7 +186,7 @@ def get_komunah_data(folio_ref: str, db: Session):
 
     for amt in amortizaciones:
         p_v = db.query(Pago).filter(
-            Pago.folio_venta == int(folio_ref), 
+            Pago.folio_venta == str(folio_ref), 
             Pago.numero_pago == amt.number,
             Pago.estatus == 'active' 
         ).first()
@@ -210,9 +196,9 @@ def get_komunah_data(folio_ref: str, db: Session):
         esta_pendiente = pagado < total_deberia
 
         # Buscamos la fecha de mora REAL (solo si el CRM dice que debe)
-        if amt.date < hoy_str and esta_pendiente and ven_meses_atraso > 0:
+        if amt.date and amt.date < hoy_dt.date() and esta_pendiente and ven_meses_atraso > 0:
             if not fecha_mas_antigua:
-                fecha_mas_antigua = datetime.strptime(amt.date, '%Y-%m-%d')
+                fecha_mas_antigua = datetime.combine(amt.date, datetime.min.time())
         
         # Datos para las variables del mes (cl.)
         if p_act and amt.number == p_act.number:
@@ -245,18 +231,18 @@ def get_komunah_data(folio_ref: str, db: Session):
 def get_folios_a_notificar_komunah(db: Session, fecha: str):
     """
     RECORDATORIO AMISTOSO: folios que vencen en 'fecha' sin deuda de meses anteriores.
-    CORREGIDO: usa SUM de pagos para detectar deuda real (no registro individual),
-    evitando clasificar mal a clientes que pagan en varios abonos.
+    La deuda real (SUM de abonos por letra) ya viene calculada en amortizacion_saldos:
+    sin deuda previa = su primera letra impaga no es anterior a 'fecha'.
     """
     query = text("""
-        SELECT DISTINCT a.folder_id 
-        FROM amortizaciones a
-        JOIN ventas v ON v.FOLIO = a.folder_id
+        SELECT DISTINCT s.folder_id 
+        FROM amortizacion_saldos s
+        JOIN ventas v ON v.FOLIO = s.folder_id
         JOIN config_etapas ce ON ce.etapa = v.ETAPA
-        LEFT JOIN pagos p ON a.folder_id = p.`Folio de la venta` AND a.number = p.`Número de pago`
-        WHERE a.date = :f
-        AND CAST(ce.etapa_activo AS DECIMAL(10,4)) > 0
-        AND CAST(ce.proyecto_activo AS DECIMAL(10,4)) > 0
+        LEFT JOIN pagos p ON s.folder_id = p.`Folio de la venta` AND s.number = p.`Número de pago`
+        WHERE s.date = :f
+        AND ce.etapa_activo = 1
+        AND ce.proyecto_activo = 1
         AND (IFNULL(p.`Estatus expediente`, '') != 'Liquidado')
         AND (
             p.`Folio de la venta` IS NULL
@@ -264,19 +250,8 @@ def get_folios_a_notificar_komunah(db: Session, fecha: str):
             OR p.Estatus = 'canceled'
         )
         AND v.`ESTADO DEL EXPEDIENTE` IN ('Incidencias', 'Contrato Firmado', 'Firma', 'Firma de Testigos', 'Firmado por Cliente')
-        -- EXCLUSIÓN: no tiene letras anteriores con deuda REAL (sumando todos sus abonos)
-        AND NOT EXISTS (
-            SELECT 1 FROM amortizaciones a2
-            WHERE a2.folder_id = a.folder_id
-            AND a2.date < a.date
-            AND a2.total > (
-                SELECT IFNULL(SUM(px.`Monto pagado`), 0)
-                FROM pagos px
-                WHERE px.`Folio de la venta` = a2.folder_id
-                  AND px.`Número de pago` = a2.number
-                  AND IFNULL(px.Estatus, '') != 'canceled'
-            )
-        )
+        -- EXCLUSIÓN: no tiene letras anteriores con deuda REAL
+        AND (s.primera_fecha_impaga IS NULL OR s.primera_fecha_impaga >= s.date)
     """)
     registros = db.execute(query, {"f": fecha}).fetchall()
     return [row[0] for row in registros]
@@ -284,35 +259,22 @@ def get_folios_a_notificar_komunah(db: Session, fecha: str):
 def get_folios_deudores_komunah(db: Session, fecha: str):
     """
     COBRANZA: folios que vencen en 'fecha' y YA tienen deuda real de meses anteriores.
-    CORREGIDO: usa SUM de pagos para detectar deuda real (no registro individual).
+    Usa amortizacion_saldos: su primera letra impaga es anterior a 'fecha'.
     """
     query = text("""
-        SELECT DISTINCT a.folder_id 
-        FROM amortizaciones a
-        JOIN ventas v ON v.FOLIO = a.folder_id
+        SELECT DISTINCT s.folder_id 
+        FROM amortizacion_saldos s
+        JOIN ventas v ON v.FOLIO = s.folder_id
         JOIN config_etapas ce ON ce.etapa = v.ETAPA
-        WHERE a.date = :f
-        AND CAST(ce.etapa_activo AS DECIMAL(10,4)) > 0
-        AND CAST(ce.proyecto_activo AS DECIMAL(10,4)) > 0
+        WHERE s.date = :f
+        AND ce.etapa_activo = 1
+        AND ce.proyecto_activo = 1
         AND v.`ESTADO DEL EXPEDIENTE` IN ('Incidencias', 'Contrato Firmado', 'Firma', 'Firma de Testigos', 'Firmado por Cliente')
         -- INCLUSIÓN: tiene al menos una letra anterior con deuda REAL
-        AND EXISTS (
-            SELECT 1 FROM amortizaciones a2
-            WHERE a2.folder_id = a.folder_id
-            AND a2.date < a.date
-            AND a2.total > (
-                SELECT IFNULL(SUM(px.`Monto pagado`), 0)
-                FROM pagos px
-                WHERE px.`Folio de la venta` = a2.folder_id
-                  AND px.`Número de pago` = a2.number
-                  AND IFNULL(px.Estatus, '') != 'canceled'
-            )
-        )
+        AND s.primera_fecha_impaga < s.date
     """)
     registros = db.execute(query, {"f": fecha}).fetchall()
     return [row[0] for row in registros]
-    registros = db.execute(query, {"f": fecha}).fetchall()
-    return [row[0] for row in registros]
 
 def get_komunah_diccionario_maestro(flat_data: dict = None):
     """